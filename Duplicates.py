@@ -1,43 +1,70 @@
 import os
 import time
-import cv2  
-from PIL import Image
-import imagehash
-from tkinter import filedialog, messagebox, Listbox
+from functools import partial
 from mesa import Agent, Model
-from mesa.time import RandomActivation
+from analysis import analyze_image, needs_decode
+from clustering import DuplicateClusters, keeper_rank
+from exact_duplicates import find_exact_duplicates
+from metrics import get_metrics, timed_remove
+from parallel import make_activation
+from prefetch import prefetch
+from scanner import scan_images
+from scan_journal import ScanJournal, DUPLICATE
+from stepping import SteppedModel
+import imagehash
 
-# Function to find duplicates
-def find_duplicates(image_folder):
-    hashes = {}
+# Hash-only analysis, picklable for worker processes
+hash_image = partial(analyze_image, with_blur=False)
+# Files whose hash is not cached yet, i.e. the ones worth reading ahead
+needs_hash = partial(needs_decode, with_blur=False)
+
+# Function to find duplicates; every cluster of similar images keeps its best copy.
+# max_distance is the largest Hamming distance between hashes still treated as a duplicate.
+def find_duplicates(image_folder, recursive=False, max_distance=0):
+    clusters = DuplicateClusters(max_distance)
     duplicates = []
+    # Sorted so that ties between equally good copies are broken the same way on every run
+    entries = sorted(scan_images(image_folder, recursive), key=lambda entry: entry.path)
+    # Byte-identical copies are found from file contents alone, without decoding
+    exact = find_exact_duplicates((entry.path, entry.stat().st_size) for entry in entries)
     
-    for filename in os.listdir(image_folder):
-        if filename.endswith(('jpg', 'jpeg', 'png')):
-            img_path = os.path.join(image_folder, filename)
-            with Image.open(img_path) as img:
-                hash_value = imagehash.average_hash(img)
-                
-                if hash_value in hashes:
-                    print(f'Duplicate found: {filename} is similar to {hashes[hash_value]}')
-                    duplicates.append(img_path)
-                else:
-                    hashes[hash_value] = filename
+    # Files are read ahead on background threads while the previous one is decoded
+    for item in prefetch((entry.path for entry in entries if entry.path not in exact), wanted=needs_hash):
+        if item.error is not None:
+            print(f'Unable to read {item.path}: {item.error}')
+            continue
+        try:
+            analysis = hash_image(item.path, st=item.st, data=item.data)
+        except Exception as e:
+            print(f'Unable to hash {item.path}: {e}')
+            continue
+        clusters.add(analysis.image_hash, item.path, keeper_rank(item.path, analysis))
+
+    for entry in entries:
+        img_path = entry.path
+        # Exact copies follow whatever their first copy's cluster keeps; files that could not be hashed keep themselves
+        first = exact.get(img_path, img_path)
+        keeper = clusters.keeper(first) if first in clusters else first
+        if keeper != img_path:
+            print(f'Duplicate found: {entry.name} is similar to {os.path.basename(keeper)} (kept)')
+            duplicates.append(img_path)
                 
     return duplicates
 
-# Function to remove duplicates
-def Duplicates_remover(image_folder):
+# Function to remove duplicates (pass an existing find_duplicates result to skip rescanning)
+def Duplicates_remover(image_folder, duplicates=None):
+    from tkinter import messagebox  # Imported lazily so headless callers never load tkinter
     if not os.path.exists(image_folder):
         print(f"Error: The specified folder does not exist: {image_folder}")
         return  
 
-    duplicates = find_duplicates(image_folder)
+    if duplicates is None:
+        duplicates = find_duplicates(image_folder)
     if duplicates:
         for duplicate in duplicates:
             print(f'Removing duplicate image: {duplicate}')
             try:
-                os.remove(duplicate)
+                timed_remove(duplicate)
                 print(f'Successfully removed duplicate: {duplicate}')
             except PermissionError:
                 print(f'Permission denied for {duplicate}. Unable to remove.')
@@ -48,47 +75,133 @@ def Duplicates_remover(image_folder):
 
 # Mesa Agent for processing images
 class ImageAgent(Agent):
-    def __init__(self, unique_id, model, file_path):
+    def __init__(self, unique_id, model, file_path, size=None):
         super().__init__(unique_id, model)
         self.file_path = file_path
+        self.size = size  # File size from the directory scan
         self.is_duplicate = False
+        self.hash_value = None
+        self.analysis = None  # Hash and image size, used to pick the copy to keep
+        self.restored = False  # Verdict carried over from an incremental scan
+        self.restored_duplicate = None  # Verdict last recorded in the journal, to detect changes
+        self.duplicate_of = None  # Earlier byte-identical file, found without decoding
+        self.failed = False  # The file could not be decoded, so it is never clustered
+
+    def restore(self, hash_value, is_duplicate):
+        self.hash_value = hash_value
+        self.is_duplicate = is_duplicate
+        self.restored_duplicate = is_duplicate
+        self.restored = True
+        # Unchanged files still take part in duplicate detection for new files
+        self.model.add_to_clusters(self)
+
+    def work_input(self):
+        if self.hash_value is None and not (self.restored or self.failed) and self.duplicate_of is None and self.file_path.lower().endswith(('jpg', 'jpeg', 'png')):
+            return self.file_path
+        return None
+
+    def work_done(self, result):
+        if isinstance(result, Exception):
+            print(f'Unable to hash {self.file_path}: {result}')
+            self.failed = True
+        else:
+            self.hash_value = result.image_hash
+            self.analysis = result
 
     def step(self):
+        if self.restored:
+            return
+        if self.duplicate_of is not None:
+            self.is_duplicate = True
+            self.model.duplicates.append(self.file_path)
+            return
         # Use the find_duplicates logic for each agent
-        if self.file_path.endswith(('jpg', 'jpeg', 'png')):
-            with Image.open(self.file_path) as img:
-                hash_value = imagehash.average_hash(img)
-                if hash_value in self.model.hashes:
-                    self.is_duplicate = True
-                    self.model.duplicates.append(self.file_path)
-                else:
-                    self.model.hashes[hash_value] = self.file_path
-
-# Mesa Model for duplicate management
-class ImageCleanupModel(Model):
-    def __init__(self, folder_path):
+        if self.file_path.lower().endswith(('jpg', 'jpeg', 'png')):
+            if self.hash_value is None and not self.failed:
+                try:
+                    self.analysis = hash_image(self.file_path)
+                    self.hash_value = self.analysis.image_hash
+                except Exception as e:
+                    print(f'Unable to hash {self.file_path}: {e}')
+                    self.failed = True
+            if not self.failed:
+                self.model.add_to_clusters(self)
+
+# Mesa Model for duplicate management; step() can be time-sliced and cancelled (see stepping.py)
+class ImageCleanupModel(SteppedModel, Model):
+    stage = "model.duplicates"
+
+    def __init__(self, folder_path, workers=1, recursive=False, incremental=False, max_distance=0):
         self.folder_path = folder_path
-        self.schedule = RandomActivation(self)
-        self.hashes = {}
+        self.schedule = make_activation(self, hash_image, workers, read_ahead=needs_hash)
+        self.clusters = DuplicateClusters(max_distance)  # Similar images; each cluster keeps its best copy
         self.duplicates = []
+        # Incremental runs only hash files that are new or changed since the last scan
+        self.journal = ScanJournal(folder_path, "duplicates") if incremental else None
 
-        # Create agents for each image file
-        for idx, filename in enumerate(os.listdir(folder_path)):
-            file_path = os.path.join(folder_path, filename)
-            agent = ImageAgent(idx, self, file_path)
+        # Create agents for each image file as the folder is scanned
+        seen = []
+        for idx, entry in enumerate(scan_images(folder_path, recursive)):
+            agent = ImageAgent(idx, self, entry.path, entry.stat().st_size)
             self.schedule.add(agent)
+            if self.journal:
+                seen.append(entry.path)
+                previous = self.journal.unchanged(entry.path, entry.stat())
+                if previous and previous.phash:
+                    agent.restore(imagehash.hex_to_hash(previous.phash), bool(previous.verdict & DUPLICATE))
+        if self.journal:
+            self.journal.forget_missing(seen)
 
-    def step(self):
-        self.schedule.step()
+    def find_exact_duplicates(self):
+        # Byte-identical copies skip decoding and perceptual hashing entirely
+        pending = sorted(
+            (agent for agent in self.schedule.agents if agent.work_input() is not None),
+            key=lambda agent: agent.file_path,
+        )
+        exact = find_exact_duplicates((agent.file_path, agent.size) for agent in pending)
+        for agent in pending:
+            agent.duplicate_of = exact.get(agent.file_path)
+
+    def add_to_clusters(self, agent):
+        demoted = self.clusters.add(agent.hash_value, agent, keeper_rank(agent.file_path, agent.analysis))
+        agent.is_duplicate = self.clusters.is_duplicate(agent)
+        for other in demoted:
+            other.is_duplicate = True
+            # Report the changed verdict so streaming views stay accurate
+            if self.schedule.on_agent_done:
+                self.schedule.on_agent_done(other)
+
+    def begin_step(self):
+        self.find_exact_duplicates()
+
+    def end_step(self):
+        self.duplicates = sorted(agent.file_path for agent in self.schedule.agents if agent.is_duplicate)
+        get_metrics().count("duplicate", len(self.duplicates))
+        self.checkpoint(self.schedule.agents)
+
+    def checkpoint(self, agents):
+        # Recorded hashes let an interrupted incremental scan resume without rehashing
+        if not self.journal:
+            return
+        hashes = {agent.file_path: agent.hash_value for agent in self.schedule.agents}
+        for agent in agents:
+            if agent.duplicate_of is not None:
+                agent.hash_value = hashes[agent.duplicate_of]  # Identical bytes, identical hash
+            if agent.hash_value is None or agent.is_duplicate == agent.restored_duplicate:
+                continue  # Not hashed, or verdict unchanged since it was recorded
+            self.journal.record(agent.file_path, agent.hash_value, DUPLICATE if agent.is_duplicate else 0)
+            agent.restored_duplicate = agent.is_duplicate
+        self.journal.commit()
 
 # Function to integrate Mesa with existing removal logic
-def Duplicates_remover_with_mesa(image_folder):
+def Duplicates_remover_with_mesa(image_folder, workers=1, recursive=False, incremental=False):
+    from tkinter import messagebox  # Imported lazily so headless callers never load tkinter
     if not os.path.exists(image_folder):
         messagebox.showerror("Error", f"The specified folder does not exist: {image_folder}")
         return
 
     # Create and run the model
-    model = ImageCleanupModel(image_folder)
+    model = ImageCleanupModel(image_folder, workers, recursive, incremental)
     model.step()
 
     # Remove duplicates
@@ -96,7 +209,7 @@ def Duplicates_remover_with_mesa(image_folder):
         for duplicate in model.duplicates:
             print(f'Removing duplicate: {duplicate}')
             try:
-                os.remove(duplicate)
+                timed_remove(duplicate)
             except PermissionError:
                 messagebox.showerror("Error", f"Permission denied for {duplicate}. Unable to remove.")
         messagebox.showinfo("Info", "Duplicates removed successfully!")
@@ -1,12 +1,16 @@
 import os
 import cv2
+import datetime
 import tkinter as tk
 from tkinter import filedialog, messagebox, Listbox, Scrollbar, simpledialog, Label
 import Duplicates as dupi
 import lowQuality
 from captureFace import *
 from compare_face import *
+from face_index import compare_faces_with_index
 from OldImages import *
+from jobs import BackgroundJob
+from metrics import timed_remove
 import re
 import customtkinter as ctk
 from PIL import Image, ImageTk
@@ -29,45 +33,132 @@ def toggle_dark_mode():
         frame.config(bg="#121212")
         selected_folder_label.config(bg="#121212", fg="white")
         listbox.config(bg="#1e1e1e", fg="white")
+        progress_label.config(bg="#121212", fg="white")
         scrollbar.config(bg="#121212")
     else:
         root.config(bg="white")
         frame.config(bg="white")
         selected_folder_label.config(bg="white", fg="black")
         listbox.config(bg="white", fg="black")
+        progress_label.config(bg="white", fg="black")
         scrollbar.config(bg="white")
 
+# Function to delete files from a background job; returns the number removed
+def delete_files(paths):
+    removed = 0
+    for path in paths:
+        try:
+            timed_remove(path)
+            removed += 1
+        except PermissionError:
+            print(f"Permission denied for {path}. Unable to remove.")
+        except FileNotFoundError:
+            pass
+    return removed
+
+# Seconds a job steps its model between checks for cancellation
+STEP_TIME_BUDGET = 0.25
+
+# Function to run a cleanup job in the background and stream flagged files into the listbox.
+# job(report, run) runs on a worker thread and calls report(path, flagged) for every file it checks;
+# run(model) steps the model in time slices until it finishes or the job is cancelled, and returns
+# False if it was cancelled. on_done(result) runs on the Tk main thread once the job has finished.
+def start_job(job, on_done):
+    listbox.delete(0, tk.END)
+    disable_buttons()
+    select_folder_button.config(state="disabled")
+    progress_label.config(text="Scanning...")
+    models = []
+
+    def run(model):
+        models.append(model)
+        while model.running:
+            model.step(time_budget=STEP_TIME_BUDGET)
+        return not model.cancelled
+
+    def cancel():
+        cancel_button.config(state="disabled")
+        progress_label.config(text="Cancelling...")
+        for model in models:
+            model.cancel()
+
+    cancel_button.config(state="normal", command=cancel)
+    # A file can be reported again when its verdict changes (e.g. a better copy turns up later)
+    processed = set()
+    flagged_paths = set()
+
+    def show_progress(batch):
+        for path, flagged in batch:
+            processed.add(path)
+            if flagged and path not in flagged_paths:
+                flagged_paths.add(path)
+                match = re.search(r'[^\\/]+$', path)
+                listbox.insert(tk.END, match.group(0) if match else path)
+        listbox.see(tk.END)
+        progress_label.config(text=f"Processed {len(processed)} files, {len(flagged_paths)} flagged")
+
+    def finish():
+        enable_buttons()
+        select_folder_button.config(state="normal")
+        cancel_button.config(state="disabled")
+
+    def done(result):
+        finish()
+        if any(model.cancelled for model in models):
+            progress_label.config(text=f"Cancelled after {len(processed)} files, {len(flagged_paths)} flagged")
+        else:
+            on_done(result)
+
+    def failed(error):
+        finish()
+        progress_label.config(text="Failed")
+        messagebox.showerror("Error", str(error))
+
+    BackgroundJob(
+        root, lambda emit: job(lambda path, flagged: emit((path, flagged)), run),
+        on_items=show_progress, on_done=done, on_error=failed,
+    ).start()
+
 # Function to remove duplicate images
 def remove_duplicates(folder_path):
-    listbox.delete(0, tk.END)
     if not folder_path or folder_path == "Selected Folder: None":
         messagebox.showerror("Error", "Please select a folder first.")
         return
-    duplicates = dupi.find_duplicates(folder_path)
-    for d in duplicates:
-        path = d
-        match = re.search(r'[^\\]+$', path)
-        if match:
-            listbox.insert(tk.END, match.group(0))
-    dupi.Duplicates_remover(folder_path)
-    messagebox.showinfo("Info", "Duplicate images processed.")
+
+    def job(report, run):
+        model = dupi.ImageCleanupModel(folder_path)
+        model.schedule.on_agent_done = lambda agent: report(agent.file_path, agent.is_duplicate)
+        if run(model):
+            return delete_files(model.duplicates)
+
+    def done(removed):
+        if removed:
+            messagebox.showinfo("Info", f"{removed} duplicate images removed.")
+        else:
+            messagebox.showinfo("Info", "Duplicates are not found")
+
+    start_job(job, done)
 
 # Function to remove blurry images
-def Remove_blurry_images(folder_path, threshold=100):
-    listbox.delete(0, tk.END)
+def Remove_blurry_images(folder_path, threshold=None):
     if not folder_path or folder_path == "Selected Folder: None":
         messagebox.showerror("Error", "Please select a folder first.")
         return
-    img, a = lowQuality.remove_blurry_images_with_mesa(folder_path)
-    for d in img:
-        path = d
-        match = re.search(r'[^\\]+$', path)
-        if match:
-            listbox.insert(tk.END, match.group(0))
-    if a:
-        messagebox.showinfo("Info", "Low quality images are removed successfully!")
-    else:
-        messagebox.showinfo("Info", "No low quality images")
+
+    def job(report, run):
+        # The model removes blurry images as its agents step
+        model = lowQuality.ImageCleanupModel(folder_path, threshold)
+        model.schedule.on_agent_done = lambda agent: report(agent.image_path, agent.is_blurry)
+        if run(model):
+            return len(model.get_blurry_images())
+
+    def done(removed):
+        if removed:
+            messagebox.showinfo("Info", "Low quality images are removed successfully!")
+        else:
+            messagebox.showinfo("Info", "No low quality images")
+
+    start_job(job, done)
 
 # Function to remove images before a certain time
 def remove_old_images(folder_path):
@@ -75,18 +166,33 @@ def remove_old_images(folder_path):
         messagebox.showerror("Error", "Please select a folder first.")
         return
     cutoff_time = simpledialog.askstring("Input", "Enter cutoff time (YYYY-MM-DD HH:MM:SS):")
-    if cutoff_time:
-        try:
-            delete_old_images_with_mesa(folder_path, cutoff_time)
+    if not cutoff_time:
+        return
+    try:
+        datetime.datetime.strptime(cutoff_time, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD HH:MM:SS.")
+        return
+
+    def job(report, run):
+        model = FileCleanupModel(folder_path, cutoff_time)
+        model.schedule.on_agent_done = lambda agent: report(agent.file_path, agent.to_delete)
+        if run(model):
+            return delete_files(model.old_files)
+
+    def done(removed):
+        if removed:
             messagebox.showinfo("Info", "Outdated images removed successfully!")
-        except ValueError:
-            messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD HH:MM:SS.")
+        else:
+            messagebox.showinfo("Info", "No old files found.")
+
+    start_job(job, done)
 
 # Open folder dialog and run compare function
 def select_folder_and_compare():
     folder_path = filedialog.askdirectory()
     if folder_path:
-        compare_faces_with_mesa(folder_path=folder_path, captured_image="captured_frame.jpg")
+        compare_faces_with_index("captured_frame.jpg", folder_path)
 
 # Function to manage face capture and comparison
 def face_management():
@@ -276,6 +382,20 @@ dark_mode_toggle = tk.Checkbutton(
 )
 dark_mode_toggle.pack(pady=10)
 
+# Live progress of the running cleanup job
+progress_label = tk.Label(root, text="", bg="white", fg="black")
+progress_label.pack()
+
+# Stops the running cleanup job; files already removed stay removed
+cancel_button = tk.Button(
+    root,
+    text="Cancel",
+    bg="#9E9E9E", fg="white", relief="raised",
+    activebackground="#757575",
+    state="disabled"
+)
+cancel_button.pack(pady=5)
+
 # Scrollable Listbox
 listbox_frame = tk.Frame(root)
 listbox_frame.pack(fill=tk.BOTH, expand=True)
@@ -292,4 +412,4 @@ scrollbar.config(command=listbox.yview)
 disable_buttons()
 
 # Start the GUI loop
-root.mainloop()
\ No newline at end of file
+root.mainloop()
@@ -1,60 +1,148 @@
-import cv2
-import imagehash
-from PIL import Image
 from mesa import Agent
-from datetime import datetime, timedelta
+from datetime import datetime
+import math
+from analysis import analyze_image
+from agent_store import OUTDATED, HASHED, RESTORED, JOURNALED
+from scan_journal import DUPLICATE, BLURRED
 
 class ImageAgent(Agent):
-    """An agent representing an image for cleanup analysis."""
-    def __init__(self, unique_id, model, image_path, last_modified):
+    """An agent representing an image for cleanup analysis.
+
+    The agent is a view onto row ``index`` of the model's ``AgentStore``; its
+    path, mtime, hash, blur score and verdicts all live in those columns.
+    """
+
+    def __init__(self, unique_id, model, index):
         super().__init__(unique_id, model)
-        self.image_path = image_path
-        self.last_modified = last_modified  # datetime object
-        self.is_duplicate = False
-        self.is_blurred = False
-        self.is_outdated = False
-        self.image_hash = None  # Store perceptual hash
+        self.index = index  # Row in model.store
+        self.analysis = None  # Hash, blur score and metadata from a single decode, dropped once used
+
+    def _flag(self, bit):
+        return bool(self.model.store.flags[self.index] & bit)
+
+    @property
+    def image_path(self):
+        return self.model.store.paths[self.index]
+
+    @property
+    def last_modified(self):
+        return datetime.fromtimestamp(int(self.model.store.mtimes[self.index]) / 1e9)
+
+    @property
+    def is_duplicate(self):
+        return self._flag(DUPLICATE)
+
+    @is_duplicate.setter
+    def is_duplicate(self, value):
+        self.model.store.set_flag(self.index, DUPLICATE, value)
+
+    @property
+    def is_blurred(self):
+        return self._flag(BLURRED)
+
+    @is_blurred.setter
+    def is_blurred(self, value):
+        self.model.store.set_flag(self.index, BLURRED, value)
+
+    @property
+    def is_outdated(self):
+        """Unused for over a year; set for every agent at once by the model (see ``AgentStore.mark_outdated``)."""
+        return self._flag(OUTDATED)
+
+    @property
+    def image_hash(self):
+        """Perceptual hash packed into an int, or None if not hashed yet."""
+        return int(self.model.store.hashes[self.index]) if self._flag(HASHED) else None
+
+    @image_hash.setter
+    def image_hash(self, value):
+        self.model.store.hashes[self.index] = value
+        self.model.store.set_flag(self.index, HASHED, True)
+
+    @property
+    def blur_score(self):
+        """Laplacian variance, or the model's blur metric score; None if not scored."""
+        score = float(self.model.store.blur[self.index])
+        return None if math.isnan(score) else score
+
+    @blur_score.setter
+    def blur_score(self, value):
+        self.model.store.blur[self.index] = math.nan if value is None else value
+
+    @property
+    def restored(self):
+        """Verdicts carried over from an incremental scan."""
+        return self._flag(RESTORED)
+
+    @property
+    def restored_verdict(self):
+        """Journal verdict bits of a restored agent."""
+        return int(self.model.store.restored_verdicts[self.index]) if self.restored else None
+
+    def restore(self, image_hash, is_duplicate, is_blurred):
+        """Reuse the verdicts recorded for this file by a previous scan."""
+        self.image_hash = image_hash
+        self.is_duplicate = is_duplicate
+        self.is_blurred = is_blurred
+        self.model.store.set_flag(self.index, RESTORED | JOURNALED, True)
+        self.model.store.restored_verdicts[self.index] = (DUPLICATE if is_duplicate else 0) | (BLURRED if is_blurred else 0)
+        # Still part of the hash population that new files are compared against
+        self.model.add_to_clusters(self)
+        self.is_duplicate = self.model.clusters.is_duplicate(self)
 
     def step(self):
         """Perform actions at each step."""
-        self.is_outdated = self.check_outdated()
+        if self.restored:
+            return
+        self.analyze()
         self.is_duplicate = self.check_duplicate()
         self.is_blurred = self.detect_blur()
+        self.analysis = None  # Everything still needed is in the store now
 
-    def check_outdated(self):
-        """Check if the image is outdated (unused for over a year)."""
-        try:
-            current_date = datetime.now()
-            delta = current_date - self.last_modified
-            return delta.days > 365
-        except Exception as e:
-            print(f"Error checking date for {self.image_path}: {e}. Marking as outdated.")
-            return True
+    def work_input(self):
+        """Path to analyse in a worker process, if not analysed yet."""
+        if self.analysis is None and not self.model.store.flags[self.index] & (HASHED | RESTORED):
+            return self.image_path
+        return None
 
-    def check_duplicate(self):
-        """Check if the image is a duplicate based on perceptual hash."""
-        if not self.image_hash:
+    def work_done(self, result):
+        """Receive the analysis computed by a worker process."""
+        if isinstance(result, Exception):
+            print(f"Error analysing {self.image_path}: {result}.")
+        else:
+            self._set_analysis(result)
+
+    def _set_analysis(self, analysis):
+        self.analysis = analysis
+        if self.model.blur_metric is None:
+            self.blur_score = analysis.blur
+
+    def analyze(self):
+        """Decode the image once, computing its hash and blur score together."""
+        if self.analysis is None and not self._flag(HASHED):
             try:
-                self.image_hash = imagehash.average_hash(Image.open(self.image_path))
+                self._set_analysis(analyze_image(self.image_path, with_blur=self.model.blur_metric is None))
             except Exception as e:
-                print(f"Error hashing {self.image_path}: {e}. Marking as non-duplicate.")
+                print(f"Error analysing {self.image_path}: {e}.")
+        return self.analysis
+
+    def check_duplicate(self):
+        """Check if the image is a duplicate of a better copy based on perceptual hash."""
+        if not self._flag(HASHED):
+            if self.analysis is None:
+                print(f"Error hashing {self.image_path}. Marking as non-duplicate.")
                 return False
-        
-        for agent in self.model.schedule.agents:
-            if agent != self and agent.image_hash:
-                if self.image_hash - agent.image_hash < 5:  # Similarity threshold
-                    return True
-        return False
+            self.image_hash = int(str(self.analysis.image_hash), 16)
+            # Agents join the shared clusters once, the first time they are hashed
+            self.model.add_to_clusters(self)
+
+        # Only the best image of each cluster of similar images is kept
+        return self.model.clusters.is_duplicate(self)
 
     def detect_blur(self):
-        """Detect if the image is blurred using Laplacian variance."""
-        try:
-            img = cv2.imread(self.image_path, cv2.IMREAD_GRAYSCALE)
-            if img is None:
-                print(f"Failed to load {self.image_path}. Marking as blurred.")
-                return True
-            laplacian_var = cv2.Laplacian(img, cv2.CV_64F).var()
-            return laplacian_var < 100  # Adjust threshold based on testing
-        except Exception as e:
-            print(f"Error processing {self.image_path}: {e}. Marking as blurred.")
-            return True
\ No newline at end of file
+        """Detect if the image is blurred using Laplacian variance (or the model's blur metric)."""
+        score = self.blur_score
+        if score is None:
+            print(f"Failed to load {self.image_path}. Marking as blurred.")
+            return True
+        return score < self.model.blur_threshold  # Adjust threshold based on testing
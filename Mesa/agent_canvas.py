@@ -0,0 +1,126 @@
+"""Scalable agent visualisation for the simulation GUI.
+
+Agents are laid out on a deterministic grid in scan order instead of at
+random positions.  Small populations are drawn as one oval per agent; larger
+ones are painted as cells into a single ``PhotoImage``, and when there are
+more agents than pixels several agents share a cell, which shows the most
+severe state among them (a density map).  Only cells whose colour actually
+changes are redrawn, so updates cost the same whatever the population size.
+"""
+import math
+import tkinter as tk
+
+# Agent states, in increasing order of severity
+ACTIVE, OUTDATED, BLURRED, DUPLICATE = range(4)
+STATE_COLORS = ("blue", "gray", "yellow", "red")
+MAX_SHAPES = 2000  # Larger populations are painted into an image
+MAX_CELL_SIZE = 20  # Pixels; small populations keep the familiar 20px ovals
+
+
+def agent_state(is_duplicate, is_blurred, is_outdated):
+    """The state an agent is drawn in; duplicates win over blur, blur over age."""
+    if is_duplicate:
+        return DUPLICATE
+    if is_blurred:
+        return BLURRED
+    if is_outdated:
+        return OUTDATED
+    return ACTIVE
+
+
+class AgentGridView:
+    """Draws a population of agents on a canvas and repaints only what changed."""
+
+    def __init__(self, canvas, width, height, max_shapes=MAX_SHAPES):
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.max_shapes = max_shapes
+        self.clear()
+
+    def __len__(self):
+        return len(self.states)
+
+    def clear(self):
+        """Remove every agent from the canvas."""
+        self.canvas.delete("all")
+        self.positions = {}  # Agent unique_id -> grid index
+        self.states = bytearray()
+        self.shapes = []  # Oval per agent in shape mode
+        self.image = None  # PhotoImage in image mode
+        self.cell_colors = []
+        self.per_cell = 1
+        self.columns = 1
+        self.cell_size = 1
+
+    def reset(self, agent_ids):
+        """Lay out ``agent_ids`` in grid order, all in the active state."""
+        self.clear()
+        agent_ids = list(agent_ids)
+        self.positions = {unique_id: i for i, unique_id in enumerate(agent_ids)}
+        self.states = bytearray(len(agent_ids))
+        if not agent_ids:
+            return
+
+        # Share cells once there are more agents than pixels
+        self.per_cell = max(1, math.ceil(len(agent_ids) / (self.width * self.height)))
+        while True:
+            cells = math.ceil(len(agent_ids) / self.per_cell)
+            self.columns = max(1, min(cells, self.width, math.ceil(math.sqrt(cells * self.width / self.height))))
+            rows = math.ceil(cells / self.columns)
+            if rows <= self.height:
+                break
+            self.per_cell += 1
+        self.cell_size = max(1, min(MAX_CELL_SIZE, int(min(self.width / self.columns, self.height / rows))))
+
+        if len(agent_ids) <= self.max_shapes:
+            margin = max(1, self.cell_size // 8)
+            for i in range(len(agent_ids)):
+                x, y = self._cell_origin(i)
+                self.shapes.append(self.canvas.create_oval(
+                    x + margin, y + margin, x + self.cell_size - margin, y + self.cell_size - margin,
+                    fill=STATE_COLORS[ACTIVE], outline="black"
+                ))
+            return
+
+        self.image = tk.PhotoImage(width=self.width, height=self.height)
+        self.image.put("white", to=(0, 0, self.width, self.height))
+        # Paint whole rows at once, then the partial last row
+        full_rows = cells // self.columns
+        if full_rows:
+            self.image.put(
+                STATE_COLORS[ACTIVE],
+                to=(0, 0, self.columns * self.cell_size, full_rows * self.cell_size)
+            )
+        if rows > full_rows:
+            self.image.put(
+                STATE_COLORS[ACTIVE],
+                to=(0, full_rows * self.cell_size,
+                    (cells % self.columns) * self.cell_size, rows * self.cell_size)
+            )
+        self.cell_colors = [ACTIVE] * cells
+        self.canvas.create_image(0, 0, image=self.image, anchor="nw")
+
+    def update(self, changes):
+        """Apply ``(unique_id, state)`` changes, repainting only cells that change colour."""
+        dirty = set()
+        for unique_id, state in changes:
+            i = self.positions.get(unique_id)
+            if i is None or self.states[i] == state:
+                continue
+            self.states[i] = state
+            if self.shapes:
+                self.canvas.itemconfig(self.shapes[i], fill=STATE_COLORS[state])
+            else:
+                dirty.add(i // self.per_cell)
+
+        for cell in dirty:
+            start = cell * self.per_cell
+            state = max(self.states[start:start + self.per_cell])
+            if state != self.cell_colors[cell]:
+                self.cell_colors[cell] = state
+                x, y = self._cell_origin(cell)
+                self.image.put(STATE_COLORS[state], to=(x, y, x + self.cell_size, y + self.cell_size))
+
+    def _cell_origin(self, cell):
+        return (cell % self.columns) * self.cell_size, (cell // self.columns) * self.cell_size
@@ -0,0 +1,117 @@
+"""Columnar per-image state for the simulation model.
+
+With millions of images, one instance dict per agent (path, datetime, three
+booleans, an ``ImageHash`` object) plus a DataFrame rebuilt from them every
+step dominate memory.  ``AgentStore`` keeps that state in a single NumPy
+structured array instead, one row per image:
+
+``hash``
+    The 64-bit perceptual hash packed into a uint64 (valid once ``HASHED`` is set).
+``mtime``
+    Modification time in nanoseconds (int64).
+``blur``
+    Blur score, NaN until scored (float64, so verdicts right at the
+    threshold match the scores the analysis cache returns).
+``flags``
+    Bitfield of verdicts (``DUPLICATE``, ``BLURRED``, ``OUTDATED``, the same
+    bits as the scan journal and the result table) and state bits.
+``restored_verdict``
+    Verdict bits last recorded in the scan journal (valid once ``JOURNALED`` is set).
+
+Paths are kept in a parallel list.  Agents only hold their row index (plus
+the analysis in flight), and reporting, the GUI and deletion read whole columns.
+"""
+import numpy as np
+from scan_journal import DUPLICATE, BLURRED
+
+OUTDATED = 4
+VERDICTS = DUPLICATE | BLURRED | OUTDATED
+HASHED = 8  # ``hash`` holds a perceptual hash
+RESTORED = 16  # Verdicts carried over from an incremental scan
+JOURNALED = 32  # ``restored_verdict`` holds the verdict recorded in the journal
+OUTDATED_DAYS = 365  # Images unmodified for longer than this are outdated
+
+STATE_DTYPE = np.dtype([
+    ("hash", np.uint64),
+    ("mtime", np.int64),
+    ("blur", np.float64),
+    ("flags", np.uint8),
+    ("restored_verdict", np.uint8),
+])
+
+
+def hash_to_hex(value):
+    """Hex form of a packed hash, as ``str(ImageHash)`` gives it for 8x8 hashes."""
+    return f"{int(value):016x}"
+
+
+class AgentStore:
+    """Growable structured array of per-image state plus the image paths."""
+
+    def __init__(self, capacity=1024):
+        self.paths = []
+        self.data = np.zeros(max(1, capacity), dtype=STATE_DTYPE)
+        self._bind_columns()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _bind_columns(self):
+        # Field views are cached so per-agent access does not build a new view every time
+        self.hashes = self.data["hash"]
+        self.mtimes = self.data["mtime"]
+        self.blur = self.data["blur"]
+        self.flags = self.data["flags"]
+        self.restored_verdicts = self.data["restored_verdict"]
+
+    def add(self, path, mtime_ns):
+        """Append a row for ``path`` and return its index."""
+        index = len(self.paths)
+        if index == len(self.data):
+            grown = np.zeros(2 * len(self.data), dtype=STATE_DTYPE)
+            grown[:index] = self.data
+            self.data = grown
+            self._bind_columns()
+        self.paths.append(path)
+        self.data[index] = (0, mtime_ns, np.nan, 0, 0)
+        return index
+
+    def column(self, name):
+        """View of column ``name`` covering only the rows in use."""
+        return self.data[name][:len(self.paths)]
+
+    def set_flag(self, index, bit, value):
+        if value:
+            self.flags[index] |= bit
+        else:
+            self.flags[index] &= ~bit & 0xFF
+
+    def mark_outdated(self, now_ns, days=OUTDATED_DAYS):
+        """Set ``OUTDATED`` on every image not modified in more than ``days`` whole days."""
+        flags = self.column("flags")
+        # ``timedelta.days > days`` means at least ``days + 1`` whole days have passed
+        old = self.column("mtime") <= now_ns - (days + 1) * 86_400 * 10**9
+        flags &= ~OUTDATED & 0xFF
+        flags[old] |= OUTDATED
+
+    def verdicts(self):
+        """Verdict bits of every row, in the result table's flag format."""
+        return self.column("flags") & VERDICTS
+
+    def flagged(self, mask=VERDICTS):
+        """Row indices with any of the ``mask`` bits set."""
+        return np.flatnonzero(self.column("flags") & mask)
+
+    def flagged_paths(self, mask=VERDICTS):
+        return [self.paths[index] for index in self.flagged(mask)]
+
+    def counts(self):
+        """Number of images in total, per verdict and with any verdict."""
+        flags = self.column("flags")
+        return {
+            "images": len(self.paths),
+            "duplicate": int(np.count_nonzero(flags & DUPLICATE)),
+            "blurred": int(np.count_nonzero(flags & BLURRED)),
+            "outdated": int(np.count_nonzero(flags & OUTDATED)),
+            "flagged": int(np.count_nonzero(flags & VERDICTS)),
+        }
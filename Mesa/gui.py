@@ -1,14 +1,16 @@
 import customtkinter as ctk
-import threading
-import random
-import os
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox
 from model import SmartImageCleanupModel
-import pandas as pd
+from result_table import VirtualResultTable, result_flags
+from agent_canvas import AgentGridView, agent_state
+from jobs import BackgroundJob
+from metrics import get_metrics, timed_remove
 import tkinter as tk
 
 class SmartImageCleanupGUI:
     """GUI for the Smart Image Cleanup Tool using MESA simulation."""
+    STEP_TIME_BUDGET = 0.25  # Seconds the model steps between checks for cancellation
+
     def __init__(self, root, model=None, folder_path=None):
         self.root = root
         self.model = model  # Model passed from main.py or None
@@ -45,6 +47,7 @@ class SmartImageCleanupGUI:
         # Canvas for agent visualization
         self.canvas = ctk.CTkCanvas(self.main_frame, width=700, height=400, bg="white")
         self.canvas.pack(pady=10)
+        self.agent_view = AgentGridView(self.canvas, 700, 400)
 
         # Legend
         self.legend_frame = ctk.CTkFrame(self.main_frame, corner_radius=5)
@@ -78,36 +81,34 @@ class SmartImageCleanupGUI:
             self.control_frame, text="Delete Flagged Images", command=self.delete_images, state="disabled"
         )
         self.delete_button.grid(row=0, column=1, padx=5)
+        # Incremental runs only analyse images added or changed since the last run
+        self.incremental_var = ctk.BooleanVar(value=False)
+        self.incremental_checkbox = ctk.CTkCheckBox(
+            self.control_frame, text="Incremental", variable=self.incremental_var
+        )
+        self.incremental_checkbox.grid(row=0, column=2, padx=5)
+        # Cancelled incremental runs resume where they stopped on the next run
+        self.cancel_button = ctk.CTkButton(
+            self.control_frame, text="Cancel", command=self.cancel_run, state="disabled"
+        )
+        self.cancel_button.grid(row=0, column=3, padx=5)
+        self.progress_label = ctk.CTkLabel(self.control_frame, text="", font=("Arial", 12))
+        self.progress_label.grid(row=0, column=4, padx=5)
 
-        # Result table
-        self.result_frame = ctk.CTkFrame(self.main_frame, corner_radius=5)
-        self.result_frame.pack(pady=10, fill="both", expand=True, padx=20)
-        self.result_tree = ttk.Treeview(
-            self.result_frame,
-            columns=("Path", "Duplicate", "Blurred", "Outdated"),
-            show="headings",
-            height=10
+        # Result table; only the visible rows are rendered, so it scales to very large folders
+        self.result_table = VirtualResultTable(self.main_frame, rows=10, corner_radius=5)
+        self.result_table.pack(pady=10, fill="both", expand=True, padx=20)
+
+        # Per-stage timing summary of the last run (see metrics.py)
+        self.metrics_label = ctk.CTkLabel(
+            self.main_frame, text="", font=("Courier", 11), justify="left", anchor="w"
         )
-        self.result_tree.heading("Path", text="Image Path")
-        self.result_tree.heading("Duplicate", text="Duplicate")
-        self.result_tree.heading("Blurred", text="Blurred")
-        self.result_tree.heading("Outdated", text="Outdated")
-        self.result_tree.column("Path", width=400)
-        self.result_tree.column("Duplicate", width=100)
-        self.result_tree.column("Blurred", width=100)
-        self.result_tree.column("Outdated", width=100)
-        self.result_tree.pack(side="left", fill="both", expand=True)
-        scrollbar = ctk.CTkScrollbar(self.result_frame, command=self.result_tree.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.result_tree.configure(yscrollcommand=scrollbar.set)
-
-        self.agents = []
-        self.agent_positions = set()
+        self.metrics_label.pack(pady=(0, 10), fill="x", padx=20)
 
         # Initialize model if folder_path provided
         if folder_path:
             try:
-                self.model = SmartImageCleanupModel(folder_path)
+                self.model = SmartImageCleanupModel(folder_path, incremental=self.incremental_var.get())
             except FileNotFoundError:
                 messagebox.showerror("Error", f"Invalid folder: {folder_path}")
                 self.folder_label.configure(text="Image Folder: Not selected")
@@ -121,7 +122,7 @@ class SmartImageCleanupGUI:
             self.image_folder = folder
             self.folder_label.configure(text=f"Image Folder: {folder}")
             try:
-                self.model = SmartImageCleanupModel(folder)
+                self.model = SmartImageCleanupModel(folder, incremental=self.incremental_var.get())
                 self.run_button.configure(state="normal")
                 self.clear_canvas()
             except FileNotFoundError:
@@ -132,75 +133,107 @@ class SmartImageCleanupGUI:
 
     def clear_canvas(self):
         """Clear the canvas and reset agent visualizations."""
-        self.canvas.delete("all")
-        self.agents = []
-        self.agent_positions = set()
+        self.agent_view.clear()
 
     def run_model(self):
-        """Run the cleanup process in a separate thread."""
+        """Run the cleanup process in a background job."""
         if not self.model:
             messagebox.showerror("Error", "No image folder selected.")
             return
+        self.prepare_model()
         self.run_button.configure(state="disabled")
         self.delete_button.configure(state="disabled")
-        self.result_tree.delete(*self.result_tree.get_children())
-        threading.Thread(target=self.run_cleanup, daemon=True).start()
-
-    def run_cleanup(self):
-        """Run the model and update the GUI."""
-        self.clear_canvas()
-        for agent in self.model.schedule.agents:
-            while True:
-                x = random.randint(50, 650)
-                y = random.randint(50, 350)
-                if (x, y) not in self.agent_positions:
-                    self.agent_positions.add((x, y))
-                    break
-            agent_graphic = self.canvas.create_oval(x, y, x + 20, y + 20, fill="blue", outline="black")
-            self.agents.append(agent_graphic)
-
-        self.model.step()
-        self.update_agents()
-
-        results = self.model.datacollector.get_agent_vars_dataframe()
-        for _, row in results.iterrows():
-            self.result_tree.insert(
-                "",
-                "end",
-                values=(
-                    row["Path"],
-                    "Yes" if row["Duplicate"] else "No",
-                    "Yes" if row["Blurred"] else "No",
-                    "Yes" if row["Outdated"] else "No"
-                )
+        self.cancel_button.configure(state="normal")
+        self.result_table.clear()
+        self.agent_view.reset(agent.unique_id for agent in self.model.schedule.agents)
+
+        self.progress_label.configure(text="Scanning...")
+        get_metrics().reset()
+        self.metrics_label.configure(text="")
+        BackgroundJob(
+            self.root, self.run_cleanup,
+            on_items=self.update_agents, on_done=self.cleanup_finished, on_error=self.cleanup_failed,
+        ).start()
+
+    def prepare_model(self):
+        """Rebuild the model unless it has a step left to run, and return it.
+
+        A model that has finished its step (already stepped by main.py or by an
+        earlier run) or was cancelled does not step again, so it is rebuilt,
+        resuming from its journal if incremental.
+        """
+        incremental = self.incremental_var.get()
+        if self.model.incremental != incremental or self.model.cancelled or not self.model.running:
+            self.model = SmartImageCleanupModel(
+                self.model.image_folder, incremental=incremental,
+                blur_metric=self.model.blur_metric, blur_threshold=self.model.blur_threshold,
             )
+        return self.model
 
-        self.delete_button.configure(state="normal")
+    def run_cleanup(self, emit):
+        """Step the model on the worker thread, emitting each agent's result; never touches widgets."""
+        self.model.schedule.on_agent_done = lambda agent: emit((
+            agent.unique_id, agent.image_path, agent.is_duplicate, agent.is_blurred, agent.is_outdated
+        ))
+        try:
+            # Time-sliced so a cancel takes effect promptly
+            while self.model.running:
+                self.model.step(time_budget=self.STEP_TIME_BUDGET)
+        finally:
+            self.model.schedule.on_agent_done = None
+
+    def cancel_run(self):
+        """Stop the running cleanup after the image being analysed now."""
+        self.cancel_button.configure(state="disabled")
+        self.progress_label.configure(text="Cancelling...")
+        self.model.cancel()
+
+    def update_agents(self, results):
+        """Update agent visualizations and the result table for a batch of agent results."""
+        rows = []
+        changes = []
+        for unique_id, path, is_duplicate, is_blurred, is_outdated in results:
+            changes.append((unique_id, agent_state(is_duplicate, is_blurred, is_outdated)))
+            rows.append((path, result_flags(is_duplicate, is_blurred, is_outdated)))
+        self.agent_view.update(changes)
+        # Agents whose verdict changed later are reported again; the table keeps one row per path
+        self.result_table.append(rows)
+        self.progress_label.configure(
+            text=f"Processed {len(self.result_table)}/{len(self.agent_view)}, {self.result_table.flagged} flagged"
+        )
+        self.update_metrics()
+
+    def update_metrics(self):
+        """Show the per-stage timings recorded so far in the summary panel."""
+        self.metrics_label.configure(text="\n".join(get_metrics().summary_lines()))
+
+    def cleanup_finished(self, result):
+        """Re-enable the controls once the background job is done."""
+        # The streamed rows are replaced by the final verdicts, read straight from the model's columns
+        self.result_table.load(self.model.store.paths, self.model.store.verdicts())
+        self.update_metrics()
+        self.cancel_button.configure(state="disabled")
         self.run_button.configure(state="normal")
-        self.root.after(0, self.root.update)
-
-    def update_agents(self):
-        """Update agent visualizations based on their states."""
-        for i, agent in enumerate(self.model.schedule.agents):
-            if i >= len(self.agents):
-                continue
-            color = (
-                "red" if agent.is_duplicate else
-                "yellow" if agent.is_blurred else
-                "gray" if agent.is_outdated else
-                "blue"
+        if self.model.cancelled:
+            # Verdicts of a partial run are incomplete, so nothing is offered for deletion
+            self.progress_label.configure(
+                text=f"Cancelled at {self.model.progress:.0%}, {self.result_table.flagged} flagged"
             )
-            self.canvas.itemconfig(self.agents[i], fill=color)
+            return
+        self.delete_button.configure(state="normal")
+
+    def cleanup_failed(self, error):
+        """Report a failed background job."""
+        self.progress_label.configure(text="Failed")
+        self.cancel_button.configure(state="disabled")
+        self.run_button.configure(state="normal")
+        messagebox.showerror("Error", f"Cleanup failed: {error}")
 
     def delete_images(self):
         """Delete flagged images after user confirmation."""
         if not self.model:
             return
-        flagged = [
-            agent.image_path
-            for agent in self.model.schedule.agents
-            if agent.is_duplicate or agent.is_blurred or agent.is_outdated
-        ]
+        flagged = self.model.store.flagged_paths()
         if not flagged:
             messagebox.showinfo("Info", "No images flagged for deletion.")
             return
@@ -210,12 +243,13 @@ class SmartImageCleanupGUI:
         ):
             for path in flagged:
                 try:
-                    os.remove(path)
+                    timed_remove(path)
                 except Exception as e:
                     print(f"Error deleting {path}: {e}")
+            self.update_metrics()
             messagebox.showinfo("Success", f"Deleted {len(flagged)} images.")
             self.clear_canvas()
-            self.result_tree.delete(*self.result_tree.get_children())
+            self.result_table.clear()
             self.model = None
             self.image_folder = None
             self.folder_label.configure(text="Image Folder: Not selected")
@@ -14,10 +14,11 @@ if __name__ == "__main__":
         # Run the model for one step (checks are stateless, so one step is enough)
         model.step()
         
-        # Fetch results for debugging (optional)
-        results = model.datacollector.get_agent_vars_dataframe()
+        # Print results for debugging (optional), straight from the model's state columns
         print("Results from the model:")
-        print(results)
+        print(", ".join(f"{name}: {count}" for name, count in model.store.counts().items()))
+        for path in model.store.flagged_paths():
+            print(path)
         
         # Launch GUI
         root = ctk.CTk()
@@ -1,40 +1,131 @@
 from mesa import Model
-from mesa.time import RandomActivation
-from mesa.datacollection import DataCollector
-from agent import ImageAgent
 import os
-from datetime import datetime
-
-class SmartImageCleanupModel(Model):
-    """Model for managing the image cleanup process."""
-    def __init__(self, image_folder):
-        self.schedule = RandomActivation(self)
-        self.datacollector = DataCollector(
-            agent_reporters={
-                "Path": "image_path",
-                "Duplicate": "is_duplicate",
-                "Blurred": "is_blurred",
-                "Outdated": "is_outdated"
-            }
-        )
+import sys
+import time
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # Shared modules live in the project root
+from agent import ImageAgent
+from agent_store import AgentStore, HASHED, RESTORED, JOURNALED, hash_to_hex
+from clustering import DuplicateClusters, keeper_rank
+from functools import partial
+from analysis import analyze_image, needs_decode
+from blur_metrics import DEFAULT_THRESHOLDS, score_files
+from metrics import get_metrics
+from parallel import make_activation
+from scanner import scan_images
+from scan_journal import ScanJournal, DUPLICATE, BLURRED
+from stepping import SteppedModel
+
+class SmartImageCleanupModel(SteppedModel, Model):
+    """Model for managing the image cleanup process.
+
+    ``step()`` can be time-sliced, watched through ``progress`` and
+    cancelled (see ``stepping.SteppedModel``); incremental runs resume an
+    interrupted scan from the journal.
+    """
+    stage = "model.smart"
+
+    def __init__(self, image_folder, duplicate_threshold=5, workers=1, recursive=False, incremental=False,
+                 blur_metric=None, blur_threshold=None):
+        # None keeps the full-resolution Laplacian from analyze_image; a blur_metrics.METRICS
+        # name scores normalised thumbnails in batches instead
+        self.blur_metric = blur_metric
+        if blur_threshold is None:
+            blur_threshold = DEFAULT_THRESHOLDS[blur_metric or "laplacian"]
+        self.blur_threshold = blur_threshold  # Scores below this are blurred; defaults to the metric's threshold
+        work_fn = partial(analyze_image, with_blur=False) if blur_metric else analyze_image
+        # workers > 1 (or 0 for one per CPU) analyses images in a process pool; serial runs read files ahead
+        read_ahead = partial(needs_decode, with_blur=blur_metric is None)
+        self.schedule = make_activation(self, work_fn, workers, read_ahead=read_ahead)
+        # Per-image state (paths, hashes, mtimes, blur scores, verdict flags) in NumPy columns;
+        # reports, the GUI and deletion read these directly
+        self.store = AgentStore()
         self.running = True
         self.image_folder = image_folder
+        self.recursive = recursive  # Also scan subfolders
+        self.duplicate_threshold = duplicate_threshold  # Hashes closer than this are duplicates
+        # Clusters of similar hashed agents; each cluster keeps its best image
+        self.clusters = DuplicateClusters(duplicate_threshold - 1)
+        # Incremental runs only analyse files that are new or changed since the last scan
+        self.incremental = incremental
+        self.journal = None
         self._load_images()
 
     def _load_images(self):
         """Load images from the specified folder and create agents."""
         if not os.path.exists(self.image_folder):
             raise FileNotFoundError(f"Image folder {self.image_folder} does not exist.")
+        if self.incremental:
+            # Verdicts recorded with another metric or threshold are not reused
+            job = f"smart-{self.blur_metric or 'laplacian'}-{self.blur_threshold}"
+            self.journal = ScanJournal(self.image_folder, job)
         
-        valid_extensions = ('.jpg', '.jpeg', '.png')
-        for i, filename in enumerate(os.listdir(self.image_folder)):
-            if filename.lower().endswith(valid_extensions):
-                image_path = os.path.join(self.image_folder, filename)
-                last_modified = datetime.fromtimestamp(os.path.getmtime(image_path))
-                agent = ImageAgent(i, self, image_path, last_modified)
-                self.schedule.add(agent)
-
-    def step(self):
-        """Advance the model by one step."""
-        self.schedule.step()
-        self.datacollector.collect(self)
\ No newline at end of file
+        # Agents are created as the folder is scanned, reusing each entry's cached stat
+        seen = []
+        for i, entry in enumerate(scan_images(self.image_folder, self.recursive)):
+            st = entry.stat()
+            agent = ImageAgent(i, self, self.store.add(entry.path, st.st_mtime_ns))
+            self.schedule.add(agent)
+            if self.journal:
+                seen.append(entry.path)
+                previous = self.journal.unchanged(entry.path, st)
+                if previous and previous.phash:
+                    agent.restore(
+                        int(previous.phash, 16),
+                        bool(previous.verdict & DUPLICATE),
+                        bool(previous.verdict & BLURRED),
+                    )
+        if self.journal:
+            self.journal.forget_missing(seen)
+
+    def begin_step(self):
+        """Flag outdated images and batch-score blur before any agent steps."""
+        self.store.mark_outdated(time.time_ns())
+        if self.blur_metric:
+            self._score_blur()
+
+    def end_step(self):
+        """Count the verdicts and record them for the next incremental run."""
+        counts = self.store.counts()
+        for flag in ("duplicate", "blurred", "outdated"):
+            get_metrics().count(flag, counts[flag])
+        if self.journal:
+            self._record_journal(np.arange(len(self.store)))
+
+    def checkpoint(self, agents):
+        """Record the agents that have stepped so far, so an interrupted scan can resume."""
+        if self.journal:
+            self._record_journal(np.fromiter((agent.index for agent in agents), dtype=np.intp))
+
+    def add_to_clusters(self, agent):
+        """Cluster a hashed agent with its near duplicates and update the verdicts that changed."""
+        analysis = agent.analysis
+        if analysis is not None and self.blur_metric:
+            analysis = analysis._replace(blur=agent.blur_score)
+        demoted = self.clusters.add(agent.image_hash, agent, keeper_rank(agent.image_path, analysis))
+        for other in demoted:
+            other.is_duplicate = True
+            # Report the changed verdict so streaming views stay accurate
+            if self.schedule.on_agent_done:
+                self.schedule.on_agent_done(other)
+
+    def _score_blur(self):
+        """Score every unscored image for blur in batches before the agents step."""
+        blur = self.store.column("blur")
+        pending = np.flatnonzero(np.isnan(blur) & (self.store.column("flags") & RESTORED == 0))
+        scores = score_files([self.store.paths[index] for index in pending], self.blur_metric)
+        blur[pending] = [np.nan if score is None else score for score in scores]
+
+    def _record_journal(self, indices):
+        """Remember the verdicts of the rows ``indices`` for the next incremental run."""
+        flags = self.store.column("flags")[indices]
+        verdicts = flags & (DUPLICATE | BLURRED)
+        # Rows whose verdict is unchanged since it was last recorded are skipped
+        recorded = self.store.column("restored_verdict")[indices]
+        selected = (flags & HASHED != 0) & (((flags & JOURNALED) == 0) | (verdicts != recorded))
+        hashes = self.store.column("hash")
+        for index, verdict in zip(indices[selected], verdicts[selected]):
+            self.journal.record(self.store.paths[index], hash_to_hex(hashes[index]), int(verdict))
+            self.store.restored_verdicts[index] = verdict
+            self.store.flags[index] |= JOURNALED
+        self.journal.commit()
@@ -0,0 +1,239 @@
+"""Virtualised result table for the simulation GUI.
+
+Results live in a compact backing store (one path string and one flag byte
+per image) instead of one ``ttk.Treeview`` row per agent.  The tree only ever
+holds as many rows as fit on screen; scrolling, sorting and filtering change
+which slice of the store those rows show, so the table stays fast with
+hundreds of thousands of results and rows can be appended while a run is
+still in progress.
+"""
+import customtkinter as ctk
+from tkinter import ttk
+from scan_journal import DUPLICATE, BLURRED
+from agent_store import OUTDATED
+HEADER_HEIGHT = 25  # Approximate height of the Treeview heading row in pixels
+
+# (column, heading, width, flag bit)
+COLUMNS = (
+    ("Path", "Image Path", 400, None),
+    ("Duplicate", "Duplicate", 100, DUPLICATE),
+    ("Blurred", "Blurred", 100, BLURRED),
+    ("Outdated", "Outdated", 100, OUTDATED),
+)
+
+FILTERS = {
+    "All": lambda flags: True,
+    "Flagged": lambda flags: flags != 0,
+    "Duplicate": lambda flags: flags & DUPLICATE,
+    "Blurred": lambda flags: flags & BLURRED,
+    "Outdated": lambda flags: flags & OUTDATED,
+    "Clean": lambda flags: flags == 0,
+}
+
+
+def result_flags(is_duplicate, is_blurred, is_outdated):
+    """Pack an agent's verdicts into one flag byte."""
+    return (DUPLICATE if is_duplicate else 0) | (BLURRED if is_blurred else 0) | (OUTDATED if is_outdated else 0)
+
+
+class VirtualResultTable(ctk.CTkFrame):
+    """Result table that renders only the visible rows of a compact backing store."""
+
+    def __init__(self, master, rows=10, **kwargs):
+        super().__init__(master, **kwargs)
+        self.paths = []
+        self.flags = bytearray()
+        self._rows = {}  # Path -> store index
+        self._view = []  # Store indices that pass the filter, in ascending sort order
+        self._filter = FILTERS["All"]
+        self._sort_column = None  # None keeps the order the results arrived in
+        self._reverse = False
+        self._offset = 0  # First view row shown
+
+        self.toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        self.toolbar.pack(fill="x", pady=(0, 5))
+        ctk.CTkLabel(self.toolbar, text="Show:", font=("Arial", 12)).pack(side="left", padx=5)
+        self.filter_menu = ctk.CTkOptionMenu(self.toolbar, values=list(FILTERS), command=self.set_filter)
+        self.filter_menu.pack(side="left", padx=5)
+        self.count_label = ctk.CTkLabel(self.toolbar, text="", font=("Arial", 12))
+        self.count_label.pack(side="left", padx=10)
+
+        self.tree = ttk.Treeview(
+            self, columns=[column for column, _, _, _ in COLUMNS], show="headings",
+            height=rows, selectmode="none"
+        )
+        for column, heading, width, _ in COLUMNS:
+            self.tree.heading(column, text=heading, command=lambda column=column: self.sort_by(column))
+            self.tree.column(column, width=width)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self._items = []
+        self._resize_rows(rows)
+        self.tree.bind("<Configure>", self._on_configure)
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda event: self._scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self._scroll(3))
+        self._render()
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def flagged(self):
+        """Number of results with any flag set."""
+        return len(self.flags) - self.flags.count(0)
+
+    def append(self, results):
+        """Add ``(path, flags)`` results to the store and show them if they pass the filter.
+
+        A path that is already in the table has its flags updated instead.
+        """
+        for path, flags in results:
+            index = self._rows.get(path)
+            if index is None:
+                index = self._rows[path] = len(self.paths)
+                self.paths.append(path)
+                self.flags.append(flags)
+            elif self.flags[index] == flags:
+                continue
+            else:
+                # A verdict changed after the row was added; move the row to its new place
+                if self._filter(self.flags[index]):
+                    del self._view[self._position(index)]
+                self.flags[index] = flags
+            if self._filter(flags):
+                self._view.insert(self._position(index), index)
+        self._render()
+
+    def load(self, paths, flags):
+        """Replace the results with parallel ``paths`` and ``flags`` columns, e.g. from an ``AgentStore``."""
+        offset = self._offset
+        self.paths = list(paths)
+        self.flags = bytearray(flags)
+        self._rows = {path: index for index, path in enumerate(self.paths)}
+        self._rebuild_view()
+        self._offset = min(offset, max(0, len(self._view) - len(self._items)))  # Keep the scroll position
+        self._render()
+
+    def clear(self):
+        """Drop every result."""
+        self.paths = []
+        self.flags = bytearray()
+        self._rows = {}
+        self._view = []
+        self._offset = 0
+        self._render()
+
+    def set_filter(self, name):
+        """Only show results matching the named entry of ``FILTERS``."""
+        self._filter = FILTERS[name]
+        self._rebuild_view()
+
+    def sort_by(self, column):
+        """Sort by ``column``; sorting by the same column again reverses the order."""
+        if column == self._sort_column:
+            self._reverse = not self._reverse
+        else:
+            self._sort_column = column
+            self._reverse = False
+        for name, heading, _, _ in COLUMNS:
+            arrow = (" ▼" if self._reverse else " ▲") if name == column else ""
+            self.tree.heading(name, text=heading + arrow)
+        self._rebuild_view()
+
+    def yview(self, *args):
+        """Scrollbar command: ``moveto fraction`` or ``scroll n units|pages``."""
+        if args and args[0] == "moveto":
+            self._offset = int(float(args[1]) * len(self._view))
+            self._render()
+        elif args and args[0] == "scroll":
+            amount = int(args[1])
+            self._scroll(amount * len(self._items) if args[2] == "pages" else amount)
+
+    def _sort_key(self, index):
+        # The store index breaks ties, so equal rows keep their arrival order
+        if self._sort_column == "Path":
+            return (self.paths[index], index)
+        bit = next(bit for column, _, _, bit in COLUMNS if column == self._sort_column)
+        return (bool(self.flags[index] & bit), index)
+
+    def _position(self, index):
+        """Position of ``index`` in the view, or where it belongs in arrival order."""
+        if self._sort_column is not None:
+            return self._bisect(index)
+        low, high = 0, len(self._view)
+        while low < high:
+            middle = (low + high) // 2
+            if self._view[middle] < index:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _bisect(self, index):
+        """Position in the sorted view where ``index`` belongs."""
+        key = self._sort_key(index)
+        low, high = 0, len(self._view)
+        while low < high:
+            middle = (low + high) // 2
+            if self._sort_key(self._view[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _rebuild_view(self):
+        self._view = [index for index, flags in enumerate(self.flags) if self._filter(flags)]
+        if self._sort_column is not None:
+            self._view.sort(key=self._sort_key)
+        self._offset = 0
+        self._render()
+
+    def _resize_rows(self, rows):
+        """Keep exactly ``rows`` reusable Treeview items."""
+        while len(self._items) < rows:
+            self._items.append(self.tree.insert("", "end", values=()))
+        while len(self._items) > rows:
+            self.tree.delete(self._items.pop())
+
+    def _on_configure(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        rows = max(1, (event.height - HEADER_HEIGHT) // row_height)
+        if rows != len(self._items):
+            self._resize_rows(rows)
+            self._render()
+
+    def _on_wheel(self, event):
+        self._scroll(-1 if event.delta > 0 else 1)
+        return "break"
+
+    def _scroll(self, amount):
+        self._offset += amount
+        self._render()
+        return "break"
+
+    def _render(self):
+        """Fill the visible Treeview items from the current slice of the view."""
+        total = len(self._view)
+        rows = len(self._items)
+        self._offset = max(0, min(self._offset, total - rows))
+        for row, item in enumerate(self._items):
+            position = self._offset + row
+            if position >= total:
+                self.tree.item(item, values=())
+                continue
+            index = self._view[total - 1 - position] if self._reverse else self._view[position]
+            flags = self.flags[index]
+            self.tree.item(item, values=(
+                self.paths[index],
+                "Yes" if flags & DUPLICATE else "No",
+                "Yes" if flags & BLURRED else "No",
+                "Yes" if flags & OUTDATED else "No",
+            ))
+        if total:
+            self.scrollbar.set(self._offset / total, min(1.0, (self._offset + rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.count_label.configure(text=f"Showing {total} of {len(self.paths)} results")
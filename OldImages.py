@@ -1,50 +1,57 @@
 import os
 import datetime
 from mesa import Agent, Model
-from mesa.time import RandomActivation
+from parallel import SerialActivation
+from analysis import file_metadata
+from scanner import scan_files
+from metrics import get_metrics, timed_remove
+from stepping import SteppedModel
 
 # Agent for handling individual files
 class FileAgent(Agent):
-    def __init__(self, unique_id, model, file_path, cutoff_datetime):
+    def __init__(self, unique_id, model, file_path, cutoff_datetime, st=None):
         super().__init__(unique_id, model)
         self.file_path = file_path
         self.cutoff_datetime = cutoff_datetime
+        self.st = st  # Stat result cached by the directory scan
         self.to_delete = False
 
     def step(self):
-        if os.path.isfile(self.file_path):
+        metadata = file_metadata(self.file_path, self.st)
+        if metadata:
             # Get the last modified time of the file
-            file_mod_time = datetime.datetime.fromtimestamp(os.path.getmtime(self.file_path))
+            file_mod_time = datetime.datetime.fromtimestamp(metadata.mtime)
             # Mark the file for deletion if it's older than the cutoff time
             if file_mod_time < self.cutoff_datetime:
                 self.to_delete = True
                 self.model.old_files.append(self.file_path)
 
-# Model for managing old file deletion
-class FileCleanupModel(Model):
-    def __init__(self, folder_path, cutoff_time):
+# Model for managing old file deletion; step() can be time-sliced and cancelled (see stepping.py)
+class FileCleanupModel(SteppedModel, Model):
+    stage = "model.old_files"
+
+    def __init__(self, folder_path, cutoff_time, recursive=False):
         self.folder_path = folder_path
         self.cutoff_datetime = datetime.datetime.strptime(cutoff_time, "%Y-%m-%d %H:%M:%S")
-        self.schedule = RandomActivation(self)
+        self.schedule = SerialActivation(self)
         self.old_files = []  # List of files to delete
 
-        # Create an agent for each file in the folder
-        for idx, filename in enumerate(os.listdir(folder_path)):
-            file_path = os.path.join(folder_path, filename)
-            agent = FileAgent(idx, self, file_path, self.cutoff_datetime)
+        # Create an agent for each file in the folder as it is scanned
+        for idx, entry in enumerate(scan_files(folder_path, recursive=recursive)):
+            agent = FileAgent(idx, self, entry.path, self.cutoff_datetime, entry.stat())
             self.schedule.add(agent)
 
-    def step(self):
-        self.schedule.step()
+    def end_step(self):
+        get_metrics().count("outdated", len(self.old_files))
 
 # Function to delete old images using Mesa
-def delete_old_images_with_mesa(folder_path, cutoff_time):
+def delete_old_images_with_mesa(folder_path, cutoff_time, recursive=False):
     if not os.path.exists(folder_path):
         print(f"Error: The specified folder does not exist: {folder_path}")
         return
 
     # Initialize the model
-    model = FileCleanupModel(folder_path, cutoff_time)
+    model = FileCleanupModel(folder_path, cutoff_time, recursive)
     model.step()
 
     # Delete files marked for deletion
@@ -52,7 +59,7 @@ def delete_old_images_with_mesa(folder_path, cutoff_time):
         for old_file in model.old_files:
             print(f"Deleting: {old_file}")
             try:
-                os.remove(old_file)
+                timed_remove(old_file)
             except PermissionError:
                 print(f"Permission denied for {old_file}. Unable to remove.")
         print("Old files deleted successfully!")
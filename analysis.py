@@ -0,0 +1,150 @@
+"""Single-decode analysis engine shared by every cleanup entry point.
+
+Each image is decoded once into a grayscale buffer; the perceptual hash, the
+Laplacian blur score and the basic metadata are all computed from that one
+buffer.  Results go through the persistent analysis cache, so unchanged files
+are not decoded at all on later runs.  Callers that read files ahead (see
+``prefetch``) pass the bytes as ``data`` and ask ``needs_decode`` first, so
+cached files are never read.
+
+Fast decode mode
+----------------
+With ``fast=True`` (or ``SMART_CLEANUP_FAST_DECODE=1`` in the environment)
+JPEGs are decoded straight to grayscale at reduced resolution using the
+decoder's DCT-domain scaling (PIL ``draft()``, the same mechanism as OpenCV's
+``IMREAD_REDUCED_GRAYSCALE_2/4/8``).  The scale is chosen per metric:
+
+* hashing only needs an 8x8 thumbnail, so hash-only requests decode at the
+  smallest scale that still covers ``HASH_DRAFT_SIZE`` (usually 1/8);
+* blur scoring decodes at ``1 / BLUR_DRAFT_SCALE`` (1/2) and the hash is taken
+  from the same buffer.
+
+The trade-off is blur-score fidelity: downscaling concentrates edges into
+fewer pixels, so the Laplacian variance of a half-size decode is typically
+higher than at full size and fine-grained softness is lost.  Thresholds tuned
+on full-resolution scores flag fewer images in fast mode; recalibrate them if
+you rely on it.  Hashes occasionally differ by a bit or two from full-size
+decodes.  Non-JPEG formats are always decoded at full size.
+"""
+import os
+import stat
+from collections import namedtuple
+
+from analysis_cache import get_default_cache
+from metrics import get_metrics
+from prefetch import as_file
+
+FAST_DECODE_ENV_VAR = "SMART_CLEANUP_FAST_DECODE"
+HASH_DRAFT_SIZE = (64, 64)  # Smallest decode that still gives average_hash room to antialias
+BLUR_DRAFT_SCALE = 2  # Blur scores are taken from a half-resolution decode
+
+ImageAnalysis = namedtuple(
+    "ImageAnalysis", ["path", "image_hash", "blur", "width", "height", "size", "mtime"]
+)
+
+FileMetadata = namedtuple("FileMetadata", ["path", "size", "mtime"])
+
+
+def file_metadata(path, st=None):
+    """Size and modification time of a regular file, or None if it is not one."""
+    try:
+        st = st or os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return FileMetadata(path, st.st_size, st.st_mtime)
+
+
+def fast_decode_enabled():
+    """Whether reduced-resolution decoding is switched on in the environment."""
+    return os.environ.get(FAST_DECODE_ENV_VAR, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def decode_mode(with_blur, fast):
+    """Label recorded in the cache for the resolution a result was computed at."""
+    if not fast:
+        return "full"
+    return "fast" if with_blur else "fast-hash"
+
+
+def _cached_entry(cache, path, st, with_blur, mode):
+    """The cache entry that fully answers this request, or None."""
+    entry = cache.get(path, st) if cache is not None else None
+    if not entry or (entry["decode_mode"] or "full") != mode:
+        return None  # Missing, or computed at a different resolution
+    if entry["phash"] and (entry["blur"] is not None or not with_blur):
+        return entry
+    return None
+
+
+def needs_decode(path, st=None, with_blur=True, fast=None):
+    """Whether ``analyze_image`` would have to decode ``path`` (i.e. read its bytes)."""
+    if fast is None:
+        fast = fast_decode_enabled()
+    try:
+        st = st or os.stat(path)
+    except OSError:
+        return True  # Let the decode report the error
+    return _cached_entry(get_default_cache(), path, st, with_blur, decode_mode(with_blur, fast)) is None
+
+
+def analyze_image(path, with_blur=True, use_cache=True, st=None, fast=None, data=None):
+    """Decode ``path`` once and return its ``ImageAnalysis``.
+
+    ``blur`` is the variance of the Laplacian of the grayscale image; it is
+    None when ``with_blur`` is False and no cached score exists.  ``fast``
+    selects reduced-resolution decoding (see the module docstring) and
+    defaults to the ``SMART_CLEANUP_FAST_DECODE`` setting.  ``data`` holds
+    the file's bytes if they were already read, in which case they are
+    decoded instead of reopening ``path``.  Raises the underlying error if
+    the file cannot be read or decoded.
+    """
+    if fast is None:
+        fast = fast_decode_enabled()
+    mode = decode_mode(with_blur, fast)
+    st = st or os.stat(path)
+    cache = get_default_cache() if use_cache else None
+    entry = _cached_entry(cache, path, st, with_blur, mode)
+
+    # Imported lazily so metadata-only callers (OldImages) stay light
+    import imagehash
+
+    metrics = get_metrics()
+    if entry:
+        metrics.count("cache_hits")
+        return ImageAnalysis(
+            path, imagehash.hex_to_hash(entry["phash"]), entry["blur"],
+            entry["width"], entry["height"], st.st_size, st.st_mtime,
+        )
+
+    from PIL import Image
+
+    if cache is not None:
+        metrics.count("cache_misses")
+    # Decoding straight from the file reads it too, so its bytes are counted here
+    with metrics.timer("decode", path, st.st_size if data is None else 0):
+        with Image.open(path if data is None else as_file(data)) as img:
+            width, height = img.size
+            if fast:
+                if with_blur:
+                    img.draft("L", (max(1, width // BLUR_DRAFT_SCALE), max(1, height // BLUR_DRAFT_SCALE)))
+                else:
+                    img.draft("L", HASH_DRAFT_SIZE)
+            gray = img.convert("L")
+    with metrics.timer("hash", path):
+        image_hash = imagehash.average_hash(gray)
+
+    blur = None
+    if with_blur:
+        import cv2
+        import numpy as np
+        with metrics.timer("blur", path):
+            blur = float(cv2.Laplacian(np.asarray(gray), cv2.CV_64F).var())
+
+    if cache is not None:
+        cache.put(
+            path, st, phash=str(image_hash), blur=blur,
+            width=width, height=height, decode_mode=mode,
+        )
+    return ImageAnalysis(path, image_hash, blur, width, height, st.st_size, st.st_mtime)
@@ -0,0 +1,271 @@
+"""Persistent per-file analysis cache shared by every detector.
+
+Results (perceptual hash, Laplacian variance, dimensions, face encodings) are
+stored in a SQLite database keyed by ``(device, inode)`` and validated against
+the file's size and modification time, so an unchanged file is never decoded
+twice.  The database lives in the user cache directory by default; set the
+``SMART_CLEANUP_CACHE`` environment variable to another path, or to ``off`` to
+disable caching entirely.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_ENV_VAR = "SMART_CLEANUP_CACHE"
+DEFAULT_MAX_ENTRIES = 500_000
+COMMIT_EVERY = 1000  # Pending writes before an automatic commit
+FACE_ENCODING_SIZE = 128
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    phash TEXT,
+    blur REAL,
+    width INTEGER,
+    height INTEGER,
+    faces BLOB,
+    decode_mode TEXT,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+CREATE INDEX IF NOT EXISTS analysis_last_used ON analysis (last_used);
+"""
+
+_FIELDS = ("phash", "blur", "width", "height", "faces", "decode_mode")
+
+
+def default_cache_path():
+    """Location of the cache database inside the per-user cache directory."""
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "smart-image-cleanup", "analysis.sqlite")
+
+
+def file_key(st):
+    """Cache key and validators for an ``os.stat_result``."""
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class AnalysisCache:
+    """SQLite-backed store of per-file analysis results.
+
+    An entry is only returned while the file's size and mtime still match the
+    values recorded with it; stale entries are dropped on lookup.  Once the
+    cache holds more than ``max_entries`` rows, the least recently used ones
+    are evicted on commit.
+    """
+
+    def __init__(self, db_path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path or default_cache_path()
+        self.max_entries = max_entries
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(analysis)")}
+        if "decode_mode" not in columns:
+            # Databases created before reduced-resolution decoding existed
+            self._conn.execute("ALTER TABLE analysis ADD COLUMN decode_mode TEXT")
+        self._pending = 0
+        self._touched = {}  # (dev, ino) -> last_used, flushed on commit
+
+    def get(self, path, st=None):
+        """Return the cached fields for ``path`` as a dict, or None on a miss."""
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return None
+        dev, ino, size, mtime_ns = file_key(st)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, phash, blur, width, height, faces, decode_mode "
+                "FROM analysis WHERE dev=? AND ino=?",
+                (dev, ino),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] != size or row[1] != mtime_ns:
+                # File changed since it was analysed
+                self._conn.execute("DELETE FROM analysis WHERE dev=? AND ino=?", (dev, ino))
+                self._note_write()
+                return None
+            self._touched[(dev, ino)] = time.time()
+        return dict(zip(_FIELDS, row[2:]))
+
+    def lookup(self, path, field, st=None):
+        """Return a single cached field for ``path``, or None if not known."""
+        entry = self.get(path, st)
+        return entry.get(field) if entry else None
+
+    def put(self, path, st=None, **fields):
+        """Store analysis fields for ``path``, merging with any existing entry."""
+        unknown = set(fields) - set(_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown cache fields: {', '.join(sorted(unknown))}")
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return
+        dev, ino, size, mtime_ns = file_key(st)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns FROM analysis WHERE dev=? AND ino=?", (dev, ino)
+            ).fetchone()
+            if row is None or row[0] != size or row[1] != mtime_ns:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO analysis (dev, ino, size, mtime_ns, path, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (dev, ino, size, mtime_ns, os.path.abspath(path), now),
+                )
+            if fields:
+                assignments = ", ".join(f"{name}=?" for name in fields)
+                self._conn.execute(
+                    f"UPDATE analysis SET {assignments}, path=?, last_used=? WHERE dev=? AND ino=?",
+                    (*fields.values(), os.path.abspath(path), now, dev, ino),
+                )
+            self._note_write()
+
+    def get_faces(self, path, st=None):
+        """Return cached face encodings as an ``(n, 128)`` array, or None."""
+        blob = self.lookup(path, "faces", st)
+        if blob is None:
+            return None
+        import numpy as np
+        return np.frombuffer(blob, dtype=np.float64).reshape(-1, FACE_ENCODING_SIZE)
+
+    def put_faces(self, path, encodings, st=None):
+        """Store the face encodings found in ``path`` (an empty list is valid)."""
+        import numpy as np
+        array = np.asarray(encodings, dtype=np.float64).reshape(-1, FACE_ENCODING_SIZE)
+        self.put(path, st, faces=array.tobytes())
+
+    def invalidate(self, path):
+        """Forget everything cached for ``path``."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._conn.execute("DELETE FROM analysis WHERE path=?", (os.path.abspath(path),))
+                self._note_write()
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM analysis WHERE dev=? AND ino=?", (st.st_dev, st.st_ino))
+            self._note_write()
+
+    def prune(self):
+        """Drop entries whose files were deleted or modified. Returns the count removed."""
+        with self._lock:
+            rows = self._conn.execute("SELECT dev, ino, size, mtime_ns, path FROM analysis").fetchall()
+        stale = []
+        for dev, ino, size, mtime_ns, path in rows:
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.append((dev, ino))
+                continue
+            if file_key(st) != (dev, ino, size, mtime_ns):
+                stale.append((dev, ino))
+        with self._lock:
+            self._conn.executemany("DELETE FROM analysis WHERE dev=? AND ino=?", stale)
+            self._conn.commit()
+        return len(stale)
+
+    def evict(self):
+        """Trim the cache to ``max_entries`` rows, least recently used first."""
+        with self._lock:
+            self._flush()  # Recent lookups count before anything is evicted
+
+    def commit(self):
+        """Flush pending writes and recency updates to disk."""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Commit and close the database connection."""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._flush()
+            self._conn.close()
+            self._conn = None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+
+    def _note_write(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._flush()
+
+    def _flush(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE analysis SET last_used=? WHERE dev=? AND ino=?",
+                [(used, dev, ino) for (dev, ino), used in self._touched.items()],
+            )
+            self._touched.clear()
+        self._evict()
+        self._conn.commit()
+        self._pending = 0
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM analysis WHERE rowid IN "
+                "(SELECT rowid FROM analysis ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+
+_default_cache = None
+_default_pid = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Shared process-wide cache, or None when caching is disabled."""
+    global _default_cache, _default_pid
+    location = os.environ.get(CACHE_ENV_VAR)
+    if location is not None and location.strip().lower() in ("", "0", "off", "false", "no"):
+        return None
+    with _default_lock:
+        if _default_pid != os.getpid():
+            # A forked worker must not reuse its parent's SQLite connection
+            _default_cache = None
+            _default_pid = os.getpid()
+        if _default_cache is not None and _default_cache.db_path != (location or default_cache_path()):
+            # The configured location changed (e.g. between benchmark runs)
+            _default_cache.close()
+            _default_cache = None
+        if _default_cache is None:
+            try:
+                _default_cache = AnalysisCache(location or None)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Warning: analysis cache unavailable ({e}). Continuing without it.")
+                return None
+            atexit.register(_default_cache.close)
+        return _default_cache
+
+
+def commit_default_cache():
+    """Commit the shared cache if this process has opened one."""
+    with _default_lock:
+        cache = _default_cache if _default_pid == os.getpid() else None
+    if cache is not None:
+        cache.commit()
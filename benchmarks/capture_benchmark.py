@@ -0,0 +1,107 @@
+"""Benchmark the face capture pipeline on recorded footage.
+
+Plays a video file, image folder or glob pattern through ``CapturePipeline``
+in place of the camera, with no window, and reports how many frames were
+grabbed and dropped, detection latency, the time until a sharp face was
+captured and the CPU time used per second of footage.
+
+Usage:
+    python benchmarks/capture_benchmark.py --source clip.mp4
+    python benchmarks/capture_benchmark.py --source "frames/*.jpg" --fps 0 --detect-fps 10
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.append(ROOT)
+sys.path.append(BENCH_DIR)
+
+from run_benchmarks import git_revision
+
+
+def run_capture(options):
+    """Play the source once through a headless pipeline and collect its figures."""
+    from capture_pipeline import CapturePipeline, open_source
+    from metrics import get_metrics
+
+    metrics = get_metrics()
+    metrics.reset()
+    source = open_source(options.source, options.fps)
+    pipeline = CapturePipeline(source, options.detect_fps, options.threshold, auto_capture=True)
+    shown = 0
+    frame_number = 0
+    captured_after = None
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    with pipeline:
+        # Stands in for the display loop: take every frame the grabber offers
+        while True:
+            latest = pipeline.wait_frame(frame_number, timeout=0.5)
+            if latest is None:
+                if pipeline.finished:
+                    break
+                continue
+            frame_number = latest[0]
+            shown += 1
+            if captured_after is None and pipeline.captured.is_set():
+                captured_after = time.perf_counter() - wall
+                if options.stop_on_capture:
+                    break
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    report = metrics.report()
+    detect = report["stages"].get("capture.detect", {})
+    return {
+        "seconds": wall,
+        "cpu_seconds": cpu,
+        "cpu_per_second": cpu / wall if wall else None,
+        "frames_grabbed": pipeline.grabber.sequence,
+        "frames_shown": shown,
+        "frames_dropped": report["counters"].get("capture.frames_dropped", 0),
+        "detections": detect.get("count", 0),
+        "detect_p50": detect.get("p50"),
+        "detect_p95": detect.get("p95"),
+        "best_sharpness": pipeline.best()[1],
+        "captured_after": captured_after,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the face capture pipeline on recorded footage.")
+    parser.add_argument("--source", required=True, help="Video file, image folder or glob pattern")
+    parser.add_argument("--fps", type=float, help="Playback rate (default: the video's own; 0 = unpaced)")
+    parser.add_argument("--detect-fps", type=float, default=5.0)
+    parser.add_argument("--threshold", type=float, default=100.0, help="Sharpness that triggers a capture")
+    parser.add_argument("--stop-on-capture", action="store_true", help="Stop at the first sharp face")
+    parser.add_argument("--output", default="-", help="JSON results file, or - for stdout")
+    options = parser.parse_args(argv)
+
+    result = run_capture(options)
+    print(f"{result['frames_grabbed']} frames in {result['seconds']:.2f}s, {result['frames_dropped']} dropped, "
+          f"{result['detections']} detections, CPU {result['cpu_per_second']:.2f} s/s", file=sys.stderr)
+    report = {
+        "commit": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "source": options.source,
+            "fps": options.fps,
+            "detect_fps": options.detect_fps,
+            "threshold": options.threshold,
+        },
+        "result": result,
+    }
+    if options.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
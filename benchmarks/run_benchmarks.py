@@ -0,0 +1,210 @@
+"""Benchmark the cleanup detectors on synthetic galleries.
+
+Generates a gallery per requested size (see ``synthetic_gallery.py``), times
+each detector on a fresh copy of it and writes machine-readable results, so
+regressions and the effect of parallel, cached or fast-decode modes can be
+tracked across commits.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 100 1000 --output results.json
+    python benchmarks/run_benchmarks.py --sizes 1000 --workers 0 --cache warm --fast
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'Mesa'))  # SmartImageCleanupModel
+sys.path.append(BENCH_DIR)
+
+from synthetic_gallery import generate_gallery
+
+BENCHMARKS = ("find_duplicates", "blur_model", "old_images", "smart_model", "face_matching")
+OLD_CUTOFF_DAYS = 365
+
+
+def git_revision():
+    """Current commit of the repository, if it can be determined."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def image_paths(folder):
+    from scanner import scan_images
+    return [entry.path for entry in scan_images(folder, recursive=False)]
+
+
+def run_find_duplicates(folder, options):
+    import Duplicates
+    return len(Duplicates.find_duplicates(folder))
+
+
+def run_blur_model(folder, options):
+    import lowQuality
+    model = lowQuality.ImageCleanupModel(folder, workers=options.workers)
+    model.step()
+    return len(model.get_blurry_images())
+
+
+def run_old_images(folder, options):
+    import OldImages
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=OLD_CUTOFF_DAYS)
+    before = len(os.listdir(folder))
+    OldImages.delete_old_images_with_mesa(folder, cutoff.strftime("%Y-%m-%d %H:%M:%S"))
+    return before - len(os.listdir(folder))
+
+
+def run_smart_model(folder, options):
+    from model import SmartImageCleanupModel
+    model = SmartImageCleanupModel(folder, workers=options.workers)
+    model.step()
+    return model.store.counts()["flagged"]
+
+
+def run_face_matching(folder, options):
+    import compare_face
+    output_folder = os.path.join(os.path.dirname(folder), "matched")
+    model = compare_face.FaceComparisonModel(
+        folder, options.reference_face, output_folder, workers=options.workers
+    )
+    model.step()
+    return sum(1 for agent in model.schedule.agents if agent.has_matched)
+
+
+def warm_cache(name, folder, options):
+    """Populate the analysis cache for ``folder`` outside the timed region."""
+    if name == "old_images":
+        return
+    if name == "face_matching":
+        import compare_face
+        for path in image_paths(folder):
+            try:
+                compare_face.encode_faces(path)
+            except Exception:
+                pass
+        return
+    from analysis import analyze_image
+    for path in image_paths(folder):
+        try:
+            analyze_image(path, with_blur=name != "find_duplicates")
+        except Exception:
+            pass
+
+
+def time_benchmark(name, gallery, scratch, options):
+    """Run one benchmark ``options.repeat`` times on fresh copies of the gallery."""
+    runner = globals()[f"run_{name}"]
+    timings = []
+    flagged = None
+    for run in range(options.repeat):
+        folder = os.path.join(scratch, f"{name}-{run}", "gallery")
+        shutil.copytree(gallery, folder)  # copy2 keeps the planted mtimes
+        os.remove(os.path.join(folder, "manifest.json"))
+        if options.cache == "cold":
+            os.environ["SMART_CLEANUP_CACHE"] = os.path.join(scratch, f"{name}-{run}", "cache.sqlite")
+        elif options.cache == "warm":
+            os.environ["SMART_CLEANUP_CACHE"] = os.path.join(scratch, f"{name}-{run}", "cache.sqlite")
+            warm_cache(name, folder, options)
+        start = time.perf_counter()
+        flagged = runner(folder, options)
+        timings.append(time.perf_counter() - start)
+        shutil.rmtree(os.path.join(scratch, f"{name}-{run}"), ignore_errors=True)
+    return timings, flagged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image cleanup detectors.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (0 = one per CPU)")
+    parser.add_argument("--cache", choices=("off", "cold", "warm"), default="off")
+    parser.add_argument("--fast", action="store_true", help="Use reduced-resolution decoding")
+    parser.add_argument("--reference-face", help="Reference face photo (enables face_matching)")
+    parser.add_argument("--faces-dir", help="Face photos to plant in the gallery")
+    parser.add_argument("--face-copies", type=int, default=20)
+    parser.add_argument("--workdir", help="Scratch directory (default: a temporary one)")
+    parser.add_argument("--output", default="-", help="JSON results file, or - for stdout")
+    options = parser.parse_args(argv)
+
+    if options.cache == "off":
+        os.environ["SMART_CLEANUP_CACHE"] = "off"
+    os.environ["SMART_CLEANUP_FAST_DECODE"] = "1" if options.fast else "0"
+    benchmarks = [
+        name for name in options.benchmarks
+        if name != "face_matching" or options.reference_face
+    ]
+
+    scratch = options.workdir or tempfile.mkdtemp(prefix="cleanup-bench-")
+    os.makedirs(scratch, exist_ok=True)
+    results = []
+    try:
+        for size in options.sizes:
+            gallery = os.path.join(scratch, f"gallery-{size}")
+            if not os.path.exists(os.path.join(gallery, "manifest.json")):
+                generate_gallery(
+                    gallery, size, options.seed,
+                    faces_dir=options.faces_dir,
+                    face_copies=options.face_copies if options.faces_dir else 0,
+                )
+            with open(os.path.join(gallery, "manifest.json")) as f:
+                images = json.load(f)["count"]
+
+            for name in benchmarks:
+                timings, flagged = time_benchmark(name, gallery, scratch, options)
+                best = min(timings)
+                results.append({
+                    "benchmark": name,
+                    "images": images,
+                    "seconds": best,
+                    "median_seconds": statistics.median(timings),
+                    "runs": timings,
+                    "images_per_second": images / best if best > 0 else None,
+                    "flagged": flagged,
+                })
+                print(f"{name:>16} {images:>8} images  {best:8.3f}s  {images / best if best > 0 else 0:10.1f} img/s",
+                      file=sys.stderr)
+    finally:
+        if not options.workdir:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    report = {
+        "commit": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "workers": options.workers,
+            "cache": options.cache,
+            "fast_decode": options.fast,
+            "repeat": options.repeat,
+            "seed": options.seed,
+        },
+        "results": results,
+    }
+    if options.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Synthetic image corpora for benchmarking the cleanup detectors.
+
+Generates a reproducible gallery of textured JPEGs and plants known problems
+in it: exact (byte-identical) duplicates, near duplicates (re-encoded and
+slightly shifted copies), Gaussian-blurred copies and files with back-dated
+modification times.  Optionally copies real face photos into the gallery so
+face matching can be timed too.  A ``manifest.json`` with the ground truth is
+written next to the images.
+
+Usage:
+    python benchmarks/synthetic_gallery.py OUTPUT_DIR --count 1000 --seed 0
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_SIZE = (640, 480)
+OLD_AGE_DAYS = 3 * 365  # Back-dated files are this many days old
+
+
+def _base_image(rng, width, height):
+    """A random, sharp, textured image (gradients, shapes and noise)."""
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.float32)
+    for channel in range(3):
+        fx, fy, phase = rng.uniform(1, 12), rng.uniform(1, 12), rng.uniform(0, 6.3)
+        image[:, :, channel] = 127 + 80 * np.sin(fx * 6.3 * x + phase) * np.cos(fy * 6.3 * y)
+    image = image.astype(np.uint8)
+    for _ in range(int(rng.integers(5, 15))):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        if rng.random() < 0.5:
+            cv2.circle(image, center, int(rng.integers(10, min(width, height) // 3)), color, -1)
+        else:
+            corner = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            cv2.rectangle(image, center, corner, color, -1)
+    noise = rng.normal(0, 12, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def _near_duplicate(image, rng):
+    """A visually identical copy: small brightness shift, 1px crop, resized back."""
+    height, width = image.shape[:2]
+    shifted = np.clip(image.astype(np.int16) + int(rng.integers(-6, 7)), 0, 255).astype(np.uint8)
+    cropped = shifted[1:height - 1, 1:width - 1]
+    return cv2.resize(cropped, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def generate_gallery(output_dir, count, seed=0, size=DEFAULT_SIZE, duplicate_ratio=0.1,
+                     near_duplicate_ratio=0.1, blurred_ratio=0.1, old_ratio=0.2,
+                     faces_dir=None, face_copies=0):
+    """Write ``count`` images to ``output_dir`` and return the ground-truth manifest."""
+    rng = np.random.default_rng(seed)
+    shuffle = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    width, height = size
+
+    planted = {
+        "exact_duplicates": int(count * duplicate_ratio),
+        "near_duplicates": int(count * near_duplicate_ratio),
+        "blurred": int(count * blurred_ratio),
+    }
+    originals = max(1, count - sum(planted.values()))
+    manifest = {
+        "seed": seed, "count": 0, "size": [width, height],
+        "originals": [], "exact_duplicates": {}, "near_duplicates": {},
+        "blurred": [], "old": [], "faces": [],
+    }
+
+    def write(name, image):
+        path = os.path.join(output_dir, name)
+        cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+        manifest["count"] += 1
+        return name
+
+    sources = []
+    for i in range(originals):
+        image = _base_image(rng, width, height)
+        sources.append((write(f"img_{i:07d}.jpg", image), image))
+        manifest["originals"].append(sources[-1][0])
+
+    for i in range(planted["exact_duplicates"]):
+        name, _ = sources[int(rng.integers(0, len(sources)))]
+        copy_name = f"dup_{i:07d}.jpg"
+        shutil.copyfile(os.path.join(output_dir, name), os.path.join(output_dir, copy_name))
+        manifest["count"] += 1
+        manifest["exact_duplicates"][copy_name] = name
+
+    for i in range(planted["near_duplicates"]):
+        name, image = sources[int(rng.integers(0, len(sources)))]
+        manifest["near_duplicates"][write(f"near_{i:07d}.jpg", _near_duplicate(image, rng))] = name
+
+    for i in range(planted["blurred"]):
+        _, image = sources[int(rng.integers(0, len(sources)))]
+        sigma = float(rng.uniform(3, 8))
+        manifest["blurred"].append(write(f"blur_{i:07d}.jpg", cv2.GaussianBlur(image, (0, 0), sigma)))
+
+    if faces_dir and face_copies:
+        face_sources = sorted(
+            name for name in os.listdir(faces_dir)
+            if name.lower().endswith(('.jpg', '.jpeg', '.png'))
+        )
+        for i in range(face_copies if face_sources else 0):
+            source = face_sources[i % len(face_sources)]
+            face_name = f"face_{i:07d}{os.path.splitext(source)[1].lower()}"
+            shutil.copyfile(os.path.join(faces_dir, source), os.path.join(output_dir, face_name))
+            manifest["count"] += 1
+            manifest["faces"].append(face_name)
+
+    # Back-date a fixed share of all files
+    names = sorted(os.listdir(output_dir))
+    shuffle.shuffle(names)
+    old_time = time.time() - OLD_AGE_DAYS * 86400
+    for name in names[:int(len(names) * old_ratio)]:
+        os.utime(os.path.join(output_dir, name), (old_time, old_time))
+        manifest["old"].append(name)
+
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark gallery.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--width", type=int, default=DEFAULT_SIZE[0])
+    parser.add_argument("--height", type=int, default=DEFAULT_SIZE[1])
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Share of exact duplicates")
+    parser.add_argument("--near-duplicates", type=float, default=0.1, help="Share of near duplicates")
+    parser.add_argument("--blurred", type=float, default=0.1, help="Share of blurred copies")
+    parser.add_argument("--old", type=float, default=0.2, help="Share of back-dated files")
+    parser.add_argument("--faces-dir", help="Folder of real face photos to plant")
+    parser.add_argument("--face-copies", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    manifest = generate_gallery(
+        args.output_dir, args.count, args.seed, (args.width, args.height),
+        args.duplicates, args.near_duplicates, args.blurred, args.old,
+        args.faces_dir, args.face_copies,
+    )
+    print(f"Wrote {manifest['count']} images to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,113 @@
 import cv2
 from mesa import Agent, Model
 from mesa.time import RandomActivation
+from capture_pipeline import CapturePipeline, DETECTION_FPS, SHARPNESS_THRESHOLD
 
-# Agent to capture a frame from video stream
+FRAME_TIMEOUT = 0.1  # Seconds to wait for a new frame before polling the keyboard anyway
+
+# Agent to capture a frame from a video stream (a camera, or a video file / image sequence for tests)
 class FaceCaptureAgent(Agent):
-    def __init__(self, unique_id, model, save_path="captured_frame.jpg"):
+    def __init__(self, unique_id, model, save_path="captured_frame.jpg", source=0, auto_capture=True,
+                 display=True, detect_fps=DETECTION_FPS, sharpness_threshold=SHARPNESS_THRESHOLD):
         super().__init__(unique_id, model)
         self.save_path = save_path
-        self.cap = None
+        self.source = source
+        self.auto_capture = auto_capture  # Save the first sharp face without waiting for 'C'
+        self.display = display  # False runs headless, e.g. on a recorded source in a benchmark
+        self.detect_fps = detect_fps
+        self.sharpness_threshold = sharpness_threshold
+        self.pipeline = None
+        self.frame_number = 0  # Latest frame shown
+        self.frame = None
         self.is_capturing = False
         self.is_exiting = False
 
     def start_video_capture(self):
-        """ Initialize video capture and check if it opens successfully """
-        self.cap = cv2.VideoCapture(0)  # 0 is the default camera
-        if not self.cap.isOpened():
-            print("Error: Could not open video stream.")
+        """ Start the grabber and face detection threads and check the source opens """
+        try:
+            self.pipeline = CapturePipeline(
+                self.source, self.detect_fps, self.sharpness_threshold, self.auto_capture
+            ).start()
+        except OSError as e:
+            print(f"Error: {e}")
             return False
         return True
 
+    def save_frame(self, frame, reason):
+        cv2.imwrite(self.save_path, frame)
+        print(f"Frame {reason} and saved at {self.save_path}")
+        self.is_capturing = True
+
     def step(self):
-        """ Capture frame when 'C' is pressed, exit when 'Q' is pressed """
-        if self.cap is None:
+        """ Show the latest frame; capture a sharp face automatically or when 'C' is pressed, exit on 'Q' """
+        if self.pipeline is None:
             if not self.start_video_capture():
+                self.is_exiting = True
                 return
 
-        ret, frame = self.cap.read()
-        if not ret:
-            print("Failed to grab frame")
+        # Blocks until the grabber has a newer frame, so an idle camera costs no CPU
+        latest = self.pipeline.wait_frame(self.frame_number, FRAME_TIMEOUT)
+        if latest is None and self.pipeline.finished:
+            if self.pipeline.grabber.error is not None:
+                print(f"Failed to grab frame: {self.pipeline.grabber.error}")
+            # A recorded source that ended without a sharp enough face still yields its best frame
+            best_frame, sharpness = self.pipeline.best()
+            if self.auto_capture and not self.is_capturing and best_frame is not None:
+                self.save_frame(best_frame, f"captured (best sharpness {sharpness:.0f})")
+            self.is_exiting = True
             return
+        if latest is not None:
+            self.frame_number, self.frame = latest
+            if self.display:
+                # Boxes come from the latest detection, which may lag the frame slightly
+                shown = self.frame.copy()
+                for x, y, w, h, sharpness in self.pipeline.latest_faces():
+                    color = (0, 255, 0) if sharpness >= self.sharpness_threshold else (0, 165, 255)
+                    cv2.rectangle(shown, (x, y), (x + w, y + h), color, 2)
+                cv2.imshow('Video Frame', shown)
 
-        # Display the frame
-        cv2.imshow('Video Frame', frame)
+        if self.auto_capture and not self.is_capturing and self.pipeline.captured.is_set():
+            best_frame, sharpness = self.pipeline.best()
+            self.save_frame(best_frame, f"auto-captured (sharpness {sharpness:.0f})")
+            self.is_exiting = True
+            return
+
+        key = cv2.waitKey(1) & 0xFF if self.display else -1
 
-        # Check if key is pressed for actions
-        key = cv2.waitKey(1) & 0xFF
-        
         # Save frame when 'C' is pressed
-        if key == ord('c') and not self.is_capturing:
-            cv2.imwrite(self.save_path, frame)
-            print(f"Frame captured and saved at {self.save_path}")
-            self.is_capturing = True
+        if key == ord('c') and not self.is_capturing and self.frame is not None:
+            self.save_frame(self.frame, "captured")
 
         # Stop the capture and close on pressing 'Q'
         if key == ord('q'):
             self.is_exiting = True
 
     def stop_video_capture(self):
-        """ Release the capture and destroy windows """
-        if self.cap is not None:
-            self.cap.release()
-            cv2.destroyAllWindows()
+        """ Stop the capture threads, release the source and destroy windows """
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            if self.display:
+                cv2.destroyAllWindows()
 
 # Model to manage face capture agents
 class FaceCaptureModel(Model):
-    def __init__(self, num_agents=1, save_path="captured_frame.jpg"):
+    def __init__(self, num_agents=1, save_path="captured_frame.jpg", source=0, auto_capture=True, display=True):
         self.num_agents = num_agents
         self.schedule = RandomActivation(self)
-        
+
         # Create the agents
         for i in range(self.num_agents):
-            a = FaceCaptureAgent(i, self, save_path)
+            a = FaceCaptureAgent(i, self, save_path, source, auto_capture, display)
             self.schedule.add(a)
 
     def step(self):
         """ Run a step for all agents """
         self.schedule.step()
 
-# Function to initiate the video capture and capture a frame using Mesa
-def capture_face_with_mesa(save_path="captured_frame.jpg"):
-    model = FaceCaptureModel(num_agents=1, save_path=save_path)
+# Function to initiate the video capture and capture a frame using Mesa; returns True if a frame was saved
+def capture_face_with_mesa(save_path="captured_frame.jpg", source=0, auto_capture=True, display=True):
+    model = FaceCaptureModel(num_agents=1, save_path=save_path, source=source,
+                             auto_capture=auto_capture, display=display)
 
     while True:
         model.step()
@@ -81,6 +119,7 @@ def capture_face_with_mesa(save_path="captured_frame.jpg"):
     # Stop the video capture
     for agent in model.schedule.agents:
         agent.stop_video_capture()
+    return any(agent.is_capturing for agent in model.schedule.agents)
 
 # Example usage
 if __name__ == "__main__":
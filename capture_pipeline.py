@@ -0,0 +1,358 @@
+"""Threaded, low-latency frame capture for the face capture window.
+
+Reading the camera, showing the frame and polling the keyboard in one loop
+on the calling thread makes every stage wait for the others and keeps a core
+busy even when nothing happens.  ``CapturePipeline`` splits the work:
+
+* a grabber thread reads frames as fast as the source delivers them and keeps
+  only the latest one, so the window never shows a stale, queued-up frame;
+* a detector thread looks for faces (``face_recognition``'s HOG detector, the
+  one that later encodes the captured face) in a downscaled copy of the latest
+  frame at most ``DETECTION_FPS`` times a second;
+* whoever displays the frames blocks until a new one arrives instead of
+  spinning.
+
+Each detected face is scored for sharpness (Laplacian variance of the face
+crop at full resolution, normalised to ``FACE_SIZE``).  The sharpest frame
+seen so far is kept, and once a face scores ``SHARPNESS_THRESHOLD`` or more
+the pipeline reports it as captured.
+
+Sources are pluggable: a camera index, a video file, a folder of images or a
+glob pattern (see ``open_source``), so recorded footage can stand in for the
+camera in tests and benchmarks.  File sources play back at ``fps`` frames a
+second like a camera would, or as fast as they decode with ``fps=0``.
+"""
+import glob
+import os
+import threading
+import time
+
+import cv2
+
+from metrics import get_metrics
+from scanner import IMAGE_EXTENSIONS
+
+DETECTION_WIDTH = 320  # Width of the copy that face detection runs on
+DETECTION_FPS = 5.0  # Most face detections per second
+SHARPNESS_THRESHOLD = 100.0  # Face crops at least this sharp are captured automatically
+FACE_SIZE = 128  # Side of the square face crop that sharpness is measured on
+MIN_FACE_SIZE = 24  # Smallest face, in detection-copy pixels, worth reporting
+DEFAULT_FILE_FPS = 30.0  # Playback rate of image sequences and videos without one
+
+
+class FrameSource:
+    """Base class of frame sources; ``read()`` returns a BGR frame, or None once exhausted.
+
+    ``fps`` paces file sources like a camera; None or 0 reads as fast as possible.
+    """
+
+    def __init__(self, fps=None):
+        self.fps = fps
+        self._due = None
+
+    def read(self):
+        frame = self._read()
+        if frame is not None and self.fps:
+            now = time.monotonic()
+            # A source that fell behind resumes from now instead of bursting to catch up
+            self._due = now if self._due is None else max(self._due + 1.0 / self.fps, now)
+            time.sleep(self._due - now)
+        return frame
+
+    def _read(self):
+        raise NotImplementedError
+
+    def release(self):
+        """Free the device or file handle."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class CameraSource(FrameSource):
+    """Frames from a camera; the device paces the reads itself."""
+
+    def __init__(self, index=0):
+        super().__init__()
+        self.cap = cv2.VideoCapture(index)
+        if not self.cap.isOpened():
+            raise OSError(f"Could not open video stream {index}.")
+        # Where the backend supports it, keep the driver from queueing frames we would drop anyway
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def _read(self):
+        ok, frame = self.cap.read()
+        return frame if ok else None
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    """Frames from a video file, played back at its own frame rate unless ``fps`` is given."""
+
+    def __init__(self, path, fps=None, loop=False):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise OSError(f"Could not open video file {path}.")
+        if fps is None:
+            fps = self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FILE_FPS
+        super().__init__(fps)
+        self.loop = loop
+
+    def _read(self):
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return frame if ok else None
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageSequenceSource(FrameSource):
+    """Frames from a list of image files, a folder of images or a glob pattern."""
+
+    def __init__(self, images, fps=DEFAULT_FILE_FPS, loop=False):
+        super().__init__(fps)
+        if isinstance(images, str):
+            if os.path.isdir(images):
+                images = [
+                    os.path.join(images, name) for name in os.listdir(images)
+                    if name.lower().endswith(IMAGE_EXTENSIONS)
+                ]
+            else:
+                images = glob.glob(images)
+            images = sorted(images)
+        self.paths = list(images)
+        if not self.paths:
+            raise OSError("The image sequence is empty.")
+        self.loop = loop
+        self.position = 0
+
+    def _read(self):
+        while True:
+            if self.position >= len(self.paths):
+                if not self.loop:
+                    return None
+                self.position = 0
+            path = self.paths[self.position]
+            self.position += 1
+            frame = cv2.imread(path)
+            if frame is not None:
+                return frame
+            print(f"Unable to read frame {path}")
+
+
+def open_source(source=0, fps=None, loop=False):
+    """A ``FrameSource`` for a camera index, video file, image folder or glob pattern.
+
+    ``FrameSource`` instances are returned unchanged.  ``fps`` and ``loop``
+    only apply to file sources.
+    """
+    if isinstance(source, FrameSource):
+        return source
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        return CameraSource(int(source))
+    if os.path.isdir(source) or glob.has_magic(source):
+        return ImageSequenceSource(source, DEFAULT_FILE_FPS if fps is None else fps, loop)
+    if os.path.splitext(source)[1].lower() in IMAGE_EXTENSIONS:
+        return ImageSequenceSource([source], DEFAULT_FILE_FPS if fps is None else fps, loop)
+    return VideoFileSource(source, fps, loop)
+
+
+class FrameGrabber:
+    """Reads a source on a background thread, keeping only the latest frame.
+
+    Frames are numbered; ``wait_frame(after)`` blocks until a frame newer
+    than ``after`` arrives, so consumers never spin and never see a frame
+    twice.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.frame = None
+        self.sequence = 0  # Number of the latest frame; 0 before the first one
+        self.grabbed_at = None  # time.monotonic() of the latest frame
+        self.finished = False  # The source is exhausted, failed or the grabber was stopped
+        self.error = None
+        self._consumed = 0  # Newest frame number handed out by wait_frame
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.source.release()
+        self._finish()
+
+    def _finish(self):
+        with self._condition:
+            self.finished = True
+            self._condition.notify_all()
+
+    def _run(self):
+        metrics = get_metrics()
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                frame = self.source.read()
+                if frame is None:
+                    break
+                metrics.observe("capture.grab", time.perf_counter() - start, frame.nbytes)
+                with self._condition:
+                    if self._consumed < self.sequence:
+                        metrics.count("capture.frames_dropped")  # Replaced before anyone saw it
+                    self.frame = frame
+                    self.sequence += 1
+                    self.grabbed_at = time.monotonic()
+                    self._condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finish()
+
+    def wait_frame(self, after=0, timeout=None):
+        """``(number, frame)`` of the first frame newer than ``after``, or None.
+
+        None means the source is finished, or ``timeout`` seconds passed.
+        Frames are shared and must not be modified.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.sequence > after or self.finished, timeout):
+                return None
+            if self.sequence <= after:
+                return None
+            self._consumed = max(self._consumed, self.sequence)
+            return self.sequence, self.frame
+
+
+def face_sharpness(gray, box):
+    """Laplacian variance of the face ``box`` (x, y, w, h) of a grayscale frame, at ``FACE_SIZE``."""
+    x, y, w, h = box
+    crop = gray[y:y + h, x:x + w]
+    if crop.size == 0:
+        return 0.0
+    crop = cv2.resize(crop, (FACE_SIZE, FACE_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(crop, cv2.CV_64F).var())
+
+
+class FaceDetector:
+    """HOG face detection on a downscaled copy of each frame."""
+
+    def __init__(self, width=DETECTION_WIDTH):
+        # Imported lazily so the sources and the grabber work without dlib
+        import face_recognition
+
+        self._face_locations = face_recognition.face_locations
+        self.width = width
+
+    def detect(self, frame):
+        """Faces in a BGR frame as ``[(x, y, w, h, sharpness)]`` in frame pixels, sharpest first."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        scale = min(1.0, self.width / gray.shape[1])
+        small = frame if scale == 1.0 else cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        faces = []
+        for top, right, bottom, left in self._face_locations(cv2.cvtColor(small, cv2.COLOR_BGR2RGB)):
+            if min(right - left, bottom - top) < MIN_FACE_SIZE:
+                continue
+            # Boxes are mapped back to full resolution, where the sharpness is measured
+            box = (max(0, int(left / scale)), max(0, int(top / scale)),
+                   int((right - left) / scale), int((bottom - top) / scale))
+            faces.append(box + (face_sharpness(gray, box),))
+        faces.sort(key=lambda face: -face[4])
+        return faces
+
+
+class CapturePipeline:
+    """Grabber plus rate-limited face detection and automatic capture of a sharp face.
+
+    ``faces`` holds the latest detections, ``best_frame`` / ``best_sharpness``
+    the sharpest face seen so far, and ``captured`` is set once a face reaches
+    ``sharpness_threshold`` (when ``auto_capture`` is on).
+    """
+
+    def __init__(self, source=0, detect_fps=DETECTION_FPS, sharpness_threshold=SHARPNESS_THRESHOLD,
+                 auto_capture=True, detector=None):
+        self.grabber = FrameGrabber(open_source(source))
+        self.detector = detector or FaceDetector()
+        self.detect_fps = detect_fps
+        self.sharpness_threshold = sharpness_threshold
+        self.auto_capture = auto_capture
+        self.faces = []
+        self.best_frame = None
+        self.best_sharpness = 0.0
+        self.captured = threading.Event()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.grabber.start()
+        self._thread = threading.Thread(target=self._detect_loop, name="face-detector", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.grabber.stop()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def finished(self):
+        return self.grabber.finished
+
+    def wait_frame(self, after=0, timeout=None):
+        """See ``FrameGrabber.wait_frame``."""
+        return self.grabber.wait_frame(after, timeout)
+
+    def latest_faces(self):
+        with self._lock:
+            return list(self.faces)
+
+    def best(self):
+        """``(frame, sharpness)`` of the sharpest face seen so far; the frame is None before the first face."""
+        with self._lock:
+            return self.best_frame, self.best_sharpness
+
+    def _detect_loop(self):
+        metrics = get_metrics()
+        interval = 1.0 / self.detect_fps if self.detect_fps else 0.0
+        sequence = 0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            latest = self.grabber.wait_frame(sequence, timeout=0.5)
+            if latest is None:
+                if self.grabber.finished:
+                    break
+                continue
+            sequence, frame = latest
+            with metrics.timer("capture.detect"):
+                faces = self.detector.detect(frame)
+            with self._lock:
+                self.faces = faces
+                if faces and faces[0][4] > self.best_sharpness:
+                    self.best_frame, self.best_sharpness = frame, faces[0][4]
+            if faces and self.auto_capture and faces[0][4] >= self.sharpness_threshold:
+                metrics.count("capture.auto")
+                self.captured.set()
+            # Sleep off the rest of the detection interval; frames that arrive meanwhile are skipped
+            self._stop.wait(max(0.0, started + interval - time.monotonic()))
@@ -0,0 +1,240 @@
+"""Headless command-line entry point for the cleanup jobs.
+
+Runs the duplicate, blur, age and face jobs without importing any GUI
+toolkit, so cleanups can run on servers or from cron.  Heavy modules (Mesa,
+OpenCV, imagehash, face_recognition) are only imported once the selected job
+needs them.
+
+Examples:
+    python cli.py duplicates ~/Pictures --recursive --dry-run
+    python cli.py blur ~/Pictures --threshold 80 --workers 0
+    python cli.py blur ~/Pictures --metric reblur
+    python cli.py old ~/Pictures --before "2023-01-01 00:00:00"
+    python cli.py faces ~/Pictures --reference me.jpg --index
+    python cli.py faces ~/Pictures --reference mum=mum.jpg dad=dad.jpg
+    python cli.py shard /mnt/photos --queue /mnt/photos-job --workers 4 --dry-run
+    python cli.py shard /mnt/photos --queue /mnt/photos-job --join
+    python cli.py duplicates ~/Pictures --metrics report.json
+"""
+import argparse
+import datetime
+import os
+import sys
+
+from metrics import get_metrics, timed_remove
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def remove_files(paths, dry_run):
+    """Delete ``paths`` (or just list them on a dry run); returns the number handled."""
+    count = 0
+    for path in paths:
+        if dry_run:
+            print(path)
+            count += 1
+            continue
+        try:
+            timed_remove(path)
+            print(f"Removed {path}")
+            count += 1
+        except OSError as e:
+            print(f"Unable to remove {path}: {e}", file=sys.stderr)
+    return count
+
+
+def step_model(model):
+    """Run one full step of ``model``; Ctrl+C cancels it and checkpoints the finished files."""
+    try:
+        model.step()
+    except KeyboardInterrupt:
+        model.cancel()
+        model.step()  # Only records what was analysed before the interrupt
+        print(f"Interrupted at {model.progress:.0%}.", file=sys.stderr)
+        sys.exit(130)
+
+
+def run_duplicates(args):
+    from Duplicates import ImageCleanupModel
+
+    model = ImageCleanupModel(args.folder, args.workers, args.recursive, args.incremental)
+    step_model(model)
+    count = remove_files(model.duplicates, args.dry_run)
+    print(f"{count} duplicate images {'found' if args.dry_run else 'removed'}.")
+
+
+def run_blur(args):
+    from lowQuality import ImageCleanupModel
+
+    model = ImageCleanupModel(
+        args.folder, args.threshold, args.workers, args.recursive, args.incremental,
+        delete_files=not args.dry_run, metric=args.metric,
+    )
+    step_model(model)
+    blurry = model.get_blurry_images()
+    print(f"{len(blurry)} blurry images {'found' if args.dry_run else 'removed'}.")
+
+
+def run_old(args):
+    cutoff = datetime.datetime.strptime(args.before, DATE_FORMAT)
+    if args.mesa:
+        from OldImages import FileCleanupModel
+
+        model = FileCleanupModel(args.folder, args.before, args.recursive)
+        step_model(model)
+        old_files = model.old_files
+    else:
+        # The plain scan needs neither Mesa nor any imaging library
+        from scanner import files_older_than
+
+        old_files = [entry.path for entry in files_older_than(args.folder, cutoff.timestamp(), recursive=args.recursive)]
+    count = remove_files(old_files, args.dry_run)
+    print(f"{count} files older than {args.before} {'found' if args.dry_run else 'removed'}.")
+
+
+def parse_references(values):
+    """``--reference`` values as a {name: path} dict; ``NAME=PATH`` names an identity, plain paths use the file name."""
+    named = {}
+    paths = []
+    for value in values:
+        name, sep, path = value.partition("=")
+        if sep and name and not os.path.exists(value):
+            named[name] = path
+        else:
+            paths.append(value)
+    if not named:
+        return paths if len(paths) > 1 else paths[0]
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, attempt = stem, 1
+        while name in named:
+            attempt += 1
+            name = f"{stem} ({attempt})"
+        named[name] = path
+    return named
+
+
+def run_faces(args):
+    references = parse_references(args.reference)
+    if args.index:
+        from face_index import match_faces_with_index
+
+        matches, summary = match_faces_with_index(
+            references, args.folder, args.output, args.tolerance, recursive=args.recursive,
+            export_mode=args.export_mode,
+        )
+    else:
+        from compare_face import match_faces
+
+        matches, summary = match_faces(
+            references, args.folder, args.output, args.tolerance, args.workers, args.recursive,
+            export_mode=args.export_mode,
+        )
+    print(f"{len(matches)} matching images exported to {args.output} ({summary}).")
+
+
+def run_shard(args):
+    import sharding
+
+    if args.join:
+        count = sharding.run_worker(args.queue)
+        print(f"{count} shards analysed.")
+        return
+    scan = sharding.run_sharded_scan(
+        args.folder, args.queue, args.workers, args.shard_size, args.recursive, args.threshold,
+        restart=args.restart,
+    )
+    for path, error in scan.errors:
+        print(f"Unable to analyse {path}: {error}", file=sys.stderr)
+    paths = scan.duplicates
+    if args.blurred:
+        duplicates = set(scan.duplicates)
+        paths = paths + [path for path in scan.blurred if path not in duplicates]
+    count = remove_files(paths, args.dry_run)
+    kinds = "duplicate or blurry" if args.blurred else "duplicate"
+    print(f"{count} {kinds} images {'found' if args.dry_run else 'removed'} among {scan.images}.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Smart Image Cleanup Tool (headless).")
+    jobs = parser.add_subparsers(dest="job", required=True)
+
+    def add_job(name, handler, help_text):
+        job = jobs.add_parser(name, help=help_text)
+        job.add_argument("folder", help="Image folder to process")
+        job.add_argument("-r", "--recursive", action="store_true", help="Include subfolders")
+        job.add_argument(
+            "--metrics", metavar="PATH",
+            help="Write per-stage timings to PATH (.json for JSON, otherwise Prometheus text)",
+        )
+        job.set_defaults(handler=handler)
+        return job
+
+    def add_analysis_options(job):
+        job.add_argument("--workers", type=int, default=1, help="Worker processes (0 = one per CPU)")
+        job.add_argument("--incremental", action="store_true", help="Only analyse new or changed files")
+        job.add_argument("--fast", action="store_true", help="Decode JPEGs at reduced resolution")
+        job.add_argument("--dry-run", action="store_true", help="List files instead of deleting them")
+
+    duplicates = add_job("duplicates", run_duplicates, "Remove duplicate images")
+    add_analysis_options(duplicates)
+
+    blur = add_job("blur", run_blur, "Remove blurry images")
+    blur.add_argument("--threshold", type=float, help="Blur score threshold (default: 100, or the metric's default)")
+    blur.add_argument(
+        "--metric", choices=("laplacian", "reblur", "fft"),
+        help="Score batched thumbnails with this metric instead of full-resolution Laplacian variance",
+    )
+    add_analysis_options(blur)
+
+    old = add_job("old", run_old, "Remove files modified before a cutoff")
+    old.add_argument("--before", required=True, help="Cutoff time (YYYY-MM-DD HH:MM:SS)")
+    old.add_argument("--mesa", action="store_true", help="Run through the Mesa FileCleanupModel")
+    old.add_argument("--dry-run", action="store_true", help="List files instead of deleting them")
+
+    faces = add_job("faces", run_faces, "Copy images matching one or more reference faces")
+    faces.add_argument(
+        "--reference", required=True, nargs="+", metavar="[NAME=]IMAGE",
+        help="Reference face image(s); with several, each identity's matches go to its own subfolder",
+    )
+    faces.add_argument("--output", default="matched_images", help="Folder for matched images")
+    faces.add_argument("--tolerance", type=float, default=0.5)
+    faces.add_argument("--workers", type=int, default=1, help="Worker processes (0 = one per CPU)")
+    faces.add_argument("--index", action="store_true", help="Use the persistent face index")
+    faces.add_argument(
+        "--export-mode", choices=("auto", "reflink", "hardlink", "symlink", "copy"), default="auto",
+        help="How matches are placed in the output folder (auto: reflink, else hardlink, else copy)",
+    )
+
+    shard = add_job("shard", run_shard, "Remove duplicates with worker processes or hosts sharing the folder")
+    shard.add_argument("--queue", required=True, metavar="DIR", help="Job folder every worker can reach")
+    shard.add_argument("--join", action="store_true", help="Only work on the shards of a running job")
+    shard.add_argument("--restart", action="store_true", help="Discard the job already in --queue and scan again")
+    shard.add_argument("--shard-size", type=int, default=256, help="Files per shard")
+    shard.add_argument("--threshold", type=float, default=100, help="Blur score threshold")
+    shard.add_argument("--blurred", action="store_true", help="Also remove blurry images")
+    shard.add_argument("--workers", type=int, default=2, help="Local worker processes (0 = one per CPU)")
+    shard.add_argument("--fast", action="store_true", help="Decode JPEGs at reduced resolution")
+    shard.add_argument("--dry-run", action="store_true", help="List files instead of deleting them")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.isdir(args.folder):
+        print(f"Error: The specified folder does not exist: {args.folder}", file=sys.stderr)
+        return 2
+    if getattr(args, "fast", False):
+        os.environ["SMART_CLEANUP_FAST_DECODE"] = "1"
+    try:
+        return args.handler(args) or 0
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.metrics:
+            get_metrics().write(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Near-duplicate clustering with quality-based keeper selection.
+
+Every hashed image is looked up in a BK-tree and unioned with all neighbours
+within the distance threshold, so chains of similar images end up in one
+connected component (union-find with path halving and union by size, i.e.
+near-linear in the number of pairs).  Each component keeps exactly one image,
+the best one by ``keeper_rank``: highest resolution, then sharpest (cached
+blur score), then largest file, then the smallest path.  Everything else in
+the component is a duplicate.
+
+Clusters are maintained incrementally: when a better image joins a cluster
+the previous keeper is demoted, so the result does not depend on the order in
+which images are added.
+"""
+import os
+
+from analysis_cache import get_default_cache
+from hash_index import BKTree
+
+
+def keeper_rank(path, analysis=None, st=None):
+    """Sort key ranking copies of one image; the smallest key is kept.
+
+    Uses the ``ImageAnalysis`` when given, otherwise whatever the analysis
+    cache knows about ``path``.  Unknown fields rank lowest.
+    """
+    width = height = blur = None
+    size = analysis.size if analysis else None
+    if analysis:
+        width, height, blur = analysis.width, analysis.height, analysis.blur
+    else:
+        cache = get_default_cache()
+        entry = cache.get(path, st) if cache is not None else None
+        if entry:
+            width, height, blur = entry["width"], entry["height"], entry["blur"]
+    if size is None:
+        try:
+            size = (st or os.stat(path)).st_size
+        except OSError:
+            size = 0
+    return (-(width or 0) * (height or 0), -(blur if blur is not None else -1.0), -size, path)
+
+
+class UnionFind:
+    """Disjoint sets over arbitrary hashable items."""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]  # Path halving
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        """Merge the sets of ``a`` and ``b``; returns the new root."""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size.pop(root_b)
+        return root_a
+
+
+class DuplicateClusters:
+    """Incrementally clusters hashed items and tracks the keeper of each cluster."""
+
+    def __init__(self, max_distance=0):
+        self.max_distance = max_distance  # Largest Hamming distance still counted as a duplicate
+        self.index = BKTree()
+        self.sets = UnionFind()
+        self.ranks = {}
+        self.keepers = {}  # Set root -> kept item
+
+    def __len__(self):
+        return len(self.ranks)
+
+    def __contains__(self, item):
+        return item in self.ranks
+
+    def add(self, image_hash, item, rank):
+        """Add ``item`` with its ``keeper_rank``; returns earlier items it demoted to duplicates."""
+        self.ranks[item] = rank
+        self.sets.add(item)
+        self.keepers[item] = item
+        demoted = []
+        for _, other in self.index.find(image_hash, self.max_distance):
+            loser = self._merge(item, other)
+            if loser is not None and loser != item:
+                demoted.append(loser)
+        self.index.add(image_hash, item)
+        return demoted
+
+    def _merge(self, a, b):
+        """Union the clusters of ``a`` and ``b``; returns the keeper that lost, if any."""
+        root_a, root_b = self.sets.find(a), self.sets.find(b)
+        if root_a == root_b:
+            return None
+        keeper_a, keeper_b = self.keepers.pop(root_a), self.keepers.pop(root_b)
+        if self.ranks[keeper_a] <= self.ranks[keeper_b]:
+            winner, loser = keeper_a, keeper_b
+        else:
+            winner, loser = keeper_b, keeper_a
+        self.keepers[self.sets.union(root_a, root_b)] = winner
+        return loser
+
+    def keeper(self, item):
+        """The item kept in ``item``'s cluster."""
+        return self.keepers[self.sets.find(item)]
+
+    def is_duplicate(self, item):
+        return self.keeper(item) != item
+
+    def duplicates(self):
+        """Every item that is not the keeper of its cluster."""
+        return [item for item in self.ranks if self.is_duplicate(item)]
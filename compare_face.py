@@ -1,92 +1,270 @@
 import face_recognition
+import csv
 import os
-import shutil
+import time
+import cv2
+import numpy as np
 from mesa import Agent, Model
-from mesa.time import RandomActivation
-from tkinter import messagebox
+from analysis_cache import get_default_cache
+from export import Exporter
+from metrics import get_metrics
+from stepping import SteppedModel
+from parallel import make_activation
+from scanner import scan_images
+DETECTION_MAX_SIZE = 800  # Longest side of the copy that face detection runs on
+REPORT_NAME = "matches.csv"  # Match report written into the output folder
 
-# Agent to compare faces in an image
+# Detect faces on a downscaled copy and map the boxes back to full resolution
+def detect_faces(image, max_size=DETECTION_MAX_SIZE):
+    height, width = image.shape[:2]
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return face_recognition.face_locations(image)
+
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    locations = []
+    for top, right, bottom, left in face_recognition.face_locations(small):
+        locations.append((
+            max(0, int(round(top / scale))),
+            min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))),
+            max(0, int(round(left / scale))),
+        ))
+    return locations
+
+# Face boxes and encodings of every face in an image
+def locate_and_encode_faces(image_path):
+    image = face_recognition.load_image_file(image_path)
+    locations = detect_faces(image)
+    return locations, face_recognition.face_encodings(image, known_face_locations=locations)
+
+# Face encodings of every face in an image, reusing the analysis cache when possible
+def encode_faces(image_path):
+    cache = get_default_cache()
+    encodings = cache.get_faces(image_path) if cache is not None else None
+    if encodings is None:
+        with get_metrics().timer("faces", image_path, os.path.getsize(image_path)):
+            _, encodings = locate_and_encode_faces(image_path)
+        if cache is not None:
+            cache.put_faces(image_path, encodings)
+    return encodings
+
+# encode_faces plus the time it took, so throughput can be reported
+def encode_faces_timed(image_path):
+    start = time.perf_counter()
+    encodings = encode_faces(image_path)
+    return encodings, time.perf_counter() - start
+
+# Names and face encodings of the reference identities. references is one image path, a list of
+# paths (named after their files) or a {name: path} dict; a reference without a face is skipped.
+# Names are used as folder names, so ones that are not a single path component raise ValueError
+def load_references(references):
+    if isinstance(references, str):
+        references = [references]
+    if not isinstance(references, dict):
+        named = {}
+        for path in references:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            name, attempt = stem, 1
+            while name in named:  # Same file name in different folders
+                attempt += 1
+                name = f"{stem} ({attempt})"
+            named[name] = path
+        references = named
+
+    names, encodings = [], []
+    for name, path in references.items():
+        # Names become folder names under the output folder, so they must stay a single path component
+        if name in ("", ".", "..") or os.sep in name or (os.altsep and os.altsep in name):
+            raise ValueError(f"Invalid identity name {name!r}: it must be a plain folder name.")
+        found = encode_faces(path)
+        if not len(found):
+            if len(references) > 1:
+                print(f"No face found in the reference image {path}. Skipping.")
+            continue
+        names.append(name)
+        encodings.append(found[0])
+    return names, np.array(encodings, dtype=np.float64).reshape(len(names), -1)
+
+# Distances between every face of an image (rows) and every reference identity (columns) in one
+# vectorised step; the same Euclidean distance face_recognition.face_distance computes
+def face_distance_matrix(encodings, reference_encodings):
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, reference_encodings.shape[1])
+    return np.linalg.norm(encodings[:, None, :] - reference_encodings[None, :, :], axis=2)
+
+# Output folder of each identity: the output folder itself for a single reference, otherwise a subfolder per identity
+def identity_folders(output_folder, names):
+    if len(names) == 1:
+        return {names[0]: output_folder}
+    return {name: os.path.join(output_folder, name) for name in names}
+
+# Human-readable count of exported files per method, per identity when there are several ({name: Exporter})
+def summarize_exports(exporters):
+    if not exporters:
+        return "nothing exported"
+    if len(exporters) == 1:
+        return next(iter(exporters.values())).summary()
+    return "; ".join(f"{name}: {exporter.summary()}" for name, exporter in exporters.items())
+
+# Write the match report: one CSV row per (image, identity) match, closest first within each identity
+def write_match_report(path, matches):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["identity", "image", "distance", "face", "exported_as"])
+        for image, identity, distance, face, exported in sorted(matches, key=lambda m: (m[1], m[2], m[0])):
+            writer.writerow([identity, image, f"{distance:.4f}", face, exported])
+
+# Agent to compare the faces in an image with every reference identity
 class FaceComparisonAgent(Agent):
-    def __init__(self, unique_id, model, image_path, folder_path, reference_encoding, output_folder="matched_images", tolerance=0.5):
+    def __init__(self, unique_id, model, image_path, folder_path, reference_encodings, output_folder="matched_images", tolerance=0.5):
         super().__init__(unique_id, model)
         self.image_path = image_path
         self.folder_path = folder_path
-        self.reference_encoding = reference_encoding
+        self.reference_encodings = reference_encodings  # One row per identity, in model.identities order
         self.output_folder = output_folder
         self.tolerance = tolerance
         self.has_matched = False
+        self.matched_identities = []
+        self.processed = False  # Each image is compared exactly once
+        self.encodings = None  # Face encodings, possibly computed by a worker process
+        self.elapsed = 0.0  # Seconds spent encoding this image
+        self.failed = False  # The image could not be decoded or encoded
+
+    def work_input(self):
+        return self.image_path if self.encodings is None and not (self.processed or self.failed) else None
+
+    def work_done(self, result):
+        if isinstance(result, Exception):
+            print(f"Unable to process {self.image_path}: {result}")
+            self.failed = True
+        else:
+            self.encodings, self.elapsed = result
     
     def compare_face(self):
-        """Compare the agent's image with the reference image"""
-        # Load current image and get face encodings
-        current_image = face_recognition.load_image_file(self.image_path)
-        current_encodings = face_recognition.face_encodings(current_image)
+        """Compare every face in the agent's image with every reference identity.
 
-        if not current_encodings:
+        Returns ``(identity index, distance, face index)`` for each identity
+        that some face is within ``tolerance`` of, using its closest face.
+        """
+        # Load current image and get face encodings, unless already computed or a worker failed on it
+        if self.failed:
+            return []
+        if self.encodings is None:
+            try:
+                self.encodings, self.elapsed = encode_faces_timed(self.image_path)
+            except Exception as e:
+                print(f"Unable to process {self.image_path}: {e}")
+                self.failed = True
+                return []
+        print(f"Encoded {self.image_path} in {self.elapsed:.3f}s")
+        current_encodings = self.encodings
+
+        if not len(current_encodings):
             print(f"No face found in {self.image_path}. Skipping.")
-            return False
+            return []
 
-        # Compare the faces with specified tolerance
-        match_result = face_recognition.compare_faces([self.reference_encoding], current_encodings[0], tolerance=self.tolerance)
-        return match_result[0]
+        # Faces x identities; each identity is matched by its closest face (same test as face_recognition.compare_faces)
+        distances = face_distance_matrix(current_encodings, self.reference_encodings)
+        closest_faces = distances.argmin(axis=0)
+        closest = distances[closest_faces, np.arange(distances.shape[1])]
+        return [
+            (int(identity), float(closest[identity]), int(closest_faces[identity]))
+            for identity in np.flatnonzero(closest <= self.tolerance)
+        ]
 
     def move_image(self):
-        """Move the image to the output folder if matched"""
-        if self.compare_face():
-            print(f"Face matched with {self.image_path}")
-            if not os.path.exists(self.output_folder):
-                os.makedirs(self.output_folder)
-            shutil.copy(self.image_path, os.path.join(self.output_folder, os.path.basename(self.image_path)))
-            self.has_matched = True
-        else:
+        """Export the image to the folder of each matched identity (linked rather than copied where possible)"""
+        for identity, distance, face in self.compare_face():
+            name = self.model.identities[identity]
+            print(f"Face matched with {self.image_path} ({name}, distance {distance:.3f})")
+            with get_metrics().timer("export", self.image_path):
+                exported = self.model.exporters[name].export(self.image_path)
+            self.model.matches.append((self.image_path, name, distance, face, exported))
+            self.matched_identities.append(name)
+            get_metrics().count("face_match")
+        self.has_matched = bool(self.matched_identities)
+        if not self.has_matched:
             print(f"No match for {self.image_path}")
 
     def step(self):
         """Run the agent's logic: compare and move the image if a match is found"""
+        if self.processed:
+            return
         self.move_image()
+        self.processed = True
+        self.encodings = None  # Release memory once the verdict is known
+
+# Model to match the faces of a gallery against one or more reference identities in a single pass;
+# step() can be time-sliced and cancelled (see stepping.py)
+class FaceComparisonModel(SteppedModel, Model):
+    stage = "model.faces"
 
-# Model to manage the face comparison process
-class FaceComparisonModel(Model):
-    def __init__(self, folder_path, reference_image_path, output_folder="matched_images", tolerance=0.5):
+    def __init__(self, folder_path, reference_image_path, output_folder="matched_images", tolerance=0.5, workers=1, recursive=False,
+                 export_mode="auto"):
         self.folder_path = folder_path
-        self.reference_image_path = reference_image_path
+        self.reference_image_path = reference_image_path  # A path, a list of paths or a {name: path} dict
         self.output_folder = output_folder
         self.tolerance = tolerance
-        self.schedule = RandomActivation(self)
+        self.schedule = make_activation(self, encode_faces_timed, workers)
+        self.matches = []  # (image, identity, distance, face, exported path) rows of the match report
 
-        # Load reference image and get face encoding
-        reference_image = face_recognition.load_image_file(self.reference_image_path)
-        reference_encodings = face_recognition.face_encodings(reference_image)
-        
-        if not reference_encodings:
+        # Load the reference images and get one face encoding per identity
+        self.identities, self.reference_encodings = load_references(reference_image_path)
+        # Matches of each identity are exported to its own folder; see export.EXPORT_MODES
+        self.exporters = {
+            name: Exporter(folder, export_mode) for name, folder in identity_folders(output_folder, self.identities).items()
+        }
+
+        if not self.identities:
             print("No face found in the reference image.")
             return
 
-        self.reference_encoding = reference_encodings[0]
-
-        # Create agents for each image in the folder
-        for idx, filename in enumerate(os.listdir(self.folder_path)):
-            file_path = os.path.join(self.folder_path, filename)
-            agent = FaceComparisonAgent(idx, self, file_path, self.folder_path, self.reference_encoding, self.output_folder, self.tolerance)
+        # Create agents for each image in the folder, skipping non-image files up front
+        for idx, entry in enumerate(scan_images(self.folder_path, recursive)):
+            agent = FaceComparisonAgent(idx, self, entry.path, self.folder_path, self.reference_encodings, self.output_folder, self.tolerance)
             self.schedule.add(agent)
 
-    def step(self):
-        """Run a step for all agents"""
-        self.schedule.step()
+    def export_summary(self):
+        """Human-readable count of exported files per identity and method."""
+        return summarize_exports(self.exporters)
 
-# Function to run the model and compare faces
-def compare_faces_with_mesa(reference_image_path, folder_path, output_folder="matched_images", tolerance=0.5):
-    model = FaceComparisonModel(folder_path, reference_image_path, output_folder, tolerance)
-    has_matches = False
+    def write_report(self, path=None):
+        """Write the match report (``REPORT_NAME`` in the output folder by default) and return its path."""
+        path = path or os.path.join(self.output_folder, REPORT_NAME)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        write_match_report(path, self.matches)
+        return path
 
-    # Run the model for several steps (to process each agent)
-    for _ in range(len(os.listdir(folder_path))):
-        model.step()
-    
-    # Check if any images were matched and copied
-    for agent in model.schedule.agents:
-        if agent.has_matched:
-            has_matches = True
+    def throughput(self):
+        """Return (images processed, total encoding seconds, images per second)."""
+        agents = [agent for agent in self.schedule.agents if agent.processed]
+        total = sum(agent.elapsed for agent in agents)
+        rate = len(agents) / total if total > 0 else 0.0
+        return len(agents), total, rate
+
+# Function to run the model; returns the matched image paths (matching any identity) and the export summary.
+# reference_image_path may be a list of paths or a {name: path} dict to find several people in one pass
+def match_faces(reference_image_path, folder_path, output_folder="matched_images", tolerance=0.5, workers=1, recursive=False,
+                export_mode="auto"):
+    model = FaceComparisonModel(folder_path, reference_image_path, output_folder, tolerance, workers, recursive, export_mode)
+
+    # A single step processes every image once
+    model.step()
+    count, seconds, rate = model.throughput()
+    print(f"Encoded {count} images in {seconds:.2f}s ({rate:.1f} images/s)")
+    print(f"Exported matches to {output_folder}: {model.export_summary()}")
+    if model.matches:
+        for name in model.identities:
+            print(f"{name}: {sum(1 for match in model.matches if match[1] == name)} images")
+        print(f"Match report written to {model.write_report()}")
+
+    return [agent.image_path for agent in model.schedule.agents if agent.has_matched], model.export_summary()
+
+# Function to run the model and compare faces
+def compare_faces_with_mesa(reference_image_path, folder_path, output_folder="matched_images", tolerance=0.5, workers=1, recursive=False):
+    from tkinter import messagebox  # Imported lazily so headless callers never load tkinter
+    matches, _ = match_faces(reference_image_path, folder_path, output_folder, tolerance, workers, recursive)
+    has_matches = bool(matches)
 
     if has_matches:
         messagebox.showinfo("Info", "Successfully completed")
@@ -0,0 +1,71 @@
+"""Byte-identical duplicate detection without decoding.
+
+Repeated backups mostly produce exact copies, which do not need a perceptual
+hash to be recognised.  Files are grouped by size first; only files that share
+a size have their first and last ``BLOCK_SIZE`` bytes hashed, and only files
+whose partial digests also collide are hashed in full.  Most files are
+therefore never read at all, and the ones that are read are never decoded.
+"""
+import hashlib
+import os
+from collections import defaultdict
+
+from metrics import get_metrics
+
+BLOCK_SIZE = 64 * 1024
+
+
+def _digest(path, size, full):
+    """BLAKE2b of the first and last block of ``path``, or of the whole file."""
+    digest = hashlib.blake2b(digest_size=16)
+    whole = full or size <= 2 * BLOCK_SIZE
+    with get_metrics().timer("digest", path, size if whole else 2 * BLOCK_SIZE):
+        with open(path, "rb") as f:
+            if whole:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            else:
+                digest.update(f.read(BLOCK_SIZE))
+                f.seek(-BLOCK_SIZE, os.SEEK_END)
+                digest.update(f.read(BLOCK_SIZE))
+    return digest.digest()
+
+
+def _split(paths, key):
+    """Group ``paths`` by ``key(path)``, dropping unreadable files and singletons."""
+    groups = defaultdict(list)
+    for path in paths:
+        try:
+            groups[key(path)].append(path)
+        except OSError as e:
+            print(f"Unable to read {path}: {e}")
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_exact_duplicates(files):
+    """Map every byte-identical copy to the first file (in ``files`` order) it duplicates.
+
+    ``files`` is an iterable of ``(path, size)`` pairs, e.g. from a directory
+    scan.  Files that are not in the result are unique (or the first of their
+    copies) and still need a perceptual check.
+    """
+    order = {}
+    by_size = defaultdict(list)
+    for path, size in files:
+        order[path] = len(order)
+        by_size[size].append(path)
+
+    duplicates = {}
+    for size, same_size in by_size.items():
+        if len(same_size) < 2:
+            continue
+        for candidates in _split(same_size, lambda path: _digest(path, size, full=False)):
+            # Small files were hashed in full already
+            groups = [candidates] if size <= 2 * BLOCK_SIZE else _split(
+                candidates, lambda path: _digest(path, size, full=True)
+            )
+            for group in groups:
+                group.sort(key=order.__getitem__)
+                for path in group[1:]:
+                    duplicates[path] = group[0]
+    return duplicates
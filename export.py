@@ -0,0 +1,142 @@
+"""Zero-copy export of matched images into an output folder.
+
+Matched photos are usually only collected for review, so they do not need
+their own copy of the bytes.  ``Exporter`` links each file into the output
+folder with the cheapest method the filesystem supports:
+
+``reflink``
+    Copy-on-write clone (Linux ``FICLONE``: Btrfs, XFS, bcachefs, ...).  No
+    extra space, and editing either file never affects the other.
+``hardlink``
+    A second name for the same inode.  No extra space, but an edit made
+    through one name is visible through the other.
+``symlink``
+    A link pointing at the original; breaks if the original moves.
+``copy``
+    A full copy (with timestamps), the only option across filesystems.
+
+The default ``auto`` mode tries reflink, then hardlink, then copy, and
+remembers per output folder which methods failed so they are not retried for
+every file.  Files with the same name from different folders never overwrite
+each other: later ones get a `` (1)``, `` (2)``, ... suffix.
+"""
+import errno
+import os
+import shutil
+import sys
+
+EXPORT_MODES = ("auto", "reflink", "hardlink", "symlink", "copy")
+AUTO_METHODS = ("reflink", "hardlink", "copy")
+FICLONE = 0x40049409  # Linux ioctl: clone a whole file (_IOW(0x94, 9, int))
+
+# Errors that mean "this method is not available here", not "this file failed"
+_UNSUPPORTED = {
+    errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOTTY,
+    getattr(errno, "EOPNOTSUPP", errno.EINVAL), getattr(errno, "ENOTSUP", errno.EINVAL),
+    getattr(errno, "EMLINK", errno.EINVAL),
+}
+
+
+def _reflink(src, dst):
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflinks are only supported on Linux")
+    import fcntl
+
+    with open(src, "rb") as source, open(dst, "xb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _copy(src, dst):
+    with open(src, "rb") as source, open(dst, "xb") as target:
+        try:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        except OSError:
+            target.close()
+            os.remove(dst)  # Never leave a truncated copy behind
+            raise
+    shutil.copystat(src, dst)
+
+
+_METHODS = {
+    "reflink": _reflink,
+    "hardlink": os.link,
+    "symlink": lambda src, dst: os.symlink(os.path.abspath(src), dst),
+    "copy": _copy,
+}
+
+
+def _same_file(src, dst):
+    """True if ``dst`` is already an export of ``src`` (a link to it, or an identical copy)."""
+    try:
+        if os.path.samefile(src, dst):
+            return True
+        src_st, dst_st = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    # Copies and reflinks keep the source's size and modification time
+    return src_st.st_size == dst_st.st_size and src_st.st_mtime_ns == dst_st.st_mtime_ns
+
+
+class Exporter:
+    """Exports files into ``output_folder`` without duplicating their data where possible."""
+
+    def __init__(self, output_folder, mode="auto"):
+        if mode not in EXPORT_MODES:
+            raise ValueError(f"Unknown export mode {mode!r}; choose one of {', '.join(EXPORT_MODES)}")
+        self.output_folder = output_folder
+        self.mode = mode
+        self.methods = list(AUTO_METHODS if mode == "auto" else (mode,))
+        self.exported = {}  # Source path -> exported path
+        self.counts = dict.fromkeys(_METHODS, 0)  # Files exported per method
+
+    def export(self, src):
+        """Export ``src`` and return its path in the output folder."""
+        src = os.path.abspath(src)
+        if src in self.exported:
+            return self.exported[src]
+        os.makedirs(self.output_folder, exist_ok=True)
+
+        stem, ext = os.path.splitext(os.path.basename(src))
+        attempt = 0
+        while True:
+            name = f"{stem}{ext}" if attempt == 0 else f"{stem} ({attempt}){ext}"
+            dst = os.path.join(self.output_folder, name)
+            if os.path.lexists(dst):
+                if _same_file(src, dst):
+                    break  # Exported by an earlier run
+                attempt += 1
+                continue
+            try:
+                self._link(src, dst)
+                break
+            except FileExistsError:
+                attempt += 1  # Another exporter claimed the name first
+
+        self.exported[src] = dst
+        return dst
+
+    def _link(self, src, dst):
+        """Create ``dst`` with the first method that works, dropping methods that are unsupported."""
+        while True:
+            method = self.methods[0]
+            try:
+                _METHODS[method](src, dst)
+                self.counts[method] += 1
+                return method
+            except FileExistsError:
+                raise
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED or len(self.methods) == 1:
+                    raise
+                print(f"{method} export unavailable for {self.output_folder} ({e.strerror}); trying {self.methods[1]}")
+                self.methods.pop(0)
+
+    def summary(self):
+        """Human-readable count of exported files per method."""
+        return ", ".join(f"{count} {method}" for method, count in self.counts.items() if count) or "nothing exported"
@@ -0,0 +1,214 @@
+"""Persistent face-embedding index with vectorised similarity search.
+
+Every face detected in a gallery is stored once as a row of a NumPy-backed
+``.npz`` file: its 128-d encoding, its bounding box and the file it came from.
+Re-indexing only encodes files that are new or whose size/mtime changed, and a
+"find this person" query is a single vectorised distance computation against
+the whole index instead of a pass of face detection over the gallery.
+"""
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from analysis_cache import default_cache_path
+from compare_face import REPORT_NAME, identity_folders, load_references, locate_and_encode_faces, summarize_exports, write_match_report
+from export import Exporter
+from scanner import scan_images
+
+ENCODING_SIZE = 128
+
+
+def default_index_path(folder_path):
+    """Index file for ``folder_path`` inside the per-user cache directory."""
+    digest = hashlib.sha1(os.path.abspath(folder_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.dirname(default_cache_path()), f"faces-{digest}.npz")
+
+
+def _file_key(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class FaceIndex:
+    """All faces of a gallery as flat NumPy arrays.
+
+    ``encodings``, ``boxes`` and ``face_files`` have one row per face;
+    ``face_files`` points into ``paths``/``file_keys``, which have one row per
+    indexed image (including images without faces, so they are not re-scanned).
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.paths = []
+        self.file_keys = np.zeros((0, 4), dtype=np.int64)  # dev, ino, size, mtime_ns
+        self.encodings = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+        self.boxes = np.zeros((0, 4), dtype=np.int32)  # top, right, bottom, left
+        self.face_files = np.zeros(0, dtype=np.int32)
+        if os.path.exists(index_path):
+            self.load()
+
+    @classmethod
+    def for_folder(cls, folder_path):
+        """Open (or start) the default index for a gallery folder."""
+        return cls(default_index_path(folder_path))
+
+    def __len__(self):
+        return len(self.face_files)
+
+    def load(self):
+        """Read the index from disk."""
+        with np.load(self.index_path, allow_pickle=False) as data:
+            self.paths = [str(path) for path in data["paths"]]
+            self.file_keys = data["file_keys"].astype(np.int64)
+            self.encodings = data["encodings"].astype(np.float32)
+            self.boxes = data["boxes"].astype(np.int32)
+            self.face_files = data["face_files"].astype(np.int32)
+
+    def save(self):
+        """Write the index to disk atomically."""
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f,
+                paths=np.array(self.paths, dtype=str),
+                file_keys=self.file_keys,
+                encodings=self.encodings,
+                boxes=self.boxes,
+                face_files=self.face_files,
+            )
+        os.replace(temp_path, self.index_path)
+
+    def update(self, folder_path, recursive=False):
+        """Bring the index in line with ``folder_path``; returns (encoded, removed) file counts."""
+        current = {}
+        for entry in scan_images(folder_path, recursive):
+            current[os.path.abspath(entry.path)] = _file_key(entry.stat())
+
+        # Keep every file whose size and mtime are unchanged
+        kept = [
+            index for index, path in enumerate(self.paths)
+            if current.get(path) == tuple(int(v) for v in self.file_keys[index])
+        ]
+        remap = np.full(len(self.paths), -1, dtype=np.int32)
+        remap[kept] = np.arange(len(kept), dtype=np.int32)
+        rows = remap[self.face_files] >= 0 if len(self.face_files) else np.zeros(0, dtype=bool)
+
+        paths = [self.paths[index] for index in kept]
+        file_keys = [self.file_keys[index] for index in kept]
+        encodings = [self.encodings[rows]]
+        boxes = [self.boxes[rows]]
+        face_files = [remap[self.face_files[rows]]]
+        removed = len(self.paths) - len(kept)
+
+        known = set(paths)
+        encoded = 0
+        start = time.perf_counter()
+        for path, key in current.items():
+            if path in known:
+                continue
+            try:
+                locations, file_encodings = locate_and_encode_faces(path)
+            except Exception as e:
+                print(f"Unable to index {path}: {e}")
+                continue
+            file_index = len(paths)
+            paths.append(path)
+            file_keys.append(np.array(key, dtype=np.int64))
+            if len(file_encodings):
+                encodings.append(np.asarray(file_encodings, dtype=np.float32))
+                boxes.append(np.asarray(locations, dtype=np.int32))
+                face_files.append(np.full(len(file_encodings), file_index, dtype=np.int32))
+            encoded += 1
+
+        self.paths = paths
+        self.file_keys = np.array(file_keys, dtype=np.int64).reshape(-1, 4)
+        self.encodings = np.concatenate(encodings).astype(np.float32, copy=False)
+        self.boxes = np.concatenate(boxes).astype(np.int32, copy=False)
+        self.face_files = np.concatenate(face_files).astype(np.int32, copy=False)
+        if encoded:
+            elapsed = time.perf_counter() - start
+            print(f"Indexed {encoded} new or changed images in {elapsed:.2f}s")
+        return encoded, removed
+
+    def query(self, reference_encoding, tolerance=0.5):
+        """Images with a face within ``tolerance`` of the reference, closest first.
+
+        Returns ``(path, distance, box, face)`` tuples, one per image, using
+        the image's closest face; ``face`` is its position among the image's faces.
+        """
+        if not len(self.face_files):
+            return []
+        reference = np.asarray(reference_encoding, dtype=np.float32).reshape(1, ENCODING_SIZE)
+        distances = np.linalg.norm(self.encodings - reference, axis=1)
+        rows = np.flatnonzero(distances <= tolerance)
+        rows = rows[np.argsort(distances[rows], kind="stable")]
+        # The first, i.e. closest, row of each image, back in distance order
+        _, first = np.unique(self.face_files[rows], return_index=True)
+        rows = rows[np.sort(first)]
+
+        files = self.face_files[rows]
+        # Faces are stored file by file, so an image's faces are consecutive rows
+        faces = rows - np.searchsorted(self.face_files, files)
+        return [
+            (self.paths[file_index], distance, tuple(box), face)
+            for file_index, distance, box, face in zip(
+                files.tolist(), distances[rows].tolist(), self.boxes[rows].tolist(), faces.tolist()
+            )
+        ]
+
+
+# Function to match one or more reference identities against a gallery through its face index; returns the matched
+# paths and the export summary.
+# reference_image_path may be a path, a list of paths or a {name: path} dict (see compare_face.load_references)
+def match_faces_with_index(reference_image_path, folder_path, output_folder="matched_images", tolerance=0.5, index_path=None, recursive=False,
+                           export_mode="auto"):
+    names, reference_encodings = load_references(reference_image_path)
+    if not names:
+        raise ValueError("No face found in the reference image.")
+
+    index = FaceIndex(index_path) if index_path else FaceIndex.for_folder(folder_path)
+    encoded, removed = index.update(folder_path, recursive)
+    if encoded or removed:
+        index.save()
+
+    start = time.perf_counter()
+    results = {name: index.query(encoding, tolerance) for name, encoding in zip(names, reference_encodings)}
+    print(f"Searched {len(index)} faces for {len(names)} identities in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    report = []
+    matched = {}
+    exporters = {}
+    folders = identity_folders(output_folder, names)
+    for name, matches in results.items():
+        if not matches:
+            continue
+        # Matched images are linked rather than copied where the filesystem allows it
+        exporter = exporters[name] = Exporter(folders[name], export_mode)
+        for path, distance, _, face in matches:
+            print(f"Face matched with {path} ({name}, distance {distance:.3f})")
+            report.append((path, name, distance, face, exporter.export(path)))
+            matched[path] = True
+        print(f"Exported {name} matches to {folders[name]}: {exporter.summary()}")
+    if report:
+        report_path = os.path.join(output_folder, REPORT_NAME)
+        write_match_report(report_path, report)
+        print(f"Match report written to {report_path}")
+    return list(matched), summarize_exports(exporters)
+
+# Function to match through the face index and report the outcome in a dialog
+def compare_faces_with_index(reference_image_path, folder_path, output_folder="matched_images", tolerance=0.5, index_path=None, recursive=False):
+    from tkinter import messagebox  # Imported lazily so headless callers never load tkinter
+    try:
+        matches, _ = match_faces_with_index(reference_image_path, folder_path, output_folder, tolerance, index_path, recursive)
+    except ValueError as e:
+        messagebox.showinfo("Info", str(e))
+        return []
+    if matches:
+        messagebox.showinfo("Info", "Successfully completed")
+    else:
+        messagebox.showinfo("Info", "No images were found that match the reference.")
+    return matches
@@ -0,0 +1,88 @@
+"""Hamming-distance index for perceptual image hashes.
+
+A BK-tree keyed on 64-bit integer hashes.  Looking up every neighbour within a
+small radius only visits the branches whose edge distance can still satisfy
+the triangle inequality, so a near-duplicate query costs roughly O(log n)
+comparisons instead of a scan over every other image.
+"""
+
+
+def hash_to_int(image_hash):
+    """Convert an ``imagehash.ImageHash`` (or an int) to a plain integer."""
+    if isinstance(image_hash, int):
+        return image_hash
+    return int(str(image_hash), 16)
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two integer hashes."""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """BK-tree over integer hashes storing an arbitrary item per entry.
+
+    Several items may share the same hash; they are kept on the same node.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, items, {distance: child}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, image_hash, item):
+        """Insert ``item`` under ``image_hash``."""
+        value = hash_to_int(image_hash)
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def find(self, image_hash, max_distance):
+        """Return ``(distance, item)`` pairs within ``max_distance`` (inclusive)."""
+        if self._root is None or max_distance < 0:
+            return []
+        value = hash_to_int(image_hash)
+        matches = []
+        stack = [self._root]
+        while stack:
+            node_hash, items, children = stack.pop()
+            distance = hamming_distance(value, node_hash)
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in items)
+            low, high = distance - max_distance, distance + max_distance
+            for edge, child in children.items():
+                if low <= edge <= high:
+                    stack.append(child)
+        return matches
+
+    def has_neighbour(self, image_hash, max_distance, exclude=None):
+        """True if any item other than ``exclude`` lies within ``max_distance``."""
+        if self._root is None or max_distance < 0:
+            return False
+        value = hash_to_int(image_hash)
+        stack = [self._root]
+        while stack:
+            node_hash, items, children = stack.pop()
+            distance = hamming_distance(value, node_hash)
+            if distance <= max_distance and any(item is not exclude for item in items):
+                return True
+            low, high = distance - max_distance, distance + max_distance
+            for edge, child in children.items():
+                if low <= edge <= high:
+                    stack.append(child)
+        return False
@@ -0,0 +1,79 @@
+"""Background job executor for the Tk GUIs.
+
+Long scans run on a worker thread and never touch Tk widgets directly.  The
+worker pushes items through a thread-safe queue with ``emit``; the Tk main
+loop drains that queue in batches from ``after()`` callbacks and hands each
+batch to the UI, so the window stays responsive and results appear as they
+are produced.
+"""
+import queue
+import threading
+
+_DONE = object()
+
+
+class BackgroundJob:
+    """Run ``target(emit)`` on a worker thread and stream its output to the UI.
+
+    ``on_items(batch)``, ``on_done(result)`` and ``on_error(exception)`` are
+    always called on the Tk main thread.
+    """
+
+    def __init__(self, root, target, on_items=None, on_done=None, on_error=None,
+                 interval=100, batch_size=500):
+        self.root = root
+        self.target = target
+        self.on_items = on_items
+        self.on_done = on_done
+        self.on_error = on_error
+        self.interval = interval  # Milliseconds between queue drains
+        self.batch_size = batch_size  # Most items handed to the UI per drain
+        self._queue = queue.Queue()
+        self._thread = None
+        self._outcome = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the worker thread and the periodic drain on the main loop."""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.root.after(self.interval, self._drain)
+        return self
+
+    def _run(self):
+        try:
+            self._outcome = (True, self.target(self._queue.put))
+        except Exception as e:
+            self._outcome = (False, e)
+        self._queue.put(_DONE)
+
+    def _drain(self):
+        batch = []
+        finished = False
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                finished = True
+                break
+            batch.append(item)
+
+        if batch and self.on_items:
+            self.on_items(batch)
+        if not finished:
+            self.root.after(self.interval, self._drain)
+            return
+
+        succeeded, value = self._outcome
+        if succeeded:
+            if self.on_done:
+                self.on_done(value)
+        elif self.on_error:
+            self.on_error(value)
+        else:
+            print(f"Background job failed: {value}")
@@ -1,9 +1,13 @@
 import os
-import cv2
 import shutil
 from mesa import Agent, Model
-from mesa.time import RandomActivation
-from tkinter import filedialog, messagebox
+from analysis import analyze_image, needs_decode
+from blur_metrics import DEFAULT_THRESHOLDS, score_files
+from parallel import make_activation
+from scanner import scan_images
+from scan_journal import ScanJournal, BLURRED
+from metrics import get_metrics, timed_remove
+from stepping import SteppedModel
 
 
 # Agent for each image
@@ -13,59 +17,128 @@ class ImageAgent(Agent):
         self.image_path = image_path
         self.threshold = threshold
         self.is_blurry = False
+        self.variance = None  # Blur score (Laplacian variance by default), possibly computed by a worker process
+        self.restored = False  # Verdict carried over from an incremental scan
+        self.recorded = False  # Result already written to the journal
+        self.removed = False  # The file was deleted
+
+    def work_input(self):
+        return self.image_path if self.variance is None and not self.restored else None
+
+    def work_done(self, result):
+        if not isinstance(result, Exception):
+            self.variance = result.blur
 
     def is_blurry_image(self):
-        img = cv2.imread(self.image_path)
-        if img is None:
-            print(f"Warning: Unable to read image {self.image_path}. It may be corrupted or not an image.")
-            return False
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        variance = cv2.Laplacian(gray, cv2.CV_64F).var()
-        return variance < self.threshold
+        if self.variance is None:
+            try:
+                self.variance = analyze_image(self.image_path).blur
+            except Exception:
+                print(f"Warning: Unable to read image {self.image_path}. It may be corrupted or not an image.")
+                return False
+        return self.variance < self.threshold
 
     def step(self):
+        if self.restored:
+            # Blurry files recorded by an earlier dry run are still on disk
+            if self.is_blurry and self.model.delete_files:
+                self.remove()
+            return
         if self.is_blurry_image():
             self.is_blurry = True
-            print(f'Removing blurry image: {self.image_path}')
-            try:
-                os.remove(self.image_path)
-                print(f'Successfully removed: {self.image_path}')
-            except PermissionError:
-                print(f'Permission denied for {self.image_path}. Unable to remove.')
-
-# Model for managing image agents
-class ImageCleanupModel(Model):
-    def __init__(self, folder_path, threshold=100):
+            if not self.model.delete_files:
+                print(f'Blurry image: {self.image_path}')
+                return
+            self.remove()
+
+    def remove(self):
+        print(f'Removing blurry image: {self.image_path}')
+        try:
+            timed_remove(self.image_path)
+            self.removed = True
+            print(f'Successfully removed: {self.image_path}')
+        except PermissionError:
+            print(f'Permission denied for {self.image_path}. Unable to remove.')
+
+# Model for managing image agents; step() can be time-sliced and cancelled (see stepping.py)
+class ImageCleanupModel(SteppedModel, Model):
+    stage = "model.blur"
+
+    def __init__(self, folder_path, threshold=None, workers=1, recursive=False, incremental=False, delete_files=True,
+                 metric=None):
         self.folder_path = folder_path
+        # Scores of each metric have their own scale, so the default threshold follows the metric
+        if threshold is None:
+            threshold = DEFAULT_THRESHOLDS[metric or "laplacian"]
         self.threshold = threshold
-        self.schedule = RandomActivation(self)
+        self.delete_files = delete_files  # False only reports blurry images
+        # None scores full-resolution images one at a time; a blur_metrics.METRICS name scores thumbnails in batches
+        self.metric = metric
+        self.schedule = make_activation(self, analyze_image, workers, read_ahead=needs_decode)
         self.blurry_images = []
+        # Incremental runs only score files that are new or changed since the last scan
+        job = f"blur-{metric}-{threshold}" if metric else f"blur-{threshold}"
+        self.journal = ScanJournal(folder_path, job) if incremental else None
 
-        # Create agents for each image in the folder
-        for idx, filename in enumerate(os.listdir(folder_path)):
-            file_path = os.path.join(folder_path, filename)
-            if filename.endswith(('jpg', 'jpeg', 'png')):
-                agent = ImageAgent(idx, self, file_path, self.threshold)
-                self.schedule.add(agent)
+        # Create agents for each image in the folder as it is scanned
+        seen = []
+        for idx, entry in enumerate(scan_images(folder_path, recursive)):
+            agent = ImageAgent(idx, self, entry.path, self.threshold)
+            self.schedule.add(agent)
+            if self.journal:
+                seen.append(entry.path)
+                previous = self.journal.unchanged(entry.path, entry.stat())
+                if previous:
+                    agent.is_blurry = bool(previous.verdict & BLURRED)
+                    agent.restored = True
+        if self.journal:
+            self.journal.forget_missing(seen)
 
-    def step(self):
-        self.schedule.step()
+    def begin_step(self):
+        if self.metric:
+            self.score_batched()
+
+    def end_step(self):
+        get_metrics().count("blurred", sum(agent.is_blurry for agent in self.schedule.agents))
+        self.checkpoint(self.schedule.agents)
+
+    def checkpoint(self, agents):
+        # Recorded results let an interrupted incremental scan resume where it stopped
+        if not self.journal:
+            return
+        for agent in agents:
+            # Blurry files are deleted during the step, so only survivors are recorded
+            if agent.restored or agent.recorded or agent.variance is None:
+                continue
+            if not agent.is_blurry:
+                self.journal.record(agent.image_path)
+            elif not self.delete_files:
+                self.journal.record(agent.image_path, verdict=BLURRED)
+            agent.recorded = True
+        self.journal.commit()
+
+    def score_batched(self):
+        pending = [agent for agent in self.schedule.agents if agent.work_input() is not None]
+        for agent, score in zip(pending, score_files([agent.image_path for agent in pending], self.metric)):
+            agent.variance = score
 
     def get_blurry_images(self):
+        # When deleting, only the files actually removed are reported
         for agent in self.schedule.agents:
-            if agent.is_blurry:
+            if agent.is_blurry and (agent.removed or not self.delete_files):
                 self.blurry_images.append(agent.image_path)
         return self.blurry_images
 
 
 # Function to remove blurry images with Mesa
-def remove_blurry_images_with_mesa(folder_path, threshold=100):
+def remove_blurry_images_with_mesa(folder_path, threshold=None, workers=1, recursive=False, incremental=False, metric=None):
+    from tkinter import messagebox  # Imported lazily so headless callers never load tkinter
     if not os.path.exists(folder_path):
         print(f"Error: The specified folder does not exist: {folder_path}")
         return
 
     # Initialize the model and run one step
-    model = ImageCleanupModel(folder_path, threshold)
+    model = ImageCleanupModel(folder_path, threshold, workers, recursive, incremental, metric=metric)
     model.step()
 
     blurry_images = model.get_blurry_images()
@@ -0,0 +1,229 @@
+"""Process-pool activation for the cleanup models.
+
+``ParallelActivation`` behaves like Mesa's ``RandomActivation`` but first
+fans the expensive, independent part of every agent's work (decoding, hashing,
+blur scoring, face encoding) out to a ``ProcessPoolExecutor`` in chunked
+batches.  The results are handed back to the agents in the parent process and
+the agents are then stepped one at a time, so any cross-agent logic (such as
+the duplicate clustering in ``model.clusters``) stays serial and deterministic.
+
+Both activations call ``on_agent_done(agent)``, when set, right after each
+agent has stepped, so callers such as the GUIs can stream progress.  A step
+can also be split over several calls (``max_agents`` / ``time_budget``) and
+cancelled between agents; see ``stepping.SteppedModel``.
+
+Serial runs can instead overlap I/O with decoding: given a ``read_ahead``
+predicate, ``SerialActivation`` reads the files of upcoming agents on
+background threads (see ``prefetch``) and calls ``work_fn(path, st=...,
+data=...)`` just before each agent steps.  ``read_ahead(path, st)`` says
+whether a file's bytes are needed at all, so cached files are never read.
+
+Agents opt in by implementing two methods:
+
+``work_input()``
+    A picklable argument for ``work_fn``, or None if there is nothing to compute.
+``work_done(result)``
+    Receives ``work_fn(work_input())``, or the exception it raised.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from mesa.time import RandomActivation
+
+from analysis_cache import commit_default_cache
+from metrics import get_metrics
+from prefetch import prefetch
+
+DEFAULT_CHUNKSIZE = 32
+
+
+def resolve_workers(workers):
+    """Number of worker processes to use; 0 or None means one per CPU."""
+    if not workers or workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def _run_chunk(work_fn, inputs):
+    """Apply ``work_fn`` to a batch of inputs inside a worker process."""
+    results = []
+    for item in inputs:
+        try:
+            results.append(work_fn(item))
+        except Exception as e:
+            results.append(e)
+    # Worker processes exit without running atexit hooks, so flush cached results now
+    commit_default_cache()
+    # Stage timings travel back with the results so the parent can report the whole run
+    return results, get_metrics().drain()
+
+
+class SerialActivation(RandomActivation):
+    """Random activation that reports every stepped agent to ``on_agent_done``."""
+
+    def __init__(self, model, work_fn=None, read_ahead=None):
+        super().__init__(model)
+        self.work_fn = work_fn
+        self.read_ahead = read_ahead  # Optional ``(path, st) -> bool``; enables threaded read-ahead
+        self.on_agent_done = None  # Optional callback, called with each stepped agent
+        self.batch_size = None  # Agents prefetched at a time; None prefetches all remaining agents
+        self.cancelled = False
+        self.position = 0  # Agents of the step in progress that have stepped
+        self._order = None  # Shuffled agents of the step in progress
+
+    @property
+    def in_step(self):
+        """True while a step has been started but not finished."""
+        return self._order is not None
+
+    @property
+    def progress(self):
+        """Fraction of the step in progress that is done; 1.0 once a step has finished."""
+        if self._order is None:
+            return 1.0 if self.steps else 0.0
+        return self.position / len(self._order) if self._order else 1.0
+
+    def _wrapped_step(self, *args, **kwargs):
+        # Mesa 2.x routes ``step`` through this wrapper to advance the model clock; a partial
+        # step must not advance it, and its arguments and result have to pass through
+        done = self._original_step(*args, **kwargs)
+        if done:
+            self.model._advance_time()
+        return done
+
+    def stepped_agents(self):
+        """Agents that have already stepped in the step in progress."""
+        return self._order[:self.position] if self._order is not None else []
+
+    def cancel(self):
+        """Stop after the agent that is stepping now; a cancelled activation does not step again."""
+        self.cancelled = True
+
+    def close(self):
+        """Release resources held between partial steps."""
+
+    def prefetch(self, agents):
+        """Hook for precomputing agent work before the agents are stepped."""
+
+    def step(self, max_agents=None, time_budget=None):
+        """Step agents serially in random order; returns True once every agent has stepped.
+
+        Without limits the whole step runs in one call.  ``max_agents`` and
+        ``time_budget`` (seconds) bound a single call instead, and the next
+        call carries on in the same order; at least one agent steps per call.
+        Agent work is prefetched batch by batch just before the agents step.
+        """
+        if self.cancelled:
+            return False
+        if self._order is None:
+            self._order = list(self.agents)
+            self.model.random.shuffle(self._order)
+            self.position = 0
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        end = len(self._order) if max_agents is None else min(len(self._order), self.position + max(1, max_agents))
+        stop = False
+        while self.position < end and not stop:
+            batch_end = end if self.batch_size is None else min(end, self.position + self.batch_size)
+            batch = self._order[self.position:batch_end]
+            self.prefetch(batch)
+            agents = self._with_reads(batch)
+            try:
+                for agent in agents:
+                    agent.step()
+                    self.position += 1
+                    if self.on_agent_done:
+                        self.on_agent_done(agent)
+                    if self.cancelled or (deadline is not None and time.monotonic() >= deadline):
+                        stop = True
+                        break
+            finally:
+                agents.close()
+        if self.cancelled:
+            self.close()
+        if self.position < len(self._order):
+            return False
+        self._order = None
+        self.close()
+        self.steps += 1
+        self.time += 1
+        return True
+
+    def _with_reads(self, agents):
+        """Yield ``agents`` in order, first handing each the work computed from its read-ahead bytes."""
+        if self.work_fn is None or self.read_ahead is None:
+            yield from agents
+            return
+        # Work is computed just before each agent is yielded, so nothing is wasted if the caller stops early
+        inputs = [agent.work_input() for agent in agents]
+        files = prefetch((work_input for work_input in inputs if work_input is not None), wanted=self.read_ahead)
+        try:
+            for agent, work_input in zip(agents, inputs):
+                if work_input is not None:
+                    item = next(files)
+                    if item.error is not None:
+                        agent.work_done(item.error)
+                    else:
+                        try:
+                            agent.work_done(self.work_fn(item.path, st=item.st, data=item.data))
+                        except Exception as e:
+                            agent.work_done(e)
+                yield agent
+        finally:
+            files.close()
+
+
+class ParallelActivation(SerialActivation):
+    """Random activation that precomputes agent work in a process pool."""
+
+    def __init__(self, model, work_fn, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+        super().__init__(model, work_fn)  # work_fn must be a module-level function (or partial) to pickle
+        self.workers = resolve_workers(workers)
+        self.chunksize = max(1, chunksize)
+        # Enough chunks per batch to keep every worker busy, small enough to stop promptly
+        self.batch_size = self.workers * self.chunksize * 4
+        self._executor = None  # Kept alive across batches and partial steps
+
+    def close(self):
+        """Shut the worker pool down; it is restarted by the next batch that needs it."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def prefetch(self, agents):
+        """Compute ``work_fn`` for every agent that needs it, in parallel."""
+        pending = []
+        for agent in agents:
+            work_input = agent.work_input()
+            if work_input is not None:
+                pending.append((agent, work_input))
+        if not pending:
+            return
+
+        chunks = [pending[i:i + self.chunksize] for i in range(0, len(pending), self.chunksize)]
+        # Writes this process made since the last batch would otherwise hold the cache's write lock
+        # while the workers try to store their results
+        commit_default_cache()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        futures = [
+            self._executor.submit(_run_chunk, self.work_fn, [work_input for _, work_input in chunk])
+            for chunk in chunks
+        ]
+        # Results are applied in submission order, independent of worker timing
+        for chunk, future in zip(chunks, futures):
+            results, worker_metrics = future.result()
+            get_metrics().merge(worker_metrics)
+            for (agent, _), result in zip(chunk, results):
+                agent.work_done(result)
+
+
+def make_activation(model, work_fn, workers=1, chunksize=DEFAULT_CHUNKSIZE, read_ahead=None):
+    """``SerialActivation`` for serial runs (``workers == 1``), otherwise ``ParallelActivation``.
+
+    ``read_ahead`` enables threaded read-ahead for serial runs; worker
+    processes read their own files.
+    """
+    if workers == 1:
+        return SerialActivation(model, work_fn, read_ahead)
+    return ParallelActivation(model, work_fn, workers, chunksize)
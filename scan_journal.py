@@ -0,0 +1,98 @@
+"""Change journal for incremental re-scans.
+
+For every folder and cleanup job the journal remembers the size, mtime,
+perceptual hash and verdict of each file it analysed.  On an incremental run
+only files that are new or whose size/mtime changed are analysed again;
+unchanged files keep their recorded verdict, and their recorded hashes still
+take part in duplicate detection for the new files.
+"""
+import os
+import sqlite3
+from collections import namedtuple
+
+from analysis_cache import default_cache_path
+
+# Verdict bits
+DUPLICATE = 1
+BLURRED = 2
+
+JournalEntry = namedtuple("JournalEntry", ["size", "mtime_ns", "phash", "verdict"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    folder TEXT NOT NULL,
+    job TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    phash TEXT,
+    verdict INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (folder, job, path)
+);
+"""
+
+
+def default_journal_path():
+    """Journal database next to the analysis cache."""
+    return os.path.join(os.path.dirname(default_cache_path()), "scan_journal.sqlite")
+
+
+class ScanJournal:
+    """Last known state of the files one cleanup job analysed in one folder."""
+
+    def __init__(self, folder_path, job, db_path=None):
+        self.folder = os.path.abspath(folder_path)
+        self.job = job
+        self.db_path = db_path or default_journal_path()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Models are built on the UI thread but may be stepped on a background one
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, path):
+        """The recorded entry for ``path``, or None if it was never analysed."""
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, phash, verdict FROM journal WHERE folder=? AND job=? AND path=?",
+            (self.folder, self.job, os.path.abspath(path)),
+        ).fetchone()
+        return JournalEntry(*row) if row else None
+
+    def unchanged(self, path, st):
+        """The recorded entry if ``path`` still has the recorded size and mtime, else None."""
+        entry = self.get(path)
+        if entry and entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+            return entry
+        return None
+
+    def record(self, path, phash=None, verdict=0, st=None):
+        """Remember the analysis result for ``path``."""
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO journal (folder, job, path, size, mtime_ns, phash, verdict) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.folder, self.job, os.path.abspath(path), st.st_size, st.st_mtime_ns,
+             phash and str(phash), verdict),
+        )
+
+    def forget_missing(self, present_paths):
+        """Drop entries for files that were not seen in the latest scan."""
+        present = {os.path.abspath(path) for path in present_paths}
+        rows = self._conn.execute(
+            "SELECT path FROM journal WHERE folder=? AND job=?", (self.folder, self.job)
+        ).fetchall()
+        missing = [(self.folder, self.job, path) for (path,) in rows if path not in present]
+        self._conn.executemany("DELETE FROM journal WHERE folder=? AND job=? AND path=?", missing)
+        return len(missing)
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
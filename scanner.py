@@ -0,0 +1,71 @@
+"""Streaming directory scanner shared by the cleanup models.
+
+Built on ``os.scandir`` so file type checks come from the directory listing
+itself and each entry's ``stat()`` result is cached on the ``DirEntry``.
+Entries are yielded lazily and only one directory handle is open at a time,
+so memory stays bounded by the depth and breadth of the tree rather than by
+the number of files in it.  Time spent listing each directory (excluding
+time the caller spends between entries) is recorded as the ``list`` stage.
+"""
+import os
+import time
+
+from metrics import get_metrics
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def scan_files(folder_path, extensions=None, recursive=True):
+    """Yield an ``os.DirEntry`` for every regular file under ``folder_path``.
+
+    ``extensions`` filters by suffix, case-insensitively.  Symlinked
+    directories are not followed, so link cycles cannot loop the scan.
+    """
+    if extensions:
+        extensions = tuple(ext.lower() for ext in extensions)
+    metrics = get_metrics()
+    pending = [folder_path]
+    while pending:
+        directory = pending.pop()
+        subdirectories = []
+        busy = 0.0
+        start = time.perf_counter()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                subdirectories.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if extensions and not entry.name.lower().endswith(extensions):
+                        continue
+                    busy += time.perf_counter() - start
+                    yield entry
+                    start = time.perf_counter()
+        except OSError as e:
+            metrics.observe("list", busy + time.perf_counter() - start, error=True, path=directory)
+            print(f"Warning: Unable to scan {directory}: {e}")
+            continue
+        metrics.observe("list", busy + time.perf_counter() - start, path=directory)
+        # Visit subfolders in listing order
+        pending.extend(reversed(subdirectories))
+
+
+def scan_images(folder_path, recursive=True):
+    """Yield an ``os.DirEntry`` for every image file under ``folder_path``."""
+    return scan_files(folder_path, IMAGE_EXTENSIONS, recursive)
+
+
+def files_older_than(folder_path, cutoff_timestamp, extensions=None, recursive=True):
+    """Yield an ``os.DirEntry`` for every file last modified before ``cutoff_timestamp``."""
+    for entry in scan_files(folder_path, extensions, recursive):
+        try:
+            if entry.stat().st_mtime < cutoff_timestamp:
+                yield entry
+        except OSError:
+            continue
@@ -0,0 +1,411 @@
+"""Sharded duplicate and blur scans across worker processes or hosts.
+
+A scan too large for one machine is split into shards that any number of
+workers can share, as long as they all see the image folder and a job folder
+at the same paths (a network share, for example):
+
+* the coordinator lists the image folder once and writes the manifest to
+  ``queue.sqlite`` in the job folder, split into shards of ``SHARD_SIZE``
+  files (``create_job``);
+* each worker claims the next pending shard in a short ``BEGIN IMMEDIATE``
+  transaction, analyses its files and writes their hashes, blur scores and
+  sizes to ``results/shard-NNNNNN.jsonl``, and the stage timings it recorded
+  to ``results/shard-NNNNNN.metrics.json`` (``run_worker``).  Workers renew
+  their claim while they work; a shard whose claim has not been renewed for
+  ``CLAIM_TIMEOUT`` seconds is assumed lost and handed to another worker;
+* once every shard is done, ``merge_results`` clusters all hashes at once, so
+  duplicates are found across shards exactly as a single-machine scan would,
+  applies the blur threshold and adds the workers' timings to this process's
+  metrics.
+
+The queue uses SQLite's rollback journal rather than WAL, because WAL needs
+shared memory that separate hosts do not have.  Partial results are written
+to a temporary file and renamed into place, so a worker that dies mid-shard
+never leaves half a result behind; rerunning the coordinator on the same job
+folder resumes from the shards already done.  A job only resumes with the
+settings it was created with, and a finished job has to be restarted to scan
+the folder again.
+
+``run_sharded_scan`` runs the whole job on one machine, with local worker
+processes standing in for the nodes.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import time
+import uuid
+from collections import namedtuple
+
+from analysis import ImageAnalysis, analyze_image, fast_decode_enabled, needs_decode
+from analysis_cache import commit_default_cache
+from clustering import DuplicateClusters, keeper_rank
+from metrics import get_metrics
+from prefetch import prefetch
+from scanner import scan_images
+
+QUEUE_NAME = "queue.sqlite"
+RESULTS_DIR = "results"
+SHARD_SIZE = 256  # Files per shard
+CLAIM_TIMEOUT = 300.0  # Seconds without a heartbeat before a claimed shard is handed to another worker
+HEARTBEAT_INTERVAL = 10.0  # Seconds between claim renewals while a shard is analysed
+POLL_INTERVAL = 1.0  # Seconds between checks for shards to take over or finish
+
+PENDING, CLAIMED, DONE = "pending", "claimed", "done"
+
+ShardScan = namedtuple("ShardScan", ["images", "duplicates", "blurred", "errors"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    heartbeat REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS manifest (
+    path TEXT PRIMARY KEY,
+    shard INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS manifest_shard ON manifest (shard);
+"""
+
+
+def default_owner():
+    """Name a worker claims shards under: host name and process id."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ShardQueue:
+    """Manifest, settings and shard states of one sharded scan, shared by every node."""
+
+    def __init__(self, job_dir):
+        self.job_dir = os.path.abspath(job_dir)
+        os.makedirs(os.path.join(self.job_dir, RESULTS_DIR), exist_ok=True)
+        # Autocommit; claims take the write lock explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(os.path.join(self.job_dir, QUEUE_NAME), timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def settings(self):
+        """Settings the job was created with, or an empty dict before ``create``."""
+        return {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM settings")}
+
+    def create(self, settings):
+        """List the folder of ``job_settings`` into the manifest, split into shards; returns the number of shards."""
+        shard_size = settings["shard_size"]
+        count = 0
+        with get_metrics().timer("shard.create"):
+            entries = sorted(scan_images(settings["folder"], settings["recursive"]), key=lambda entry: entry.path)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM settings").fetchone():
+                    raise ValueError(f"{self.job_dir} already holds a sharded scan.")
+                self._conn.executemany(
+                    "INSERT INTO settings (key, value) VALUES (?, ?)",
+                    [(key, json.dumps(value)) for key, value in settings.items()],
+                )
+                for start in range(0, len(entries), shard_size):
+                    shard = start // shard_size
+                    self._conn.execute("INSERT INTO shards (id) VALUES (?)", (shard,))
+                    rows = []
+                    for entry in entries[start:start + shard_size]:
+                        st = entry.stat()
+                        rows.append((os.path.abspath(entry.path), shard, st.st_size, st.st_mtime_ns))
+                    self._conn.executemany(
+                        "INSERT INTO manifest (path, shard, size, mtime_ns) VALUES (?, ?, ?, ?)", rows
+                    )
+                    count += 1
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def claim(self, owner, claim_timeout=CLAIM_TIMEOUT):
+        """Claim the next pending (or abandoned) shard for ``owner``; None if there is none."""
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT id FROM shards WHERE status=? OR (status=? AND heartbeat<?) ORDER BY id LIMIT 1",
+                (PENDING, CLAIMED, now - claim_timeout),
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE shards SET status=?, owner=?, heartbeat=?, attempts=attempts+1 WHERE id=?",
+                    (CLAIMED, owner, now, row[0]),
+                )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return row[0] if row else None
+
+    def heartbeat(self, shard, owner):
+        """Renew ``owner``'s claim on ``shard``; False if another worker has taken it over."""
+        cursor = self._conn.execute(
+            "UPDATE shards SET heartbeat=? WHERE id=? AND status=? AND owner=?",
+            (time.time(), shard, CLAIMED, owner),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, shard, owner):
+        """Mark ``shard`` done if ``owner`` still holds it."""
+        cursor = self._conn.execute(
+            "UPDATE shards SET status=?, heartbeat=? WHERE id=? AND status=? AND owner=?",
+            (DONE, time.time(), shard, CLAIMED, owner),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, shard, owner):
+        """Hand ``shard`` back to the queue, e.g. when ``owner`` is interrupted."""
+        self._conn.execute(
+            "UPDATE shards SET status=?, owner=NULL, heartbeat=NULL WHERE id=? AND status=? AND owner=?",
+            (PENDING, shard, CLAIMED, owner),
+        )
+
+    def files(self, shard):
+        """Paths of the files in ``shard``, in manifest order."""
+        return [row[0] for row in self._conn.execute("SELECT path FROM manifest WHERE shard=? ORDER BY path", (shard,))]
+
+    def progress(self):
+        """Number of shards per status."""
+        counts = {PENDING: 0, CLAIMED: 0, DONE: 0}
+        counts.update(self._conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status"))
+        return counts
+
+    def finished(self):
+        return not self._conn.execute("SELECT 1 FROM shards WHERE status!=? LIMIT 1", (DONE,)).fetchone()
+
+    def result_path(self, shard):
+        return os.path.join(self.job_dir, RESULTS_DIR, f"shard-{shard:06d}.jsonl")
+
+    def metrics_path(self, shard):
+        return os.path.join(self.job_dir, RESULTS_DIR, f"shard-{shard:06d}.metrics.json")
+
+    def shard_ids(self):
+        return [row[0] for row in self._conn.execute("SELECT id FROM shards ORDER BY id")]
+
+
+def analyse_shard(queue, shard, owner, fast=False):
+    """Analyse every file of ``shard`` and write its partial result; False if the claim was lost."""
+    metrics = get_metrics()
+    records = []
+    last_beat = time.monotonic()
+    with metrics.timer("shard.analyse"):
+        # Files are read ahead on background threads while the previous one is decoded
+        for item in prefetch(queue.files(shard), wanted=lambda path, st: needs_decode(path, st, fast=fast)):
+            record = {"path": item.path}
+            try:
+                if item.error is not None:
+                    raise item.error
+                analysis = analyze_image(item.path, st=item.st, fast=fast, data=item.data)
+            except Exception as e:
+                record["error"] = str(e)
+            else:
+                record.update(
+                    phash=str(analysis.image_hash), blur=analysis.blur, width=analysis.width,
+                    height=analysis.height, size=analysis.size,
+                )
+            records.append(record)
+            if time.monotonic() - last_beat >= HEARTBEAT_INTERVAL:
+                if not queue.heartbeat(shard, owner):
+                    return False
+                last_beat = time.monotonic()
+    commit_default_cache()  # Other workers on this host share the analysis cache
+    # Stage timings travel with the results so the coordinator can report the whole run
+    _write_atomic(queue.metrics_path(shard), [metrics.drain()])
+    _write_atomic(queue.result_path(shard), records)
+    return True
+
+
+def _write_atomic(path, records):
+    """Write ``records`` as JSON lines to a temporary file and rename it to ``path``."""
+    partial = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(partial, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    os.replace(partial, path)
+
+
+def run_worker(job_dir, owner=None, claim_timeout=CLAIM_TIMEOUT, wait=True):
+    """Claim and analyse shards of the scan in ``job_dir`` until none are left; returns the number done.
+
+    With ``wait`` the worker stays until every shard is done, so it can take
+    over the shards of workers that stopped renewing their claims.
+    """
+    owner = owner or default_owner()
+    queue = ShardQueue(job_dir)
+    done = 0
+    try:
+        fast = queue.settings().get("fast", False)
+        while True:
+            shard = queue.claim(owner, claim_timeout)
+            if shard is None:
+                if not wait or queue.finished():
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+            try:
+                finished = analyse_shard(queue, shard, owner, fast)
+            except BaseException:
+                queue.release(shard, owner)
+                raise
+            if finished and queue.complete(shard, owner):
+                done += 1
+    finally:
+        queue.close()
+    return done
+
+
+def job_settings(folder, shard_size=SHARD_SIZE, recursive=False, blur_threshold=100, max_distance=0):
+    """Settings a sharded scan of ``folder`` is created with.
+
+    ``max_distance`` is the largest Hamming distance between hashes still
+    treated as a duplicate, and images scoring below ``blur_threshold`` are
+    blurred.  The decode mode is fixed here so every node hashes alike.
+    """
+    return {
+        "folder": os.path.abspath(folder), "recursive": recursive, "shard_size": shard_size,
+        "blur_threshold": blur_threshold, "max_distance": max_distance, "fast": fast_decode_enabled(),
+    }
+
+
+def create_job(folder, job_dir, shard_size=SHARD_SIZE, recursive=False, blur_threshold=100, max_distance=0):
+    """Start a sharded scan of ``folder`` in ``job_dir`` (see ``job_settings``); returns the number of shards."""
+    queue = ShardQueue(job_dir)
+    try:
+        return queue.create(job_settings(folder, shard_size, recursive, blur_threshold, max_distance))
+    finally:
+        queue.close()
+
+
+def remove_job(job_dir):
+    """Delete the queue and partial results of the scan in ``job_dir``."""
+    shutil.rmtree(os.path.join(job_dir, RESULTS_DIR), ignore_errors=True)
+    for suffix in ("", "-journal"):
+        try:
+            os.remove(os.path.join(job_dir, QUEUE_NAME + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def merge_results(job_dir):
+    """Global duplicate detection and blur verdicts over every shard's partial results.
+
+    Returns a ``ShardScan`` of the number of images, the duplicate and blurred
+    paths and ``(path, error)`` for files that could not be analysed.  The
+    workers' stage timings are added to this process's metrics.
+    """
+    queue = ShardQueue(job_dir)
+    try:
+        if not queue.finished():
+            raise RuntimeError(f"The sharded scan in {job_dir} is not finished yet.")
+        settings = queue.settings()
+        shards = [(queue.result_path(shard), queue.metrics_path(shard)) for shard in queue.shard_ids()]
+    finally:
+        queue.close()
+
+    metrics = get_metrics()
+    with metrics.timer("shard.merge"):
+        records = []
+        for result_path, metrics_path in shards:
+            with open(result_path, encoding="utf-8") as f:
+                records.extend(json.loads(line) for line in f)
+            with open(metrics_path, encoding="utf-8") as f:
+                metrics.merge(json.loads(f.readline()))
+        # Sorted so that ties between equally good copies are broken the same way on every run
+        records.sort(key=lambda record: record["path"])
+        clusters = DuplicateClusters(settings["max_distance"])
+        blurred = []
+        errors = []
+        for record in records:
+            path = record["path"]
+            if "error" in record:
+                errors.append((path, record["error"]))
+                continue
+            analysis = ImageAnalysis(path, None, record["blur"], record["width"], record["height"], record["size"], None)
+            clusters.add(int(record["phash"], 16), path, keeper_rank(path, analysis))
+            if record["blur"] is not None and record["blur"] < settings["blur_threshold"]:
+                blurred.append(path)
+        duplicates = [
+            record["path"] for record in records
+            if "error" not in record and clusters.is_duplicate(record["path"])
+        ]
+    return ShardScan(len(records), duplicates, blurred, errors)
+
+
+def wait_for_job(job_dir, processes=()):
+    """Block until every shard of the job is done.
+
+    Raises RuntimeError if all of the local worker ``processes`` exit while
+    shards are still unfinished.
+    """
+    queue = ShardQueue(job_dir)
+    try:
+        while not queue.finished():
+            if processes and not any(process.is_alive() for process in processes):
+                raise RuntimeError(f"Every local worker exited before the scan finished: {queue.progress()}")
+            time.sleep(POLL_INTERVAL)
+    finally:
+        queue.close()
+
+
+def run_sharded_scan(folder, job_dir, workers=2, shard_size=SHARD_SIZE, recursive=False, blur_threshold=100,
+                     max_distance=0, restart=False):
+    """Run a sharded scan on this machine with ``workers`` local worker processes (0 = one per CPU).
+
+    The job is created unless ``job_dir`` already holds an unfinished scan
+    with the same settings, in which case it resumes.  Different settings or
+    a finished scan raise ValueError unless ``restart`` discards the old job.
+    Workers on other hosts can join with ``run_worker`` at any time.
+    Returns the merged ``ShardScan``.
+    """
+    requested = job_settings(folder, shard_size, recursive, blur_threshold, max_distance)
+    queue = ShardQueue(job_dir)
+    try:
+        settings = queue.settings()
+        finished = bool(settings) and queue.finished()
+    finally:
+        queue.close()
+    if settings and restart:
+        remove_job(job_dir)
+        settings = {}
+    if not settings:
+        queue = ShardQueue(job_dir)
+        try:
+            queue.create(requested)
+        finally:
+            queue.close()
+    else:
+        changed = [key for key, value in requested.items() if settings.get(key) != value]
+        if changed:
+            differences = ", ".join(f"{key} is {settings.get(key)!r}, not {requested[key]!r}" for key in changed)
+            raise ValueError(f"{job_dir} holds a scan with different settings ({differences}); restart it to change them.")
+        if finished:
+            raise ValueError(f"The scan in {job_dir} has already finished; restart it to scan again.")
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(job_dir,), name=f"shard-worker-{number}")
+        for number in range(workers or os.cpu_count() or 1)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        wait_for_job(job_dir, processes)
+    finally:
+        for process in processes:
+            process.join()
+    return merge_results(job_dir)
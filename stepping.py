@@ -0,0 +1,94 @@
+"""Time-sliced, cancellable stepping for the cleanup models.
+
+A cleanup model's ``step()`` used to process every image in one call that
+could be neither watched nor interrupted.  ``SteppedModel`` splits a step over
+as many calls as the caller likes::
+
+    while model.running:
+        model.step(time_budget=0.25)   # or max_agents=500
+        print(f"{model.progress:.0%}")
+
+``step()`` without arguments still runs the whole step at once.  ``running``
+stays True until the step is finished or has been cancelled, so Mesa's
+``run_model()`` drives a model the same way.  ``cancel()`` may be called from
+any thread; the thread that steps the model notices it after the agent that
+is stepping now (or in its next call) and then clears ``running``.
+
+Models with a scan journal checkpoint the results of the agents that have
+already stepped every ``CHECKPOINT_INTERVAL`` seconds and on cancellation, so
+an incremental scan that is interrupted or restarted resumes where it left
+off instead of starting over.
+"""
+import time
+
+from metrics import get_metrics
+
+CHECKPOINT_INTERVAL = 10.0  # Seconds between checkpoints of a step in progress
+
+
+class SteppedModel:
+    """Mixin for models whose ``schedule`` is a ``parallel.SerialActivation``.
+
+    Subclasses implement ``begin_step()`` (work that must see every agent
+    before any of them steps, such as batched scoring), ``end_step()``
+    (collecting results) and ``checkpoint(agents)`` (persisting the results
+    of ``agents`` so a restarted scan can skip them).  Every call to
+    ``step()`` is timed as the ``stage`` metrics stage.
+    """
+
+    running = True
+    stage = "model"
+
+    def begin_step(self):
+        """Called before the first agent of a step."""
+
+    def end_step(self):
+        """Called once every agent of a step has stepped."""
+
+    def checkpoint(self, agents):
+        """Persist the results of ``agents``, which have stepped in the step in progress."""
+
+    @property
+    def progress(self):
+        """Fraction of the current step that is done (0.0 to 1.0)."""
+        return self.schedule.progress
+
+    @property
+    def cancelled(self):
+        return self.schedule.cancelled
+
+    def cancel(self):
+        """Stop the step in progress after the agent that is stepping now."""
+        self.schedule.cancel()
+
+    def step(self, max_agents=None, time_budget=None):
+        """Run one step, or the next part of it; returns True once the step is complete.
+
+        ``max_agents`` and ``time_budget`` (seconds) bound this call; see
+        ``SerialActivation.step``.
+        """
+        with get_metrics().timer(self.stage):
+            return self._step(max_agents, time_budget)
+
+    def _step(self, max_agents, time_budget):
+        if self.schedule.cancelled:
+            # Cancelled between calls; checkpointing again is harmless if it was noticed mid-step
+            if self.running and self.schedule.in_step:
+                self.checkpoint(self.schedule.stepped_agents())
+            self.schedule.close()
+            self.running = False
+            return False
+        if not self.schedule.in_step:
+            self.running = True
+            self._last_checkpoint = time.monotonic()
+            self.begin_step()
+        if self.schedule.step(max_agents, time_budget):
+            self.end_step()
+            self.running = False
+            return True
+        if self.schedule.cancelled or time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.checkpoint(self.schedule.stepped_agents())
+            self._last_checkpoint = time.monotonic()
+        if self.schedule.cancelled:
+            self.running = False
+        return False
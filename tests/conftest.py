@@ -0,0 +1,97 @@
+"""Shared fixtures: an isolated analysis cache and journal, small synthetic galleries and a face_recognition stand-in."""
+import json
+import os
+import shutil
+import sys
+import types
+
+import numpy as np
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Shared modules live in the project root; the simulation model imports its siblings from Mesa/
+sys.path[:0] = [ROOT, os.path.join(ROOT, "Mesa"), os.path.join(ROOT, "benchmarks")]
+
+GALLERY_COUNT = 40
+GALLERY_SIZE = (160, 120)
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Point the analysis cache and the scan journal at a fresh per-test location."""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_dir))
+    monkeypatch.setenv("SMART_CLEANUP_CACHE", str(cache_dir / "smart-image-cleanup" / "analysis.sqlite"))
+    monkeypatch.delenv("SMART_CLEANUP_FAST_DECODE", raising=False)
+    return cache_dir
+
+
+@pytest.fixture(scope="session")
+def gallery_source(tmp_path_factory):
+    from synthetic_gallery import generate_gallery
+
+    folder = tmp_path_factory.mktemp("gallery-source")
+    generate_gallery(str(folder), GALLERY_COUNT, seed=0, size=GALLERY_SIZE)
+    return folder
+
+
+@pytest.fixture
+def gallery(gallery_source, tmp_path):
+    """A private copy of the synthetic gallery (modification times kept) that a test may modify.
+
+    ``manifest.json`` is moved out of the folder so every file in it is an
+    image; the ground truth is available as ``gallery.manifest``.
+    """
+    folder = tmp_path / "gallery"
+    shutil.copytree(gallery_source, folder)
+    manifest_path = folder / "manifest.json"
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    manifest_path.unlink()
+    return Gallery(str(folder), manifest)
+
+
+class Gallery(str):
+    """Folder path of a synthetic gallery that also carries its manifest."""
+
+    def __new__(cls, folder, manifest):
+        gallery = super().__new__(cls, folder)
+        gallery.manifest = manifest
+        return gallery
+
+    def path(self, name):
+        return os.path.join(self, name)
+
+    def paths(self, names):
+        return sorted(self.path(name) for name in names)
+
+
+def _load_image_file(path):
+    return np.array(Image.open(path).convert("RGB"))
+
+
+def _face_locations(image, *args, **kwargs):
+    # The whole picture is one "face"
+    height, width = image.shape[:2]
+    return [(0, width, height, 0)]
+
+
+def _face_encodings(image, known_face_locations=None):
+    # Identical pictures get identical encodings, different ones (almost surely) do not
+    return [np.resize(image.reshape(-1, 3).mean(axis=0) / 255, 128)]
+
+
+@pytest.fixture
+def compare_face(monkeypatch):
+    """compare_face with a small stand-in for face_recognition, so no dlib models are needed."""
+    stand_in = types.ModuleType("face_recognition")
+    stand_in.load_image_file = _load_image_file
+    stand_in.face_locations = _face_locations
+    stand_in.face_encodings = _face_encodings
+    if "face_recognition" not in sys.modules:
+        monkeypatch.setitem(sys.modules, "face_recognition", stand_in)
+    import compare_face
+
+    monkeypatch.setattr(compare_face, "face_recognition", stand_in)
+    return compare_face
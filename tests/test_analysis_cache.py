@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from analysis import analyze_image
+from analysis_cache import AnalysisCache, get_default_cache
+from metrics import get_metrics
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "analysis.sqlite"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def image(gallery):
+    return gallery.path("img_0000000.jpg")
+
+
+def test_round_trip(cache, image):
+    cache.put(image, phash="ffff0000ffff0000", blur=12.5, width=160, height=120)
+    entry = cache.get(image)
+    assert entry["phash"] == "ffff0000ffff0000"
+    assert entry["blur"] == 12.5
+    assert (entry["width"], entry["height"]) == (160, 120)
+    assert cache.lookup(image, "blur") == 12.5
+
+
+def test_put_merges_fields(cache, image):
+    cache.put(image, phash="00")
+    cache.put(image, blur=3.0)
+    entry = cache.get(image)
+    assert entry["phash"] == "00" and entry["blur"] == 3.0
+
+
+def test_unknown_field_is_rejected(cache, image):
+    with pytest.raises(ValueError):
+        cache.put(image, sharpness=1.0)
+
+
+def test_modified_file_is_a_miss(cache, image):
+    cache.put(image, phash="00", blur=1.0)
+    st = os.stat(image)
+    os.utime(image, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cache.get(image) is None
+    # The stale row is dropped, not just skipped
+    os.utime(image, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert cache.get(image) is None
+
+
+def test_rewritten_file_is_a_miss(cache, image):
+    cache.put(image, phash="00")
+    with open(image, "ab") as f:
+        f.write(b"\0")
+    assert cache.get(image) is None
+
+
+def test_invalidate(cache, image):
+    cache.put(image, phash="00")
+    cache.invalidate(image)
+    assert cache.get(image) is None
+
+
+def test_prune_drops_deleted_and_modified_files(cache, gallery):
+    kept, deleted, modified = (gallery.path(f"img_000000{i}.jpg") for i in range(3))
+    for path in (kept, deleted, modified):
+        cache.put(path, phash="00")
+    os.remove(deleted)
+    with open(modified, "ab") as f:
+        f.write(b"\0")
+    assert cache.prune() == 2
+    assert len(cache) == 1
+    assert cache.get(kept) is not None
+
+
+def test_evict_keeps_the_most_recently_used(tmp_path, gallery):
+    cache = AnalysisCache(str(tmp_path / "small.sqlite"), max_entries=2)
+    paths = [gallery.path(f"img_000000{i}.jpg") for i in range(3)]
+    for path in paths[:2]:
+        cache.put(path, phash="00")
+    cache.commit()
+    cache.get(paths[0])  # Now more recently used than paths[1]
+    cache.put(paths[2], phash="00")
+    cache.evict()
+    assert len(cache) == 2
+    assert cache.get(paths[0]) is not None
+    assert cache.get(paths[1]) is None
+    cache.close()
+
+
+def test_face_encodings(cache, image):
+    import numpy as np
+
+    encodings = np.arange(256, dtype=np.float64).reshape(2, 128)
+    cache.put_faces(image, encodings)
+    assert np.array_equal(cache.get_faces(image), encodings)
+    cache.put_faces(image, [])
+    assert cache.get_faces(image).shape == (0, 128)
+
+
+def test_empty_cache_is_filled_and_reused(image):
+    cache = get_default_cache()
+    assert cache is not None and len(cache) == 0
+    metrics = get_metrics()
+    metrics.reset()
+    first = analyze_image(image)
+    assert len(cache) == 1
+    second = analyze_image(image)
+    assert metrics.snapshot()["counters"] == {"cache_misses": 1, "cache_hits": 1}
+    assert str(second.image_hash) == str(first.image_hash)
+    assert second.blur == first.blur
+
+
+def test_cache_can_be_disabled(image, monkeypatch):
+    monkeypatch.setenv("SMART_CLEANUP_CACHE", "off")
+    assert get_default_cache() is None
+    assert analyze_image(image).blur is not None
@@ -0,0 +1,20 @@
+import pytest
+
+from blur_metrics import DEFAULT_THRESHOLDS
+from lowQuality import ImageCleanupModel as BlurModel
+from model import SmartImageCleanupModel
+
+
+@pytest.mark.parametrize("metric", [None, "laplacian", "reblur", "fft"])
+def test_threshold_defaults_to_the_metric_threshold(gallery, metric):
+    expected = DEFAULT_THRESHOLDS[metric or "laplacian"]
+    assert BlurModel(gallery, metric=metric).threshold == expected
+    assert SmartImageCleanupModel(gallery, blur_metric=metric).blur_threshold == expected
+    assert BlurModel(gallery, 5, metric=metric).threshold == 5
+
+
+@pytest.mark.parametrize("metric", ["reblur", "fft"])
+def test_batched_metric_with_its_default_threshold_finds_the_blurred_files(gallery, metric):
+    model = BlurModel(gallery, delete_files=False, metric=metric)
+    model.step()
+    assert sorted(model.get_blurry_images()) == gallery.paths(gallery.manifest["blurred"])
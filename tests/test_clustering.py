@@ -0,0 +1,96 @@
+import itertools
+import os
+
+import pytest
+
+from analysis import ImageAnalysis
+from clustering import DuplicateClusters, keeper_rank
+from Duplicates import ImageCleanupModel, find_duplicates
+
+
+def analysis(path, width=100, height=100, blur=50.0, size=1000):
+    return ImageAnalysis(path, None, blur, width, height, size, None)
+
+
+def test_keeper_rank_order():
+    ranked = sorted([
+        keeper_rank("b.jpg", analysis("b.jpg")),
+        keeper_rank("a.jpg", analysis("a.jpg")),
+        keeper_rank("small.jpg", analysis("small.jpg", width=50)),
+        keeper_rank("soft.jpg", analysis("soft.jpg", blur=10.0)),
+        keeper_rank("big.jpg", analysis("big.jpg", size=5000)),
+        keeper_rank("unknown.jpg", analysis("unknown.jpg", blur=None)),
+    ])
+    # Resolution first, then sharpness, then file size, then the path
+    assert [rank[-1] for rank in ranked] == ["big.jpg", "a.jpg", "b.jpg", "soft.jpg", "unknown.jpg", "small.jpg"]
+
+
+def test_chained_near_duplicates_form_one_cluster():
+    # a-b and b-c are 1 bit apart, a-c 2 bits: all three are one cluster at distance 1
+    hashes = {"a": 0b000, "b": 0b001, "c": 0b011, "far": 0xFFFF0000}
+    ranks = {"a": (3,), "b": (1,), "c": (2,), "far": (0,)}
+    clusters = DuplicateClusters(max_distance=1)
+    for item in ("a", "c", "far", "b"):
+        clusters.add(hashes[item], item, ranks[item])
+    assert clusters.keeper("a") == clusters.keeper("c") == "b"
+    assert sorted(clusters.duplicates()) == ["a", "c"]
+    assert not clusters.is_duplicate("far")
+
+
+def test_keeper_does_not_depend_on_insertion_order():
+    hashes = {"a": 0b0000, "b": 0b0001, "c": 0b0011, "d": 0b0111}
+    ranks = {"a": (2,), "b": (4,), "c": (1,), "d": (3,)}
+    for order in itertools.permutations(hashes):
+        clusters = DuplicateClusters(max_distance=1)
+        for item in order:
+            clusters.add(hashes[item], item, ranks[item])
+        assert sorted(clusters.duplicates()) == ["a", "b", "d"], order
+
+
+def test_adding_a_better_copy_demotes_the_keeper():
+    clusters = DuplicateClusters()
+    assert clusters.add(0xABC, "worse", (2,)) == []
+    assert clusters.add(0xABC, "better", (1,)) == ["worse"]
+    assert clusters.keeper("worse") == "better"
+
+
+def planted_groups(manifest):
+    """Each original with its exact and near copies."""
+    groups = {}
+    for kind in ("exact_duplicates", "near_duplicates"):
+        for copy, original in manifest[kind].items():
+            groups.setdefault(original, {original}).add(copy)
+    return groups
+
+
+def test_find_duplicates_keeps_one_file_of_each_exact_duplicate(gallery):
+    duplicates = {os.path.basename(path) for path in find_duplicates(gallery)}
+    groups = planted_groups(gallery.manifest)
+    for original, group in groups.items():
+        exact = {original} | {copy for copy, source in gallery.manifest["exact_duplicates"].items() if source == original}
+        if len(exact) > 1:
+            # Identical files tie on everything but the path, so the smallest name is kept
+            assert exact - duplicates == {min(exact)}
+        assert group - duplicates, f"every copy of {original} was flagged"
+    # Nothing but planted copies is flagged (blurred copies can hash like their sharp source)
+    assert duplicates <= set().union(*groups.values(), gallery.manifest["blurred"])
+
+
+def test_model_matches_find_duplicates(gallery):
+    model = ImageCleanupModel(gallery)
+    model.step()
+    assert sorted(model.duplicates) == sorted(find_duplicates(gallery))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_files_that_cannot_be_hashed_are_skipped(gallery, workers):
+    corrupt, copy = gallery.path("corrupt.jpg"), gallery.path("corrupt_copy.jpg")
+    for path in (corrupt, copy):
+        with open(path, "wb") as f:
+            f.write(b"not a jpeg")
+    expected = find_duplicates(gallery)
+    # A byte-identical copy of an unreadable file is still a duplicate of it
+    assert corrupt not in expected and copy in expected
+    model = ImageCleanupModel(gallery, workers)
+    model.step()
+    assert sorted(model.duplicates) == sorted(expected)
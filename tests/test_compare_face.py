@@ -0,0 +1,15 @@
+from PIL import Image
+
+
+def test_corrupt_image_is_skipped(compare_face, gallery, tmp_path):
+    corrupt = gallery.path("corrupt.jpg")
+    with open(corrupt, "wb") as f:
+        f.write(b"not a jpeg")
+    original = next(iter(gallery.manifest["exact_duplicates"].values()))
+    copies = [copy for copy, source in gallery.manifest["exact_duplicates"].items() if source == original]
+    reference = str(tmp_path / "reference.png")
+    Image.open(gallery.path(original)).save(reference)
+
+    matches, summary = compare_face.match_faces(reference, gallery, str(tmp_path / "out"), tolerance=1e-6)
+    assert sorted(matches) == gallery.paths([original] + copies)
+    assert summary != "nothing exported"
@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import pytest
+
+from export import Exporter
+
+
+@pytest.fixture
+def sources(gallery, tmp_path):
+    """Two different images with the same file name in different folders."""
+    first, second = tmp_path / "a", tmp_path / "b"
+    first.mkdir()
+    second.mkdir()
+    shutil.copy2(gallery.path("img_0000000.jpg"), first / "photo.jpg")
+    shutil.copy2(gallery.path("img_0000001.jpg"), second / "photo.jpg")
+    return str(first / "photo.jpg"), str(second / "photo.jpg")
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("mode", ["auto", "hardlink", "symlink", "copy"])
+def test_same_name_from_different_folders_is_not_overwritten(sources, tmp_path, mode):
+    exporter = Exporter(str(tmp_path / "out"), mode)
+    first, second = (exporter.export(path) for path in sources)
+    assert os.path.basename(first) == "photo.jpg"
+    assert os.path.basename(second) == "photo (1).jpg"
+    assert read(first) == read(sources[0])
+    assert read(second) == read(sources[1])
+
+
+def test_exporting_twice_reuses_the_first_export(sources, tmp_path):
+    output = str(tmp_path / "out")
+    first = Exporter(output, "copy").export(sources[0])
+    # A later run recognises its own earlier export instead of adding a suffixed copy
+    assert Exporter(output, "copy").export(sources[0]) == first
+    assert os.listdir(output) == ["photo.jpg"]
+
+
+def test_existing_unrelated_file_is_kept(sources, tmp_path):
+    output = tmp_path / "out"
+    output.mkdir()
+    (output / "photo.jpg").write_bytes(b"not an export")
+    exported = Exporter(str(output), "copy").export(sources[0])
+    assert os.path.basename(exported) == "photo (1).jpg"
+    assert (output / "photo.jpg").read_bytes() == b"not an export"
+
+
+def test_copy_is_independent_of_the_source(sources, tmp_path):
+    exported = Exporter(str(tmp_path / "out"), "copy").export(sources[0])
+    assert not os.path.samefile(exported, sources[0])
+    assert os.stat(exported).st_mtime_ns == os.stat(sources[0]).st_mtime_ns
+
+
+def test_auto_never_uses_symlinks_and_counts_methods(sources, tmp_path):
+    exporter = Exporter(str(tmp_path / "out"))
+    for path in sources:
+        assert not os.path.islink(exporter.export(path))
+    assert sum(exporter.counts.values()) == 2
+    assert exporter.counts["symlink"] == 0
+    assert exporter.summary() != "nothing exported"
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        Exporter(str(tmp_path), "move")
@@ -0,0 +1,30 @@
+import numpy as np
+
+
+def closest_face_per_image(index, reference, tolerance):
+    """The per-row reference the vectorised query must agree with."""
+    distances = np.linalg.norm(index.encodings - np.asarray(reference, dtype=np.float32), axis=1)
+    best = {}
+    for row in np.argsort(distances, kind="stable"):
+        file_index = int(index.face_files[row])
+        if distances[row] <= tolerance and file_index not in best:
+            first = int(np.flatnonzero(index.face_files == file_index)[0])
+            best[file_index] = (index.paths[file_index], float(distances[row]), tuple(int(v) for v in index.boxes[row]), int(row) - first)
+    return list(best.values())
+
+
+def test_query_returns_the_closest_face_of_each_image(compare_face, tmp_path):
+    from face_index import ENCODING_SIZE, FaceIndex
+
+    rng = np.random.default_rng(0)
+    faces_per_file = rng.integers(0, 4, size=50)
+    index = FaceIndex(str(tmp_path / "faces.npz"))
+    index.paths = [f"image_{i}.jpg" for i in range(len(faces_per_file))]
+    index.face_files = np.repeat(np.arange(len(faces_per_file), dtype=np.int32), faces_per_file)
+    index.encodings = rng.normal(scale=0.05, size=(len(index.face_files), ENCODING_SIZE)).astype(np.float32)
+    index.boxes = rng.integers(0, 500, size=(len(index.face_files), 4)).astype(np.int32)
+
+    reference = np.zeros(ENCODING_SIZE)
+    for tolerance in (0.0, 0.55, 0.6, 10.0):
+        assert index.query(reference, tolerance) == closest_face_per_image(index, reference, tolerance)
+    assert len(index.query(reference, 10.0)) == np.count_nonzero(faces_per_file)
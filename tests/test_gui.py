@@ -0,0 +1,63 @@
+import sys
+import types
+
+import pytest
+
+from model import SmartImageCleanupModel
+
+
+class Flag:
+    def __init__(self, value=False):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+@pytest.fixture
+def gui_class(monkeypatch):
+    """The Mesa GUI class; no widgets are built, so customtkinter may be a stand-in."""
+    if "customtkinter" not in sys.modules:
+        try:
+            import customtkinter  # noqa: F401
+        except ImportError:
+            stand_in = types.ModuleType("customtkinter")
+            stand_in.CTkFrame = object
+            monkeypatch.setitem(sys.modules, "customtkinter", stand_in)
+    import gui
+
+    return gui.SmartImageCleanupGUI
+
+
+def run(gui):
+    emitted = []
+    gui.prepare_model()
+    gui.run_cleanup(emitted.append)
+    return emitted
+
+
+@pytest.mark.parametrize("stepped_before", [False, True])
+def test_cleanup_can_run_twice(gui_class, gallery, stepped_before):
+    gui = gui_class.__new__(gui_class)
+    gui.incremental_var = Flag()
+    gui.model = SmartImageCleanupModel(gallery)
+    if stepped_before:
+        gui.model.step()  # As main.py does before opening the GUI
+    images = len(gui.model.schedule.agents)
+
+    for _ in range(2):
+        emitted = run(gui)
+        assert {item[0] for item in emitted} == set(range(images))
+        assert not gui.model.running and not gui.model.cancelled
+
+
+def test_cancelled_cleanup_is_rebuilt(gui_class, gallery):
+    gui = gui_class.__new__(gui_class)
+    gui.incremental_var = Flag(True)
+    gui.model = SmartImageCleanupModel(gallery, incremental=True)
+    gui.model.step(max_agents=10)
+    gui.model.cancel()
+    cancelled = gui.model
+    run(gui)
+    assert gui.model is not cancelled
+    assert not gui.model.running and not gui.model.cancelled
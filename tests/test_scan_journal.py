@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+
+from agent_store import RESTORED
+from Duplicates import ImageCleanupModel as DuplicatesModel
+from lowQuality import ImageCleanupModel as BlurModel
+from model import SmartImageCleanupModel
+from scan_journal import BLURRED, DUPLICATE, ScanJournal
+
+
+def test_record_and_unchanged(gallery, tmp_path):
+    journal = ScanJournal(gallery, "test", str(tmp_path / "journal.sqlite"))
+    path = gallery.path("img_0000000.jpg")
+    journal.record(path, "00ff", DUPLICATE | BLURRED)
+    entry = journal.unchanged(path, os.stat(path))
+    assert entry.phash == "00ff" and entry.verdict == DUPLICATE | BLURRED
+
+    with open(path, "ab") as f:
+        f.write(b"\0")
+    assert journal.unchanged(path, os.stat(path)) is None
+    assert journal.get(path) is not None
+
+
+def test_jobs_and_folders_are_separate(gallery, tmp_path):
+    db = str(tmp_path / "journal.sqlite")
+    path = gallery.path("img_0000000.jpg")
+    ScanJournal(gallery, "a", db).record(path, verdict=BLURRED)
+    journal = ScanJournal(gallery, "b", db)
+    assert journal.get(path) is None
+    assert ScanJournal(str(tmp_path), "a", db).get(path) is None
+
+
+def test_forget_missing(gallery, tmp_path):
+    journal = ScanJournal(gallery, "test", str(tmp_path / "journal.sqlite"))
+    kept, gone = gallery.path("img_0000000.jpg"), gallery.path("img_0000001.jpg")
+    journal.record(kept)
+    journal.record(gone)
+    assert journal.forget_missing([kept]) == 1
+    assert journal.get(gone) is None and journal.get(kept) is not None
+
+
+def test_incremental_duplicates_restore_verdicts(gallery):
+    first = DuplicatesModel(gallery, incremental=True)
+    first.step()
+    second = DuplicatesModel(gallery, incremental=True)
+    assert all(agent.restored for agent in second.schedule.agents)
+    second.step()
+    assert sorted(second.duplicates) == sorted(first.duplicates)
+
+
+def test_incremental_duplicates_compare_new_files_with_restored_ones(gallery):
+    DuplicatesModel(gallery, incremental=True).step()
+    original = gallery.path("img_0000005.jpg")
+    with open(original, "rb") as f:
+        data = f.read()
+    copy = gallery.path("zz_copy.jpg")
+    with open(copy, "wb") as f:
+        f.write(data)
+    model = DuplicatesModel(gallery, incremental=True)
+    model.step()
+    assert copy in model.duplicates
+
+
+def test_blur_dry_run_then_delete(gallery):
+    blurred = gallery.paths(gallery.manifest["blurred"])
+    dry_run = BlurModel(gallery, incremental=True, delete_files=False)
+    dry_run.step()
+    assert sorted(dry_run.get_blurry_images()) == blurred
+    assert all(os.path.exists(path) for path in blurred)
+
+    # The verdicts recorded by the dry run are acted on, and only deleted files are reported
+    model = BlurModel(gallery, incremental=True)
+    model.step()
+    assert sorted(model.get_blurry_images()) == blurred
+    assert not any(os.path.exists(path) for path in blurred)
+
+    again = BlurModel(gallery, incremental=True)
+    again.step()
+    assert again.get_blurry_images() == []
+
+
+def verdicts(model):
+    return {path: int(flags) for path, flags in zip(model.store.paths, model.store.verdicts())}
+
+
+def test_cancelled_scan_resumes_from_the_journal(gallery):
+    full = SmartImageCleanupModel(gallery)
+    full.step()
+
+    interrupted = SmartImageCleanupModel(gallery, incremental=True)
+    interrupted.step(max_agents=15)
+    interrupted.cancel()
+    interrupted.step()  # Records what was analysed before the cancel
+    assert interrupted.cancelled and not interrupted.running
+
+    resumed = SmartImageCleanupModel(gallery, incremental=True)
+    assert np.count_nonzero(resumed.store.column("flags") & RESTORED) == 15
+    resumed.step()
+    assert verdicts(resumed) == verdicts(full)
+
+
+def test_changed_file_is_analysed_again(gallery):
+    SmartImageCleanupModel(gallery, incremental=True).step()
+    path = gallery.path("img_0000003.jpg")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    model = SmartImageCleanupModel(gallery, incremental=True)
+    restored = model.store.column("flags") & RESTORED
+    assert [model.store.paths[i] for i in np.flatnonzero(restored == 0)] == [path]
+
+
+def test_verdicts_of_another_blur_threshold_are_not_reused(gallery):
+    SmartImageCleanupModel(gallery, incremental=True).step()
+    model = SmartImageCleanupModel(gallery, incremental=True, blur_threshold=5000)
+    assert not np.any(model.store.column("flags") & RESTORED)
+    model.step()
+    assert all(model.store.verdicts() & BLURRED)
@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+
+import sharding
+from Duplicates import find_duplicates
+from metrics import get_metrics
+
+
+@pytest.fixture
+def job_dir(tmp_path):
+    return str(tmp_path / "job")
+
+
+def test_sharded_scan_matches_a_single_scan(gallery, job_dir):
+    scan = sharding.run_sharded_scan(gallery, job_dir, workers=2, shard_size=7)
+    assert scan.images == len(os.listdir(gallery))
+    assert sorted(scan.duplicates) == sorted(find_duplicates(gallery))
+    assert sorted(scan.blurred) == gallery.paths(gallery.manifest["blurred"])
+    assert scan.errors == []
+
+
+def test_workers_share_the_shards(gallery, job_dir):
+    shards = sharding.create_job(gallery, job_dir, shard_size=5)
+    assert shards == 8
+    queue = sharding.ShardQueue(job_dir)
+    first, second = queue.claim("one"), queue.claim("two")
+    assert first != second
+    # A claim cannot be completed by anyone else
+    assert not queue.complete(first, "two")
+    queue.release(first, "one")
+    assert queue.progress() == {"pending": 7, "claimed": 1, "done": 0}
+    queue.close()
+
+
+def test_abandoned_claim_is_taken_over(gallery, job_dir, monkeypatch):
+    monkeypatch.setattr(sharding, "POLL_INTERVAL", 0.05)
+    sharding.create_job(gallery, job_dir, shard_size=10)
+    queue = sharding.ShardQueue(job_dir)
+    lost = queue.claim("dead-node")
+    queue.close()
+    assert sharding.run_worker(job_dir, "live", claim_timeout=0.2) == 4
+    queue = sharding.ShardQueue(job_dir)
+    assert queue.finished()
+    assert not queue.heartbeat(lost, "dead-node")
+    queue.close()
+
+
+def test_failed_files_are_reported_not_flagged(gallery, job_dir):
+    corrupt = gallery.path("corrupt.jpg")
+    with open(corrupt, "wb") as f:
+        f.write(b"not a jpeg")
+    scan = sharding.run_sharded_scan(gallery, job_dir, workers=1, shard_size=16)
+    assert [path for path, _ in scan.errors] == [corrupt]
+    assert corrupt not in scan.duplicates and corrupt not in scan.blurred
+
+
+def test_merge_refuses_an_unfinished_job(gallery, job_dir):
+    sharding.create_job(gallery, job_dir)
+    with pytest.raises(RuntimeError):
+        sharding.merge_results(job_dir)
+
+
+def test_changed_settings_are_refused(gallery, job_dir):
+    sharding.create_job(gallery, job_dir, shard_size=10)
+    with pytest.raises(ValueError, match="blur_threshold"):
+        sharding.run_sharded_scan(gallery, job_dir, workers=1, shard_size=10, blur_threshold=5000)
+    with pytest.raises(ValueError, match="folder"):
+        sharding.run_sharded_scan(os.path.dirname(gallery), job_dir, workers=1, shard_size=10)
+
+
+def test_finished_job_must_be_restarted(gallery, job_dir):
+    sharding.run_sharded_scan(gallery, job_dir, workers=1, shard_size=20)
+    with pytest.raises(ValueError, match="finished"):
+        sharding.run_sharded_scan(gallery, job_dir, workers=1, shard_size=20)
+    scan = sharding.run_sharded_scan(gallery, job_dir, workers=1, shard_size=20, blur_threshold=5000, restart=True)
+    assert len(scan.blurred) == scan.images
+
+
+def test_worker_metrics_reach_the_coordinator(gallery, job_dir):
+    metrics = get_metrics()
+    metrics.reset()
+    sharding.run_sharded_scan(gallery, job_dir, workers=2, shard_size=10)
+    stages = metrics.snapshot()["stages"]
+    images = len(os.listdir(gallery))
+    for stage in ("decode", "hash", "blur"):
+        assert stages[stage]["count"] == images
+    with open(os.path.join(job_dir, "results", "shard-000000.metrics.json")) as f:
+        assert json.loads(f.readline())["stages"]["decode"]["count"] == 10